@@ -0,0 +1,100 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from rest_framework import exceptions
+
+
+class AsyncAPIViewMixin:
+    """
+    Mixin letting a DRF view or viewset implement handlers as coroutines.
+
+    DRF dispatches requests synchronously, so this mixin replaces the dispatch with
+    a coroutine. Under ASGI an async handler then waits for the database with the
+    async ORM instead of holding a worker thread, and slow clients cost no thread
+    at all. Under WSGI Django runs the view with async_to_sync, so the view works
+    in both serving modes.
+
+    Handlers may be mixed: sync handlers of a viewset (e.g. create and update) keep
+    working and are run in a thread with sync_to_async. Authenticators providing an
+    aauthenticate() coroutine are awaited; other authenticators run in a thread too.
+    Mix it in before the DRF base class.
+    """
+
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        # Unlike APIView.as_view(), ViewSet.as_view() does not mark its view as async.
+        if not iscoroutinefunction(view):
+            markcoroutinefunction(view)
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Async version of APIView.dispatch().
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """
+        Async version of APIView.initial(), awaiting the authentication.
+        """
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        """
+        Authenticate the request, setting request.user and request.auth.
+
+        Mirrors Request._authenticate(), which would query the database from the
+        event loop if request.user was accessed first.
+
+        Args:
+            request (Request): The current request.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
@@ -0,0 +1,210 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection, transaction
+
+VERSION_KEY_PREFIX = "model-version"
+_MISSING = object()
+
+_stats_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def _version_key(model):
+    return f"{VERSION_KEY_PREFIX}:{model._meta.label_lower}"
+
+
+def get_model_versions(models):
+    """
+    Return the current cache versions of the given models.
+
+    A model that has no version yet gets one based on the current time, so a
+    version is never reused after the cache was cleared.
+
+    Args:
+        models (iterable): Model classes.
+
+    Returns:
+        list: The versions, in the order of the models.
+    """
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, timeout=None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+async def aget_model_versions(models):
+    """
+    Async version of get_model_versions().
+    """
+    keys = [_version_key(model) for model in models]
+    versions = await cache.aget_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            await cache.aadd(key, version, timeout=None)
+        versions.update(await cache.aget_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def bump_model_versions(*models):
+    """
+    Invalidate every cached value that depends on one of the given models.
+
+    The values are not deleted; their keys contain the model versions, so bumping
+    a version makes them unreachable and they expire on their own.
+
+    Args:
+        *models: Model classes whose data changed.
+    """
+    for model in models:
+        key = _version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_model_versions_on_commit(*models):
+    """
+    Bump the versions of the given models now and again when the current transaction commits.
+
+    The second bump drops values that a concurrent request cached from the
+    not yet committed state.
+
+    Args:
+        *models: Model classes whose data changed.
+    """
+    bump_model_versions(*models)
+    transaction.on_commit(lambda: bump_model_versions(*models))
+
+
+def invalidate_model_cache(sender, **kwargs):
+    """
+    Signal receiver to invalidate the cached values that depend on the sender model.
+
+    Connect it to the post_save and post_delete signals of every model whose data
+    is cached with cached_value. Bulk writes do not send signals and have to call
+    bump_model_versions_on_commit explicitly.
+
+    Args:
+        sender: The model class.
+        **kwargs: Additional keyword arguments.
+    """
+    bump_model_versions_on_commit(sender)
+
+
+def _cached_value_key(name, key_parts, versions):
+    parts = ":".join([*map(str, key_parts), *map(str, versions)])
+    return f"cached:{name}:{hashlib.md5(parts.encode()).hexdigest()}"
+
+
+def _count_lookup(name, value):
+    with _stats_lock:
+        (_misses if value is _MISSING else _hits)[name] += 1
+
+
+def _in_atomic_block():
+    return connection.in_atomic_block
+
+
+def cached_value(name, compute, models=(), key_parts=(), timeout=None):
+    """
+    Return a value from the cache, computing and storing it on a miss (cache-aside).
+
+    Values computed inside a transaction are not stored, because they may contain
+    writes that are rolled back later.
+
+    Args:
+        name (str): The name of the cached value; hits and misses are counted per name.
+        compute (callable): Computes the value on a miss. None is cached too.
+        models (iterable): Model classes the value depends on.
+        key_parts (iterable): Extra parts of the key, e.g. request parameters. They are
+            hashed, so they may be of any length and contain any characters.
+        timeout (int): The timeout in seconds, or None for the default timeout.
+
+    Returns:
+        The cached or freshly computed value.
+    """
+    versions = get_model_versions(models) if models else []
+    key = _cached_value_key(name, key_parts, versions)
+
+    value = cache.get(key, _MISSING)
+    _count_lookup(name, value)
+    if value is _MISSING:
+        value = compute()
+        if connection.in_atomic_block:
+            return value
+        if timeout is None:
+            cache.set(key, value)
+        else:
+            cache.set(key, value, timeout)
+    return value
+
+
+async def acached_value(name, compute, models=(), key_parts=(), timeout=None):
+    """
+    Async version of cached_value(), for async views.
+
+    It shares the keys of cached_value(), so sync and async views reading the same
+    value share its cache entry.
+
+    Args:
+        name (str): The name of the cached value; hits and misses are counted per name.
+        compute (callable): Coroutine function computing the value on a miss.
+        models (iterable): Model classes the value depends on.
+        key_parts (iterable): Extra parts of the key.
+        timeout (int): The timeout in seconds, or None for the default timeout.
+
+    Returns:
+        The cached or freshly computed value.
+    """
+    versions = await aget_model_versions(models) if models else []
+    key = _cached_value_key(name, key_parts, versions)
+
+    value = await cache.aget(key, _MISSING)
+    _count_lookup(name, value)
+    if value is _MISSING:
+        value = await compute()
+        # The async ORM runs the queries in a thread, whose connection holds the transaction.
+        if await sync_to_async(_in_atomic_block)():
+            return value
+        if timeout is None:
+            await cache.aset(key, value)
+        else:
+            await cache.aset(key, value, timeout)
+    return value
+
+
+def get_cache_stats():
+    """
+    Return the hit and miss counters of this process, in total and per cached value name.
+
+    Returns:
+        dict: The counters.
+    """
+    with _stats_lock:
+        names = sorted(set(_hits) | set(_misses))
+        return {
+            "hits": sum(_hits.values()),
+            "misses": sum(_misses.values()),
+            "values": {name: {"hits": _hits[name], "misses": _misses[name]} for name in names},
+        }
+
+
+def reset_cache_stats():
+    """
+    Reset the hit and miss counters of this process.
+    """
+    with _stats_lock:
+        _hits.clear()
+        _misses.clear()
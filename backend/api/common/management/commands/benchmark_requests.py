@@ -0,0 +1,171 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.models import CustomUser
+
+DEFAULT_PATH = "/api/product/?page_size=20"
+WARMUP_REQUESTS = 10
+
+
+@contextmanager
+def fresh_connections(alias=DEFAULT_DB_ALIAS):
+    """
+    Make every request open a new database connection, as without CONN_MAX_AGE and pooling.
+
+    The threads share the settings of the connection, so changing them affects
+    every connection opened in the block.
+    """
+    settings_dict = connections[alias].settings_dict
+    saved = settings_dict["CONN_MAX_AGE"], dict(settings_dict["OPTIONS"])
+    connections.close_all()
+    settings_dict["CONN_MAX_AGE"] = 0
+    settings_dict["OPTIONS"].pop("pool", None)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"] = saved
+
+
+def describe_connections(alias=DEFAULT_DB_ALIAS):
+    """
+    Return a short description of how the connections of a database are reused.
+    """
+    settings_dict = connections[alias].settings_dict
+    pool = settings_dict["OPTIONS"].get("pool")
+    if pool:
+        max_size = pool.get("max_size") if isinstance(pool, dict) else None
+        return f"pool (max_size={max_size or 'default'})"
+    if settings_dict["CONN_MAX_AGE"]:
+        return f"persistent (CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']})"
+    return "new connection per request"
+
+
+class Command(BaseCommand):
+    """
+    Management command to measure the throughput of an API endpoint with and without connection reuse.
+
+    The requests run in-process through the full middleware and view stack with
+    a real JWT, so the numbers include authentication and every query, but no
+    network or HTTP server. Each endpoint is requested first with a new database
+    connection per request, then with the configured connection handling
+    (DB_CONNECTION_MODE), and the requests per second of both rounds are reported.
+    """
+
+    help = "Measure the requests per second of an endpoint with a new connection per request and with the configured connection reuse."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            required=True,
+            help="The user whose token authenticates the requests.",
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help=f"The path to request, repeatable. Defaults to {DEFAULT_PATH}.",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=500,
+            help="Number of measured requests per path and round.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="Number of threads sending the requests, each with its own connection.",
+        )
+        parser.add_argument(
+            "--host",
+            default=None,
+            help="The Host header, defaults to the first allowed host.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["threads"] < 1:
+            raise CommandError("--requests and --threads must be at least 1.")
+        try:
+            user = CustomUser.objects.get(username=options["username"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        host = options["host"] or next((host for host in settings.ALLOWED_HOSTS if host not in ("", "*")), "localhost")
+        headers = {
+            "HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(user).access_token}",
+            "HTTP_HOST": host,
+        }
+
+        for path in options["paths"] or [DEFAULT_PATH]:
+            self.stdout.write(f"GET {path}: {options['requests']} requests on {options['threads']} threads")
+            with fresh_connections():
+                baseline = self.run_round(path, headers, options["requests"], options["threads"])
+            self.report("new connection per request", baseline, options["requests"])
+            configured = self.run_round(path, headers, options["requests"], options["threads"])
+            self.report(describe_connections(), configured, options["requests"])
+            self.stdout.write(self.style.SUCCESS(f"  speed-up: {baseline / configured:.2f}x"))
+
+    def run_round(self, path, headers, count, threads):
+        """
+        Send the requests of one round and return the seconds they took.
+
+        Args:
+            path (str): The requested path.
+            headers (dict): The WSGI headers of the requests.
+            count (int): The number of measured requests.
+            threads (int): The number of sending threads.
+
+        Returns:
+            float: The wall-clock time of the measured requests.
+        """
+        self.send(path, headers, min(WARMUP_REQUESTS, count))
+
+        shares = [count // threads + (1 if number < count % threads else 0) for number in range(threads)]
+        errors = []
+        workers = [threading.Thread(target=self.send, args=(path, headers, share, errors)) for share in shares]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        if errors:
+            raise CommandError(errors[0])
+        return elapsed
+
+    @staticmethod
+    def send(path, headers, count, errors=None):
+        """
+        Send requests from the current thread and close its connections afterwards.
+
+        The test client disconnects close_old_connections() from the request signals,
+        so it is called around every request here, as the request handler of a server
+        would, to close or keep the connections according to CONN_MAX_AGE.
+        """
+        client = Client(**headers)
+        try:
+            for _ in range(count):
+                close_old_connections()
+                response = client.get(path)
+                close_old_connections()
+                if response.status_code != 200:
+                    message = f"GET {path} returned {response.status_code}."
+                    if errors is None:
+                        raise CommandError(message)
+                    errors.append(message)
+                    return
+        finally:
+            connections.close_all()
+
+    def report(self, label, elapsed, count):
+        self.stdout.write(f"  {label}: {count / elapsed:.1f} req/s ({elapsed * 1000 / count:.2f} ms/request)")
@@ -1,18 +1,330 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+EXACT_COUNT_THRESHOLD = 1000
+
+
+def estimate_count(queryset):
+    """
+    Estimate the number of rows of a queryset without counting them.
+
+    On PostgreSQL the row estimate of the query planner is used, which costs a
+    planning step instead of a scan. Small estimates are replaced by an exact count,
+    because the planner is least accurate where an exact count is cheap anyway.
+    Other databases always get an exact count.
+
+    Args:
+        queryset (QuerySet): The queryset to count.
+
+    Returns:
+        int: The (estimated) number of rows.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    """
+    Django paginator that estimates the total number of objects instead of counting them.
+    """
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination ordered on a creation timestamp and the primary key.
+
+    Instead of skipping rows with OFFSET, every page continues after the last row
+    of the previous one, so deep pages cost the same as the first one. The position
+    is passed around as an opaque cursor. Pages are ordered newest first, unless
+    the queryset is ordered by the timestamp ascending. An ordering filter may
+    only request these two orders; any other ordering is rejected, because the
+    cursor could not continue it. No total count is returned unless requested
+    with the count query parameter ("exact" or "estimate").
+
+    Attributes:
+        ordering (tuple): The timestamp field and the unique tie-breaker field.
+        page_size (int): The default number of items to include on a page.
+        page_size_query_param (str): The query parameter name for specifying the page size.
+        max_page_size (int): The maximum allowable page size when specified by a client.
+        cursor_query_param (str): The query parameter name of the cursor.
+        count_query_param (str): The query parameter name of the count mode.
+    """
+
+    ordering = ("date_created", "id")
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.start(queryset, request, view)
+
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == "exact":
+            self.count = queryset.count()
+        elif count_mode == "estimate":
+            self.count = estimate_count(queryset)
+
+        return self.finish(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async version of paginate_queryset(), for async views.
+        """
+        self.start(queryset, request, view)
+
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == "exact":
+            self.count = await queryset.acount()
+        elif count_mode == "estimate":
+            self.count = await sync_to_async(estimate_count)(queryset)
+
+        return self.finish([instance async for instance in self.page_queryset(queryset, request)])
+
+    def start(self, queryset, request, view):
+        """
+        Read the pagination settings of the request and view.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, "keyset_ordering", self.ordering)
+        self.check_requested_ordering(request, view)
+
+        order_by = queryset.query.order_by
+        self.ascending = bool(order_by) and order_by[0] == self.ordering[0]
+        self.count = None
+
+    def check_requested_ordering(self, request, view):
+        """
+        Reject an ordering requested through an ordering filter of the view that is not the keyset ordering.
+
+        Args:
+            request (Request): The current request.
+            view (APIView): The paginated view.
+
+        Raises:
+            ValidationError: If the ordering is neither the keyset fields ascending nor descending.
+        """
+        backend = next(
+            (backend for backend in getattr(view, "filter_backends", ()) if issubclass(backend, OrderingFilter)),
+            None,
+        )
+        requested = request.query_params.get(backend.ordering_param) if backend else None
+        if not requested:
+            return
+
+        terms = [term.strip() for term in requested.split(",") if term.strip()]
+        field, tie_breaker = self.ordering
+        for prefix in ("", "-"):
+            if terms == [f"{prefix}{field}", f"{prefix}{tie_breaker}"][:len(terms)]:
+                return
+        raise ValidationError({
+            backend.ordering_param: [
+                f"Keyset pagination only supports ordering by {field} or -{field}."
+            ]
+        })
+
+    def page_queryset(self, queryset, request):
+        """
+        Return the (unevaluated) queryset of the requested page, with one extra row.
+        """
+        field, tie_breaker = self.ordering
+        self.position, self.reverse = self.decode_cursor(request)
+        # Walking backwards is walking forwards in the opposite direction.
+        ascending = self.ascending != self.reverse
+        if self.position is not None:
+            lookup = "gt" if ascending else "lt"
+            beyond = Q(**{f"{field}__{lookup}": self.position[0]})
+            tied = Q(**{field: self.position[0], f"{tie_breaker}__{lookup}": self.position[1]})
+            queryset = queryset.filter(beyond | tied)
+        prefix = "" if ascending else "-"
+        queryset = queryset.order_by(f"{prefix}{field}", f"{prefix}{tie_breaker}")
+        return queryset[:self.page_size + 1]
+
+    def finish(self, results):
+        """
+        Trim the extra row of the fetched page and determine its neighbours.
+        """
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        """
+        Decode the cursor of the request.
+
+        Args:
+            request (Request): The current request.
+
+        Returns:
+            tuple: The (timestamp, id) position or None, and whether to walk backwards.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            position = (datetime.fromisoformat(data["p"][0]), int(data["p"][1]))
+            return position, bool(data.get("r"))
+        except (TypeError, ValueError, KeyError, IndexError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        """
+        Return the URL of the page after (or before, if reverse) the given instance.
+        """
+        field, tie_breaker = self.ordering
+        data = {"p": [getattr(instance, field).isoformat(), getattr(instance, tie_breaker)]}
+        if reverse:
+            data["r"] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response(response)
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     """
     Custom pagination class that extends Django REST Framework's PageNumberPagination.
 
-    This class provides customized pagination settings for API responses.
+    This class provides customized pagination settings for API responses. Views that
+    define a keyset_ordering attribute can be switched to KeysetPagination with
+    ?pagination=keyset, and ?count=estimate replaces the exact COUNT(*) by an estimate.
 
     Attributes:
         page_size (int): The default number of items to include on a page.
         page_size_query_param (str): The query parameter name for specifying the page size.
         max_page_size (int): The maximum allowable page size when specified by a client.
+        pagination_query_param (str): The query parameter name for switching the pagination mode.
+        count_query_param (str): The query parameter name of the count mode.
     """
 
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 1000
+    pagination_query_param = "pagination"
+    count_query_param = "count"
+
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.uses_keyset(request, view):
+            self.keyset_paginator = KeysetPagination()
+            return self.keyset_paginator.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async version of paginate_queryset(), for async views.
+
+        The count is awaited before the page, so the Django paginator slices the
+        queryset without querying and the page is fetched with the async ORM.
+        """
+        if self.uses_keyset(request, view):
+            self.keyset_paginator = KeysetPagination()
+            return await self.keyset_paginator.apaginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        if request.query_params.get(self.count_query_param) == "estimate":
+            paginator.count = await sync_to_async(estimate_count)(queryset)
+        else:
+            paginator.count = await queryset.acount()
+
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [instance async for instance in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        return list(self.page)
+
+    def uses_keyset(self, request, view):
+        """
+        Return whether the request asks for keyset pagination and the view supports it.
+        """
+        requested = request.query_params.get(self.pagination_query_param) == "keyset"
+        return requested and bool(getattr(view, "keyset_ordering", None))
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
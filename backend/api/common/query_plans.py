@@ -0,0 +1,114 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+SUPPORTED_VENDORS = ("postgresql", "sqlite")
+
+
+def explain(queryset):
+    """
+    Return the query plan of a queryset as text.
+
+    On PostgreSQL sequential scans are disabled for the EXPLAIN, so the planner
+    only falls back to one when no index can answer the query at all. Without
+    that, small test tables would always be scanned sequentially.
+
+    Args:
+        queryset (QuerySet): The queryset to explain.
+
+    Returns:
+        str: The plan, one node per line.
+
+    Raises:
+        NotImplementedError: If the database is neither PostgreSQL nor SQLite.
+    """
+    sql, params = queryset.query.sql_with_params()
+    return explain_sql(sql, params, queryset.db)
+
+
+def explain_sql(sql, params=None, using=DEFAULT_DB_ALIAS):
+    """
+    Return the query plan of an SQL statement as text, like explain().
+
+    Args:
+        sql (str): The statement.
+        params (tuple): Its parameters, or None for a statement with the values inlined.
+        using (str): The database alias.
+
+    Returns:
+        str: The plan, one node per line.
+
+    Raises:
+        NotImplementedError: If the database is neither PostgreSQL nor SQLite.
+    """
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return "\n".join(row[-1] for row in cursor.fetchall())
+    raise NotImplementedError(f"Query plans are not supported on {connection.vendor}.")
+
+
+def _scanned_tables(plan, sql, vendor, models):
+    scanned = []
+    for model in models:
+        table = model._meta.db_table
+        aliases = re.findall(rf'"{re.escape(table)}"\s+(?:AS\s+)?"?(\w+)"?', sql)
+        names = "|".join(re.escape(name) for name in [table, *aliases])
+        if vendor == "postgresql":
+            pattern = rf"Seq Scan on (?:{names})\b"
+        else:
+            pattern = rf"\bSCAN (?:{names})\b(?!.*\bINDEX\b)"
+        if re.search(pattern, plan, re.MULTILINE):
+            scanned.append(table)
+    return scanned
+
+
+def sequential_scans(queryset, models):
+    """
+    Return the tables of the given models that a queryset reads with a full table scan.
+
+    Subqueries are included, also where the plan refers to a table by its alias.
+    Full scans of an index, which SQLite uses to return rows in index order,
+    do not count.
+
+    Args:
+        queryset (QuerySet): The queryset to check.
+        models (iterable): The model classes whose tables must not be scanned.
+
+    Returns:
+        list: The names of the scanned tables.
+    """
+    return _scanned_tables(explain(queryset), str(queryset.query), connections[queryset.db].vendor, models)
+
+
+def captured_sequential_scans(captured_queries, models, using=DEFAULT_DB_ALIAS):
+    """
+    Return the full table scans of the given models in the queries a view actually ran.
+
+    Pass the captured_queries of a CaptureQueriesContext. Only the SELECT statements
+    reading one of the tables are explained.
+
+    Args:
+        captured_queries (list): The captured queries, dictionaries with their "sql".
+        models (iterable): The model classes whose tables must not be scanned.
+        using (str): The database alias the queries ran on.
+
+    Returns:
+        list: (sql, table) pairs of the statements scanning a table.
+    """
+    models = list(models)
+    tables = [f'"{model._meta.db_table}"' for model in models]
+    vendor = connections[using].vendor
+    scans = []
+    for query in captured_queries:
+        sql = query["sql"]
+        if not sql.lstrip().upper().startswith("SELECT") or not any(table in sql for table in tables):
+            continue
+        scans.extend((sql, table) for table in _scanned_tables(explain_sql(sql, None, using), sql, vendor, models))
+    return scans
@@ -0,0 +1,55 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+STREAM_BATCH_SIZE = 500
+
+
+async def aiter_in_thread(iterable, batch_size=STREAM_BATCH_SIZE):
+    """
+    Iterate a synchronous iterable from async code, in batches pulled through sync_to_async.
+
+    The iterable runs in the thread of the other sync_to_async calls of the request,
+    so database cursors it holds stay on the same connection. Pulling a batch at a
+    time keeps the cost of switching threads away from every single item.
+
+    Args:
+        iterable (iterable): The synchronous iterable, e.g. a generator reading the database.
+        batch_size (int): The number of items pulled per switch to the thread.
+
+    Yields:
+        The items of the iterable.
+    """
+    iterator = iter(iterable)
+    next_batch = sync_to_async(lambda: list(islice(iterator, batch_size)))
+    try:
+        while batch := await next_batch():
+            for item in batch:
+                yield item
+    finally:
+        if hasattr(iterator, "close"):
+            await sync_to_async(iterator.close)()
+
+
+def streaming_response(request, streaming_content, **kwargs):
+    """
+    Return a StreamingHttpResponse that streams with the serving mode of the request.
+
+    Django consumes a synchronous iterator under ASGI with sync_to_async(list),
+    which loads the whole response into memory before sending any of it. Requests
+    served over ASGI are therefore given an asynchronous iterator; under WSGI the
+    iterable is streamed as is.
+
+    Args:
+        request (Request): The current request, a DRF or Django request.
+        streaming_content (iterable): The synchronous iterable of the response body.
+        **kwargs: Passed on to StreamingHttpResponse, e.g. content_type.
+
+    Returns:
+        StreamingHttpResponse: The response.
+    """
+    if isinstance(getattr(request, "_request", request), ASGIRequest):
+        streaming_content = aiter_in_thread(streaming_content)
+    return StreamingHttpResponse(streaming_content, **kwargs)
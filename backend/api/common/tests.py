@@ -0,0 +1,57 @@
+from io import StringIO
+from unittest import skipIf
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import TransactionTestCase
+
+from authentication.models import CustomUser
+
+
+class BenchmarkRequestsCommandTests(TransactionTestCase):
+    def setUp(self):
+        CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+
+    def test_both_rounds_are_reported(self):
+        settings_dict = connection.settings_dict
+        conn_max_age, options = settings_dict["CONN_MAX_AGE"], dict(settings_dict["OPTIONS"])
+        out = StringIO()
+        call_command(
+            "benchmark_requests", username="ca_user", paths=["/api/product/", "/api/product/?pagination=keyset"],
+            requests=6, threads=2, stdout=out,
+        )
+        output = out.getvalue()
+        self.assertEqual(output.count("req/s"), 4)
+        self.assertIn("new connection per request", output)
+        self.assertEqual(output.count("speed-up"), 2)
+        self.assertEqual((settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"]), (conn_max_age, options))
+
+    @skipIf(connection.vendor == "sqlite", "SQLite test databases live in memory and keep their connection.")
+    def test_baseline_opens_a_connection_per_request(self):
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection)
+
+        connection_created.connect(count)
+        self.addCleanup(connection_created.disconnect, count)
+        conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        connection.settings_dict["CONN_MAX_AGE"] = 60
+        try:
+            call_command("benchmark_requests", username="ca_user", requests=5, stdout=StringIO())
+        finally:
+            connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+
+        # Five warm-up and five measured requests in the baseline round, at most
+        # one connection per thread in the persistent round.
+        self.assertGreaterEqual(len(opened), 10)
+        self.assertLess(len(opened), 15)
+
+    def test_failing_requests_and_unknown_users_are_errors(self):
+        with self.assertRaisesMessage(CommandError, "returned 404"):
+            call_command("benchmark_requests", username="ca_user", paths=["/api/missing/"], stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("benchmark_requests", username="nobody", stdout=StringIO())
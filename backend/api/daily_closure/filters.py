@@ -0,0 +1,22 @@
+import django_filters
+from .models import DailySummary
+
+
+class DailySummaryFilter(django_filters.FilterSet):
+    """
+    FilterSet for the DailySummary model.
+
+    This FilterSet provides filtering capabilities for DailySummary objects,
+    allowing filtering by an inclusive date range and by cashier.
+
+    Attributes:
+        date (DateFromToRangeFilter): Filters summaries by date range (date_after, date_before).
+        cashier (NumberFilter): Filters summaries by cashier id.
+    """
+
+    date = django_filters.DateFromToRangeFilter(field_name="date")
+    cashier = django_filters.NumberFilter(field_name="cashier_id")
+
+    class Meta:
+        model = DailySummary
+        fields = ["date", "cashier"]
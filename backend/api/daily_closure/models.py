@@ -32,6 +32,9 @@ class DailySummary(models.Model):
 
     class Meta:
         unique_together = ('cashier', 'date')
+        indexes = [
+            models.Index(fields=["date", "id"], name="dailysummary_date_idx"),
+        ]
         verbose_name = "Daily Summary"
         verbose_name_plural = "Daily Summaries"
 
@@ -60,6 +63,11 @@ class Withdrawal(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["cashier", "date"], name="withdrawal_cashier_date_idx"),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the Withdrawal instance.
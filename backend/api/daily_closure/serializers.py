@@ -7,13 +7,17 @@ class DailySummarySerializer(serializers.ModelSerializer):
     Serializer for the DailySummary model.
 
     This serializer is used to convert DailySummary model instances into JSON representations
-    and vice versa. It includes all fields from the DailySummary model.
+    and vice versa. It includes all fields from the DailySummary model and the
+    username of the cashier, so querysets should select_related the cashier.
 
     Attributes:
+        cashier_username (CharField): The username of the cashier.
         model (Model): The Django model class being serialized.
         fields (str): Specifies which fields should be included in the serialized output.
     """
 
+    cashier_username = serializers.CharField(source='cashier.username', read_only=True)
+
     class Meta:
         model = DailySummary
         fields = '__all__'
@@ -1,8 +1,15 @@
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from unittest import skipUnless
+
+from api.common.query_plans import SUPPORTED_VENDORS, captured_sequential_scans
 
 from api.daily_closure.models import DailySummary, Withdrawal
+from api.daily_closure.totals import closure_totals
 from api.product_catalog.models import Category, Product, Voucher
 from api.sales.models import Sale, Payment
 from authentication.models import CustomUser
@@ -179,7 +186,8 @@ class DailySummaryViewSetTests(APITestCase):
 
         response = self.client.get(reverse("dailysummary-list-daily-summaries"), format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["cashier_username"], "admin")
 
     def test_list_daily_summaries_unauthenticated(self):
         response = self.client.get(reverse("dailysummary-list-daily-summaries"), format="json")
@@ -189,4 +197,185 @@ class DailySummaryViewSetTests(APITestCase):
         self.client.force_authenticate(user=self.admin_user)
         response = self.client.get(reverse("dailysummary-list-daily-summaries"), format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(response.data["results"], [])
+        self.assertIsNone(response.data["next"])
+
+    def test_calculate_daily_summary_query_count_does_not_depend_on_sales(self):
+        self.client.force_authenticate(user=self.cashier_user)
+        url = reverse("dailysummary-calculate-daily-summary")
+        self.create_sales_and_payments()
+        self.client.post(url, {"actual_cash": "10.00"}, format="json")
+
+        with CaptureQueriesContext(connection) as few_sales:
+            response = self.client.post(url, {"actual_cash": "10.00"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for _ in range(10):
+            self.create_sales_and_payments()
+        Withdrawal.objects.create(cashier=self.cashier_user, amount=5)
+        with CaptureQueriesContext(connection) as many_sales:
+            response = self.client.post(url, {"actual_cash": "10.00"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(few_sales), len(many_sales))
+        # Sales with payments, withdrawals, previous summary and the update_or_create statements.
+        self.assertLessEqual(len(many_sales), 7)
+        self.assertEqual(response.data["total_sales"], "616.00")
+        self.assertEqual(response.data["total_cash"], "246.40")
+        self.assertEqual(response.data["total_card"], "369.60")
+        self.assertEqual(response.data["total_withdrawals"], "5.00")
+
+    def test_closure_totals_of_cashier(self):
+        other = CustomUser.objects.create_user(
+            username="other", password="otherpassword", role="CA", email="other@example.com"
+        )
+        self.create_sales_and_payments()
+        Sale.objects.create(cashier=other, total_amount=10, tip=1)
+        Withdrawal.objects.create(cashier=self.cashier_user, amount=20)
+
+        with self.assertNumQueries(2):
+            totals = closure_totals(timezone.localdate(), self.cashier_user)
+
+        self.assertEqual(totals, {
+            "total_sales": decimal.Decimal("56.00"),
+            "total_tips": decimal.Decimal("5.00"),
+            "total_cash": decimal.Decimal("22.40"),
+            "total_card": decimal.Decimal("33.60"),
+            "total_withdrawals": decimal.Decimal("20.00"),
+        })
+
+    def test_closure_totals_of_empty_day(self):
+        self.create_sales_and_payments()
+        totals = closure_totals(timezone.localdate() - timedelta(days=1), self.cashier_user)
+        self.assertEqual(set(totals.values()), {decimal.Decimal(0)})
+
+    def test_store_daily_summary(self):
+        other = CustomUser.objects.create_user(
+            username="other", password="otherpassword", role="CA", email="other@example.com"
+        )
+        self.create_sales_and_payments()
+        sale = Sale.objects.create(cashier=other, total_amount=10, tip=1)
+        Payment.objects.create(sale_id=sale, payment_type="Cash")
+        Withdrawal.objects.create(cashier=other, amount=4)
+        self.client.force_authenticate(user=self.admin_user)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("dailysummary-store-daily-summary"),
+                                       {"date": timezone.localdate().isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_sales"], decimal.Decimal("66.00"))
+        self.assertEqual(response.data["total_cash"], decimal.Decimal("32.40"))
+        self.assertEqual(response.data["total_card"], decimal.Decimal("33.60"))
+        self.assertEqual(response.data["total_tips"], decimal.Decimal("6.00"))
+        self.assertEqual(response.data["total_withdrawals"], decimal.Decimal("4.00"))
+        by_cashier = {row["cashier"]: row for row in response.data["cashiers"]}
+        self.assertEqual(by_cashier[self.cashier_user.id]["total_sales"], decimal.Decimal("56.00"))
+        self.assertEqual(by_cashier[other.id]["total_withdrawals"], decimal.Decimal("4.00"))
+
+    def test_store_daily_summary_invalid_date(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse("dailysummary-store-daily-summary"), {"date": "2024-13-45"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_store_daily_summary_forbidden_for_cashier(self):
+        self.client.force_authenticate(user=self.cashier_user)
+        response = self.client.get(reverse("dailysummary-store-daily-summary"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class DailySummaryListTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        )
+        self.cashiers = [
+            CustomUser.objects.create_user(
+                username=f"cashier{i}", password="cashierpassword", role="CA", email=f"cashier{i}@example.com"
+            )
+            for i in range(2)
+        ]
+        self.first_date = datetime(2024, 1, 1).date()
+        for day in range(15):
+            for cashier in self.cashiers:
+                DailySummary.objects.create(
+                    cashier=cashier,
+                    date=self.first_date + timedelta(days=day),
+                    total_sales=100,
+                    total_cash=60,
+                    total_card=40,
+                    total_tips=5,
+                    cash_difference=-1,
+                    closing_cash=60,
+                    total_withdrawals=10,
+                )
+        self.client.force_authenticate(user=self.admin_user)
+        self.url = reverse("dailysummary-list-daily-summaries")
+
+    def test_pages_follow_each_other_newest_first(self):
+        seen = []
+        url = self.url
+        while url:
+            response = self.client.get(url, {"page_size": 7} if url == self.url else None)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend((row["date"], row["id"]) for row in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_page_query_count_does_not_depend_on_page_size(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"page_size": 25})
+        self.assertEqual(len(response.data["results"]), 25)
+
+    def test_filters_by_date_range_and_cashier(self):
+        response = self.client.get(self.url, {
+            "date_after": "2024-01-03",
+            "date_before": "2024-01-05",
+            "cashier": self.cashiers[0].id,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["date"] for row in response.data["results"]],
+            ["2024-01-05", "2024-01-04", "2024-01-03"],
+        )
+        self.assertEqual({row["cashier"] for row in response.data["results"]}, {self.cashiers[0].id})
+
+    def test_totals_cover_the_filtered_range(self):
+        response = self.client.get(self.url, {"date_after": "2024-01-01", "date_before": "2024-01-10", "totals": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertEqual(response.data["totals"]["total_sales"], decimal.Decimal("2000"))
+        self.assertEqual(response.data["totals"]["total_withdrawals"], decimal.Decimal("200"))
+        self.assertEqual(response.data["totals"]["cash_difference"], decimal.Decimal("-20"))
+
+    def test_totals_are_omitted_by_default(self):
+        response = self.client.get(self.url)
+        self.assertNotIn("totals", response.data)
+
+    def test_invalid_filter(self):
+        response = self.client.get(self.url, {"date_after": "not-a-date"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "Query plans are not supported on this database.")
+class DailySummaryQueryPlanTests(TestCase):
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user(
+            username="cashier", password="cashierpassword", role="CA", email="cashier@example.com"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.cashier)
+        Sale.objects.create(cashier=self.cashier, total_amount=10)
+        Withdrawal.objects.create(cashier=self.cashier, amount=5)
+
+    def test_calculate_daily_summary_uses_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("dailysummary-calculate-daily-summary"), {"actual_cash": "5.00"},
+                                        format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            captured_sequential_scans(queries.captured_queries, [Sale, Payment, Withdrawal, DailySummary]), []
+        )
@@ -0,0 +1,145 @@
+import decimal
+from datetime import timedelta
+
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from api.daily_closure.models import Withdrawal
+from api.sales.models import Payment, Sale
+from helpers.dates import day_start
+
+SALE_TOTALS = {
+    "total_sales": Sum("total_amount"),
+    "total_tips": Sum("tip"),
+    "total_cash": Sum(F("total_amount") * F("cash_payments")),
+    "total_card": Sum(F("total_amount") * F("card_payments")),
+}
+CLOSURE_FIELDS = (*SALE_TOTALS, "total_withdrawals")
+
+
+def payment_count(payment_type):
+    """
+    Return an expression counting the payments of a given type of the outer sale.
+
+    The count is read from the (sale_id, payment_type) index of payments.
+
+    Args:
+        payment_type (str): One of Payment.PaymentTypes.
+
+    Returns:
+        Expression: The number of payments, 0 if there are none.
+    """
+    payments = (
+        Payment.objects.filter(sale_id=OuterRef("pk"), payment_type=payment_type)
+        .order_by()
+        .values("sale_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(Subquery(payments), 0)
+
+
+def sales_with_payment_counts(start, end):
+    """
+    Return the sales of a period annotated with their numbers of cash and card payments.
+
+    Args:
+        start (datetime): The start of the period.
+        end (datetime): The exclusive end of the period.
+
+    Returns:
+        QuerySet: The sales with "cash_payments" and "card_payments".
+    """
+    return Sale.objects.filter(date_created__gte=start, date_created__lt=end).annotate(
+        cash_payments=payment_count(Payment.PaymentTypes.CASH),
+        card_payments=payment_count(Payment.PaymentTypes.CARD),
+    )
+
+
+def day_range(date):
+    """
+    Return the start and the exclusive end of a local day.
+
+    Filtering on a range instead of a __date lookup lets the database use the
+    (cashier, date) indexes of sales and withdrawals.
+
+    Args:
+        date (date): The day.
+
+    Returns:
+        tuple: The aware start and end datetimes.
+    """
+    return day_start(date), day_start(date + timedelta(days=1))
+
+
+def empty_totals():
+    """
+    Return closure totals with every amount set to zero.
+    """
+    return dict.fromkeys(CLOSURE_FIELDS, decimal.Decimal(0))
+
+
+def _fill(totals, row):
+    for field in CLOSURE_FIELDS:
+        if row.get(field) is not None:
+            totals[field] = row[field]
+    return totals
+
+
+def closure_totals(date, cashier=None):
+    """
+    Return the sales, tips, cash, card and withdrawal totals of a day.
+
+    The sales are summed together with their cash and card payments in a single
+    query, and the withdrawals with a second one. As before, a sale counts
+    towards the cash and card totals once for every payment of that type.
+
+    Args:
+        date (date): The day.
+        cashier (CustomUser): If given, only the sales and withdrawals of this cashier are summed.
+
+    Returns:
+        dict: Maps the DailySummary total fields to amounts.
+    """
+    start, end = day_range(date)
+    sales = sales_with_payment_counts(start, end)
+    withdrawals = Withdrawal.objects.filter(date__gte=start, date__lt=end)
+    if cashier is not None:
+        sales = sales.filter(cashier=cashier)
+        withdrawals = withdrawals.filter(cashier=cashier)
+
+    totals = _fill(empty_totals(), sales.aggregate(**SALE_TOTALS))
+    return _fill(totals, withdrawals.aggregate(total_withdrawals=Sum("amount")))
+
+
+def closure_totals_by_cashier(date):
+    """
+    Return the closure totals of a day for every cashier who sold or withdrew cash.
+
+    Uses one grouped query for the sales and one for the withdrawals, regardless
+    of the number of cashiers.
+
+    Args:
+        date (date): The day.
+
+    Returns:
+        dict: Maps cashier ids to dicts of the DailySummary total fields.
+    """
+    start, end = day_range(date)
+    sales = (
+        sales_with_payment_counts(start, end)
+        .values("cashier")
+        .annotate(**SALE_TOTALS)
+        .order_by()
+    )
+    withdrawals = (
+        Withdrawal.objects.filter(date__gte=start, date__lt=end)
+        .values("cashier")
+        .annotate(total_withdrawals=Sum("amount"))
+        .order_by()
+    )
+
+    totals = {}
+    for row in [*sales, *withdrawals]:
+        _fill(totals.setdefault(row["cashier"], empty_totals()), row)
+    return totals
@@ -2,15 +2,21 @@ import decimal
 from datetime import datetime
 
 from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from authentication.permissions import IsAdminOrManagerOrCashier
-from .models import DailySummary, Withdrawal
+from api.common.pagination import KeysetPagination
+from authentication.permissions import IsAdminOrManager, IsAdminOrManagerOrCashier
+from .filters import DailySummaryFilter
+from .models import DailySummary
 from .serializers import DailySummarySerializer, WithdrawalSerializer
-from ..sales.models import Sale, Payment
+from .totals import CLOSURE_FIELDS, closure_totals, closure_totals_by_cashier
+
+SUMMARY_TOTAL_FIELDS = (*CLOSURE_FIELDS, 'cash_difference')
 
 
 class DailySummaryViewSet(viewsets.ViewSet):
@@ -18,9 +24,27 @@ class DailySummaryViewSet(viewsets.ViewSet):
     ViewSet for managing daily summaries.
 
     This ViewSet provides actions for calculating and listing daily summaries.
+
+    Attributes:
+        keyset_ordering (tuple): Fields used by the keyset pagination of the list.
     """
 
     permission_classes = [IsAuthenticated, IsAdminOrManagerOrCashier]
+    keyset_ordering = ('date', 'id')
+
+    def get_permissions(self):
+        """
+        Return the permissions of the current action.
+
+        The actions are routed explicitly in urls.py instead of by a router, which
+        would otherwise apply the permission_classes of their @action decorators.
+
+        Returns:
+            list: The permission instances.
+        """
+        handler = getattr(self, self.action, None) if self.action else None
+        permission_classes = getattr(handler, 'kwargs', {}).get('permission_classes', self.permission_classes)
+        return [permission() for permission in permission_classes]
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def calculate_daily_summary(self, request):
@@ -28,7 +52,8 @@ class DailySummaryViewSet(viewsets.ViewSet):
         Calculate and create/update the daily summary for the authenticated user.
 
         This action calculates various financial metrics for the day and creates
-        or updates a DailySummary instance.
+        or updates a DailySummary instance. The totals are read with one query for
+        the sales and their payments and one for the withdrawals.
 
         Args:
             request (Request): The HTTP request object.
@@ -38,16 +63,6 @@ class DailySummaryViewSet(viewsets.ViewSet):
         """
         cashier = request.user
         date = datetime.today().date()
-        sales = Sale.objects.filter(cashier=cashier, date_created__date=date)
-
-        total_sales = sales.aggregate(Sum('total_amount'))['total_amount__sum'] or decimal.Decimal(0)
-        total_tips = sales.aggregate(Sum('tip'))['tip__sum'] or decimal.Decimal(0)
-
-        payments = Payment.objects.filter(sale_id__in=sales)
-        total_cash = payments.filter(payment_type='Cash').aggregate(Sum('sale_id__total_amount'))[
-                         'sale_id__total_amount__sum'] or decimal.Decimal(0)
-        total_card = payments.filter(payment_type='Card').aggregate(Sum('sale_id__total_amount'))[
-                         'sale_id__total_amount__sum'] or decimal.Decimal(0)
 
         actual_cash = request.data.get('actual_cash')
 
@@ -56,47 +71,99 @@ class DailySummaryViewSet(viewsets.ViewSet):
         except (TypeError, ValueError, decimal.InvalidOperation):
             return Response({"error": "Invalid actual cash value"}, status=status.HTTP_400_BAD_REQUEST)
 
+        totals = closure_totals(date, cashier)
+        total_cash = totals['total_cash']
+        total_tips = totals['total_tips']
+        total_withdrawals = totals['total_withdrawals']
+
         previous_summary = DailySummary.objects.filter(cashier=cashier).order_by('-date').first()
         previous_closing_cash = previous_summary.closing_cash if previous_summary else decimal.Decimal(0)
 
-        total_withdrawals = Withdrawal.objects.filter(cashier=cashier, date__date=date).aggregate(Sum('amount'))[
-                                'amount__sum'] or decimal.Decimal(0)
-
         cash_difference = actual_cash - (previous_closing_cash + total_cash + total_tips - total_withdrawals)
 
         summary, created = DailySummary.objects.update_or_create(
             cashier=cashier,
             date=date,
             defaults={
-                'total_sales': total_sales,
-                'total_cash': total_cash,
-                'total_card': total_card,
-                'total_tips': total_tips,
+                **totals,
                 'cash_difference': cash_difference,
                 'closing_cash': actual_cash,
-                'total_withdrawals': total_withdrawals
             }
         )
 
+        # The serializer reads the username of the cashier, who is the requesting user.
+        summary.cashier = cashier
         serializer = DailySummarySerializer(summary)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdminOrManager])
+    def store_daily_summary(self, request):
+        """
+        Return the store-wide totals of a day with a breakdown per cashier.
+
+        The day is given by the optional "date" query parameter (YYYY-MM-DD) and
+        defaults to today. Nothing is stored; the totals are read with two grouped
+        queries however many registers were open.
+
+        Args:
+            request (Request): The HTTP request object.
+
+        Returns:
+            Response: The store totals and the list of per-cashier totals, or an error message.
+        """
+        date = datetime.today().date()
+        if request.query_params.get('date'):
+            try:
+                date = parse_date(request.query_params['date'])
+            except ValueError:
+                date = None
+            if date is None:
+                return Response({"error": "Invalid date, use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        cashiers = closure_totals_by_cashier(date)
+        store = {
+            field: sum((totals[field] for totals in cashiers.values()), decimal.Decimal(0))
+            for field in CLOSURE_FIELDS
+        }
+        return Response({
+            'date': date,
+            **store,
+            'cashiers': [
+                {'cashier': cashier_id, **totals}
+                for cashier_id, totals in sorted(cashiers.items(), key=lambda item: item[0] or 0)
+            ],
+        }, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdminOrManagerOrCashier])
     def list_daily_summaries(self, request):
         """
-        List all daily summaries.
+        List the daily summaries, newest first, with keyset pagination.
 
-        This action retrieves and serializes all DailySummary instances.
+        The summaries can be filtered with DailySummaryFilter (date_after,
+        date_before, cashier) and are paginated with KeysetPagination on
+        (date, id), so the report screen loads one page at a time however many
+        closures exist. With ?totals=true the response also contains the sums of
+        the amounts over all filtered summaries, not only the current page.
 
         Args:
             request (Request): The HTTP request object.
 
         Returns:
-            Response: A list of serialized DailySummary instances.
+            Response: A page of serialized DailySummary instances, or the filter errors.
         """
-        summaries = DailySummary.objects.all()
-        serializer = DailySummarySerializer(summaries, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        filterset = DailySummaryFilter(request.query_params, queryset=DailySummary.objects.select_related('cashier'))
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        summaries = filterset.qs.order_by('-date', '-id')
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(summaries, request, view=self)
+        response = paginator.get_paginated_response(DailySummarySerializer(page, many=True).data)
+        if request.query_params.get('totals') in ('true', '1'):
+            response.data['totals'] = summaries.order_by().aggregate(
+                **{field: Coalesce(Sum(field), decimal.Decimal(0)) for field in SUMMARY_TOTAL_FIELDS}
+            )
+        return response
 
 
 class WithdrawalViewSet(viewsets.ViewSet):
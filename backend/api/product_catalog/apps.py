@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductCatalogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api.product_catalog"
+
+    def ready(self):
+        from api.product_catalog.search import ensure_search_index  # Lazy import
+
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,424 @@
+import csv
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from api.common.cache import bump_model_versions_on_commit
+from api.product_catalog.ean_lookup import ean_cache
+from api.product_catalog.models import Category, Product, Voucher
+from helpers.ean import normalize_ean
+
+CATALOG_COLUMNS = [
+    'type', 'name', 'category', 'price_with_vat', 'price_without_vat', 'inventory_count',
+    'measurement_of_quantity', 'unit', 'ean_code', 'color', 'description', 'tax_rate', 'parent',
+    'is_active', 'expiration_date', 'discount_type', 'discount_amount', 'title',
+]
+
+# Column order of rows in files without a header row.
+POSITIONAL_COLUMNS = {
+    'category': ['name', 'parent'],
+    'product': ['name', 'category', 'price_with_vat', 'price_without_vat', 'inventory_count',
+                'measurement_of_quantity', 'unit', 'ean_code', 'color', 'description', 'tax_rate'],
+    'voucher': ['ean_code', 'expiration_date', 'discount_type', 'discount_amount', 'is_active',
+                'description', 'title'],
+}
+
+PRODUCT_IMPORT_FIELDS = ['name', 'category', 'price_with_vat', 'price_without_vat', 'inventory_count',
+                         'measurement_of_quantity', 'unit', 'color', 'description', 'tax_rate', 'is_active']
+VOUCHER_IMPORT_FIELDS = ['expiration_date', 'discount_type', 'discount_amount', 'is_active', 'description',
+                         'title']
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class Echo:
+    """
+    Pseudo-buffer that returns what is written to it instead of storing it.
+
+    Lets csv.writer produce one encoded line at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_catalog_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the rows of the catalog export: categories, active products and non-deleted vouchers.
+
+    Every model is read in chunks with the related objects joined in, so the memory
+    use and the number of queries do not grow with the size of the catalog.
+
+    Args:
+        chunk_size (int): The number of rows fetched from the database at once.
+
+    Yields:
+        list: The values of one row, in the order of CATALOG_COLUMNS.
+    """
+    categories = Category.objects.select_related('parent').order_by('pk')
+    for category in categories.iterator(chunk_size=chunk_size):
+        parent_name = category.parent.name if category.parent else ""
+        yield ['category', category.name, "", "", "", "", "", "", "", "", "", "", parent_name, "",
+               "", "", "", ""]
+
+    products = Product.objects.filter(is_active=True).select_related('category').order_by('pk')
+    for product in products.iterator(chunk_size=chunk_size):
+        yield [
+            'product',
+            product.name,
+            product.category.name if product.category else "",
+            product.price_with_vat,
+            product.price_without_vat,
+            product.inventory_count if product.inventory_count is not None else 0,
+            product.measurement_of_quantity,
+            product.unit,
+            product.ean_code,
+            product.color if product.color else "RED",
+            product.description,
+            product.tax_rate,
+            "",
+            str(product.is_active),
+            "", "", "", ""  # Empty fields for voucher-specific data
+        ]
+
+    vouchers = Voucher.objects.filter(is_deleted=False).order_by('pk')
+    for voucher in vouchers.iterator(chunk_size=chunk_size):
+        yield [
+            'voucher',
+            "",  # Empty name field
+            "",  # Empty category field
+            "", "", "", "", "",  # Empty product-specific fields
+            voucher.ean_code,
+            "",  # Empty color field
+            voucher.description,
+            "",  # Empty tax_rate field
+            "",  # Empty parent field
+            str(voucher.is_active),
+            voucher.expiration_date.isoformat(),
+            voucher.discount_type,
+            voucher.discount_amount,
+            voucher.title
+        ]
+
+
+def iter_catalog_csv(columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the catalog export as CSV lines, including the header.
+
+    Args:
+        columns (list): The columns to export, or None for all of them. The type
+            column is always exported first, so the file stays importable.
+        chunk_size (int): The number of rows fetched from the database at once.
+
+    Yields:
+        str: One CSV line.
+    """
+    indexes = list(range(len(CATALOG_COLUMNS)))
+    if columns:
+        indexes = [0] + [CATALOG_COLUMNS.index(column) for column in CATALOG_COLUMNS[1:] if column in columns]
+
+    writer = csv.writer(Echo())
+    yield writer.writerow([CATALOG_COLUMNS[index] for index in indexes])
+    for row in iter_catalog_rows(chunk_size):
+        yield writer.writerow([row[index] for index in indexes])
+
+
+def gzip_stream(lines, batch_size=500):
+    """
+    Compress a stream of text lines with gzip, yielding compressed blocks as they fill up.
+
+    Args:
+        lines (iterable): The text to compress.
+        batch_size (int): The number of lines compressed together.
+
+    Yields:
+        bytes: The next part of the gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            block = compressor.compress("".join(batch).encode('utf-8'))
+            batch = []
+            if block:
+                yield block
+    if batch:
+        yield compressor.compress("".join(batch).encode('utf-8'))
+    yield compressor.flush()
+
+
+class CatalogImporter:
+    """
+    Import engine for catalog CSV files.
+
+    The file is read row by row. Categories are resolved from an in-memory map of
+    all categories, and products and vouchers are written with bulk_create and
+    bulk_update in batches. Products and vouchers with an EAN code that already
+    exists are updated instead of created. The whole import runs in one transaction:
+    if any row is invalid, nothing is written and every invalid row is reported.
+    In dry-run mode the import is rolled back even if all rows are valid.
+
+    Files with a header row (starting with a "type" column, as written by the
+    export) are read by column name, other files by the position of the values.
+
+    Attributes:
+        batch_size (int): The number of products or vouchers written per query.
+        dry_run (bool): Whether to roll back the import after validating it.
+        progress (callable): Called with the number of rows read, every batch_size rows.
+        errors (list): The errors of the invalid rows.
+        created (dict): The number of created objects per row type.
+        updated (dict): The number of updated objects per row type.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, dry_run=False, progress=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress
+        self.errors = []
+        self.error_count = 0
+        self.created = {'category': 0, 'product': 0, 'voucher': 0}
+        self.updated = {'category': 0, 'product': 0, 'voucher': 0}
+
+    def run(self, lines):
+        """
+        Import the rows of a catalog CSV file.
+
+        Args:
+            lines (iterable): The lines of the CSV file, as text.
+
+        Returns:
+            dict: The import report with the created and updated counts and the errors.
+        """
+        with transaction.atomic():
+            self.categories = {category.name: category for category in Category.objects.all()}
+            self.new_categories = []
+            self.category_parents = {}
+            self.products = []
+            self.vouchers = []
+            self.product_ean_codes = set()
+
+            reader = csv.reader(lines)
+            columns = None
+            for row in reader:
+                if self.progress is not None and reader.line_num % self.batch_size == 0:
+                    self.progress(reader.line_num)
+                if not any(value.strip() for value in row):
+                    continue
+                row_type = row[0].strip().lower()
+                if columns is None and reader.line_num == 1 and row_type == 'type':
+                    columns = [column.strip().lower() for column in row]
+                    continue
+                if row_type not in POSITIONAL_COLUMNS:
+                    self.add_error(reader.line_num, row_type, {"type": [f"Unknown row type '{row[0]}'."]})
+                    continue
+
+                names = columns[1:] if columns else POSITIONAL_COLUMNS[row_type]
+                record = {name: value.strip() for name, value in zip(names, row[1:])}
+                try:
+                    getattr(self, f"read_{row_type}")(record, reader.line_num)
+                except ValidationError as e:
+                    self.add_error(reader.line_num, row_type, e)
+
+            if not self.error_count:
+                self.flush_products()
+                self.flush_vouchers()
+                self.flush_categories()
+
+            if self.error_count or self.dry_run:
+                transaction.set_rollback(True)
+            else:
+                # Bulk writes do not send the signals that keep the EAN lookup cache
+                # and the cached category and voucher lists fresh.
+                transaction.on_commit(ean_cache.clear)
+                bump_model_versions_on_commit(Category, Product, Voucher)
+
+        return {
+            "dry_run": self.dry_run,
+            "created": self.created,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+    def add_error(self, line_number, row_type, error):
+        """
+        Record the error of an invalid row.
+        """
+        self.error_count += 1
+        if len(self.errors) >= MAX_REPORTED_ERRORS:
+            return
+        if isinstance(error, ValidationError):
+            error = error.message_dict if hasattr(error, 'error_dict') else {"non_field_errors": error.messages}
+        self.errors.append({"row": line_number, "type": row_type, "errors": error})
+
+    def get_category(self, name):
+        """
+        Return the category with the given name, creating it (unsaved) if it does not exist.
+        """
+        category = self.categories.get(name)
+        if category is None:
+            category = Category(name=name)
+            self.categories[name] = category
+            self.new_categories.append(category)
+            self.created['category'] += 1
+        return category
+
+    def save_new_categories(self):
+        """
+        Insert the categories that were created since the last call.
+        """
+        if self.new_categories:
+            Category.objects.bulk_create(self.new_categories, batch_size=self.batch_size)
+            self.new_categories = []
+
+    def read_category(self, record, line_number):
+        name = record.get('name', '')
+        if not name:
+            raise ValidationError({"name": ["This field cannot be blank."]})
+        if len(name) > Category._meta.get_field('name').max_length:
+            raise ValidationError({"name": ["Ensure this value has at most 200 characters."]})
+
+        existed = name in self.categories and self.categories[name].pk is not None
+        self.get_category(name)
+        if existed:
+            self.updated['category'] += 1
+        if record.get('parent'):
+            if record['parent'] == name:
+                raise ValidationError({"parent": ["A category cannot be its own parent."]})
+            self.category_parents[name] = record['parent']
+
+    def flush_categories(self):
+        """
+        Insert the remaining new categories and link all imported categories to their parents.
+        """
+        for parent_name in self.category_parents.values():
+            self.get_category(parent_name)
+        self.save_new_categories()
+
+        changed = []
+        for name, parent_name in self.category_parents.items():
+            category, parent = self.categories[name], self.categories[parent_name]
+            if category.parent_id != parent.pk:
+                category.parent = parent
+                changed.append(category)
+        Category.objects.bulk_update(changed, ['parent'], batch_size=self.batch_size)
+        if changed or self.created['category']:
+            Category.objects.rebuild_paths()
+
+    def read_product(self, record, line_number):
+        ean_code = normalize_ean(record.get('ean_code'))
+        if ean_code:
+            if ean_code in self.product_ean_codes:
+                raise ValidationError({"ean_code": ["This EAN code is used by another row of the file."]})
+            self.product_ean_codes.add(ean_code)
+
+        inventory_count = record.get('inventory_count') or None
+        if inventory_count is not None:
+            try:
+                inventory_count = int(float(inventory_count))
+            except ValueError:
+                raise ValidationError({"inventory_count": ["A whole number is required."]})
+
+        product = Product(
+            name=record.get('name', ''),
+            price_with_vat=record.get('price_with_vat', ''),
+            price_without_vat=record.get('price_without_vat', ''),
+            inventory_count=inventory_count,
+            measurement_of_quantity=record.get('measurement_of_quantity', ''),
+            unit=record.get('unit', ''),
+            ean_code=ean_code,
+            color=record.get('color') or None,
+            description=record.get('description') or None,
+            tax_rate=record.get('tax_rate', ''),
+            is_active=(record.get('is_active') or 'true').lower() == 'true',
+        )
+        # The inventory count may be zero; its sign is checked by Product.clean.
+        product.clean_fields(exclude=['inventory_count', 'category'])
+        product.clean()
+        if self.error_count:
+            return
+
+        product.update_search_text()
+        category_name = record.get('category', '')
+        product.category = self.get_category(category_name) if category_name else None
+        self.products.append(product)
+        if len(self.products) >= self.batch_size:
+            self.flush_products()
+
+    def flush_products(self):
+        """
+        Write the buffered products, updating the ones whose EAN code already exists.
+        """
+        if not self.products:
+            return
+        self.save_new_categories()
+
+        existing = dict(
+            Product.objects.filter(ean_code__in=[p.ean_code for p in self.products if p.ean_code])
+            .values_list('ean_code', 'pk')
+        )
+        to_create, to_update = [], []
+        now = timezone.now()
+        for product in self.products:
+            if product.ean_code in existing:
+                product.pk = existing[product.ean_code]
+                product.date_updated = now
+                to_update.append(product)
+            else:
+                to_create.append(product)
+
+        Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Product.objects.bulk_update(to_update, PRODUCT_IMPORT_FIELDS + ['search_text', 'date_updated'], batch_size=self.batch_size)
+        self.created['product'] += len(to_create)
+        self.updated['product'] += len(to_update)
+        self.products = []
+
+    def read_voucher(self, record, line_number):
+        voucher = Voucher(
+            ean_code=normalize_ean(record.get('ean_code')),
+            expiration_date=record.get('expiration_date', ''),
+            discount_type=record.get('discount_type', ''),
+            discount_amount=record.get('discount_amount', ''),
+            is_active=(record.get('is_active') or 'true').lower() == 'true',
+            description=record.get('description') or None,
+            title=record.get('title', ''),
+        )
+        voucher.clean_fields()
+        voucher.clean()
+        if self.error_count:
+            return
+
+        self.vouchers.append(voucher)
+        if len(self.vouchers) >= self.batch_size:
+            self.flush_vouchers()
+
+    def flush_vouchers(self):
+        """
+        Write the buffered vouchers, updating the non-deleted ones whose EAN code already exists.
+        """
+        if not self.vouchers:
+            return
+        existing = {}
+        for ean_code, pk in Voucher.objects.filter(
+            is_deleted=False, ean_code__in=[v.ean_code for v in self.vouchers if v.ean_code]
+        ).order_by('-pk').values_list('ean_code', 'pk'):
+            existing[ean_code] = pk
+
+        to_create, to_update = [], []
+        for voucher in self.vouchers:
+            if voucher.ean_code in existing:
+                voucher.pk = existing[voucher.ean_code]
+                to_update.append(voucher)
+            else:
+                to_create.append(voucher)
+
+        Voucher.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Voucher.objects.bulk_update(to_update, VOUCHER_IMPORT_FIELDS, batch_size=self.batch_size)
+        self.created['voucher'] += len(to_create)
+        self.updated['voucher'] += len(to_update)
+        self.vouchers = []
@@ -0,0 +1,177 @@
+from django.db.models import Count
+
+from api.common.cache import cached_value
+from api.product_catalog.models import Category, Product
+
+
+class CategoryTree:
+    """
+    In-memory index of the whole category hierarchy.
+
+    The categories are loaded with a single query and the active products are
+    counted per category with a second one; children, ancestors, subtrees and
+    descendant product counts are then answered without touching the database.
+    A parent chain that loops back on itself is cut where it repeats, so a
+    corrupt hierarchy cannot make the walks run forever.
+
+    Attributes:
+        nodes (dict): Maps category ids to dicts with "id", "name" and "parent".
+        children (dict): Maps category ids (None for the roots) to the sorted ids of their children.
+        product_counts (dict): Maps category ids to their number of active products.
+    """
+
+    def __init__(self, categories, product_counts):
+        self.nodes = {}
+        self.children = {None: []}
+        self.product_counts = product_counts
+        for category_id, name, parent_id in categories:
+            self.nodes[category_id] = {"id": category_id, "name": name, "parent": parent_id}
+            self.children.setdefault(category_id, [])
+        for node in self.nodes.values():
+            parent_id = node["parent"] if node["parent"] in self.nodes else None
+            self.children[parent_id].append(node["id"])
+        for child_ids in self.children.values():
+            child_ids.sort(key=lambda category_id: (self.nodes[category_id]["name"], category_id))
+        self._descendant_product_counts = {}
+
+    @classmethod
+    def load(cls):
+        """
+        Build the tree from the database.
+
+        Returns:
+            CategoryTree: The tree of all categories.
+        """
+        categories = Category.objects.values_list("id", "name", "parent_id")
+        product_counts = dict(
+            Product.objects.filter(is_active=True, category__isnull=False)
+            .values_list("category_id")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        return cls(categories, product_counts)
+
+    def __contains__(self, category_id):
+        return category_id in self.nodes
+
+    def ancestor_ids(self, category_id):
+        """
+        Return the ids of the ancestors of a category, starting at its root.
+
+        Args:
+            category_id (int): The category id.
+
+        Returns:
+            list: The ids from the root down to the parent of the category.
+        """
+        ancestors = []
+        seen = {category_id}
+        parent_id = self.nodes[category_id]["parent"]
+        while parent_id in self.nodes and parent_id not in seen:
+            ancestors.append(parent_id)
+            seen.add(parent_id)
+            parent_id = self.nodes[parent_id]["parent"]
+        ancestors.reverse()
+        return ancestors
+
+    def descendant_ids(self, category_id):
+        """
+        Return the ids of a category and all its descendants, in depth-first order.
+
+        Args:
+            category_id (int): The category id.
+
+        Returns:
+            list: The id of the category followed by the ids of its descendants.
+        """
+        ids = []
+        seen = set()
+        stack = [category_id]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            ids.append(current)
+            stack.extend(reversed(self.children[current]))
+        return ids
+
+    def descendant_product_count(self, category_id):
+        """
+        Return the number of active products in a category and all its descendants.
+
+        Args:
+            category_id (int): The category id.
+
+        Returns:
+            int: The number of products.
+        """
+        if category_id not in self._descendant_product_counts:
+            self._descendant_product_counts[category_id] = sum(
+                self.product_counts.get(descendant_id, 0) for descendant_id in self.descendant_ids(category_id)
+            )
+        return self._descendant_product_counts[category_id]
+
+    def serialize(self, category_id, depth=None, _seen=None):
+        """
+        Return a category with its subtree as nested dicts.
+
+        Args:
+            category_id (int): The id of the root of the subtree.
+            depth (int): The number of levels of children to include, or None for all.
+
+        Returns:
+            dict: The category with "parent_name", "product_count",
+                "descendant_product_count" and "children".
+        """
+        seen = (_seen or set()) | {category_id}
+        node = self.nodes[category_id]
+        parent = self.nodes.get(node["parent"])
+        children = []
+        if depth is None or depth > 0:
+            children = [
+                self.serialize(child_id, None if depth is None else depth - 1, seen)
+                for child_id in self.children[category_id]
+                if child_id not in seen
+            ]
+        return {
+            **node,
+            "parent_name": parent["name"] if parent else None,
+            "product_count": self.product_counts.get(category_id, 0),
+            "descendant_product_count": self.descendant_product_count(category_id),
+            "children": children,
+        }
+
+    def serialize_roots(self, depth=None):
+        """
+        Return the whole forest as nested dicts.
+
+        Args:
+            depth (int): The number of levels of children to include, or None for all.
+
+        Returns:
+            list: The serialized root categories.
+        """
+        return [self.serialize(root_id, depth) for root_id in self.children[None]]
+
+    def serialize_ancestors(self, category_id):
+        """
+        Return the ancestors of a category, starting at its root, without their children.
+
+        Args:
+            category_id (int): The category id.
+
+        Returns:
+            list: The serialized ancestors.
+        """
+        return [self.serialize(ancestor_id, depth=0) for ancestor_id in self.ancestor_ids(category_id)]
+
+
+def get_category_tree():
+    """
+    Return the category tree, from the cache until a category or product changes.
+
+    Returns:
+        CategoryTree: The tree of all categories.
+    """
+    return cached_value("category-tree", CategoryTree.load, models=[Category, Product])
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from api.product_catalog.models import Product, QuickSale, Voucher
+from helpers.ean import normalize_ean
+
+# The inventory count is left out: sales change it with bulk updates that send no
+# signals, so a cached count would be stale until the entry expires.
+PRODUCT_LOOKUP_FIELDS = (
+    "id", "name", "ean_code", "price_with_vat", "price_without_vat", "tax_rate", "unit",
+    "measurement_of_quantity", "color", "category_id", "is_active",
+)
+VOUCHER_LOOKUP_FIELDS = (
+    "id", "title", "ean_code", "discount_type", "discount_amount", "expiration_date", "is_active",
+)
+QUICK_SALE_LOOKUP_FIELDS = ("id", "name", "ean_code", "price_with_vat", "tax_rate", "quantity")
+
+
+class EanLookupCache:
+    """
+    Thread-safe, size-bounded LRU cache of EAN lookup results.
+
+    Misses are cached too, for a much shorter time, so repeated scans of an unknown
+    code do not hit the database while a product created in another process is
+    found within seconds. Besides the entries keyed by EAN code, the cache keeps a reverse map
+    from (model label, primary key) to the cached EAN code, so a saved or deleted
+    object can evict the entry of its previous code as well. The cache is local to
+    the process; entries expire after a TTL so that changes made by other worker
+    processes become visible.
+
+    Attributes:
+        max_size (int): The maximum number of cached EAN codes.
+        ttl (float): The number of seconds an entry stays valid.
+        miss_ttl (float): The number of seconds a miss stays valid.
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups that went to the database.
+    """
+
+    def __init__(self, max_size=10000, ttl=60, miss_ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def get(self, ean_code):
+        """
+        Return whether the EAN code is cached and its cached result.
+
+        Returns:
+            tuple: (True, result) on a hit, (False, None) on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(ean_code)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(ean_code)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(ean_code)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, ean_code, result, owner=None):
+        """
+        Cache the result of an EAN lookup.
+
+        Args:
+            ean_code (str): The normalized EAN code.
+            result (dict): The lookup result, or None if nothing matched.
+            owner (tuple): The (model label, primary key) of the matched object.
+        """
+        with self._lock:
+            self._remove(ean_code)
+            ttl = self.ttl if result is not None else self.miss_ttl
+            self._entries[ean_code] = (time.monotonic() + ttl, result, owner)
+            if owner is not None:
+                self._owners[owner] = ean_code
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, ean_code=None, owner=None):
+        """
+        Evict the entry of an EAN code and the entry cached for an object.
+
+        Args:
+            ean_code (str): The normalized EAN code to evict.
+            owner (tuple): The (model label, primary key) of an object whose entry to evict.
+        """
+        with self._lock:
+            if owner is not None and owner in self._owners:
+                self._remove(self._owners[owner])
+            if ean_code is not None:
+                self._remove(ean_code)
+
+    def clear(self):
+        """
+        Evict all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._owners.clear()
+
+    def _remove(self, ean_code):
+        entry = self._entries.pop(ean_code, None)
+        if entry is not None and entry[2] is not None and self._owners.get(entry[2]) == ean_code:
+            del self._owners[entry[2]]
+
+
+ean_cache = EanLookupCache(
+    max_size=getattr(settings, "EAN_LOOKUP_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "EAN_LOOKUP_CACHE_TTL", 60),
+    miss_ttl=getattr(settings, "EAN_LOOKUP_CACHE_MISS_TTL", 5),
+)
+
+
+def _lookup_querysets(ean_code):
+    """
+    Yield the type, model and lean queryset of every kind of object an EAN code may match, in order.
+    """
+    yield "product", Product, Product.objects.filter(ean_code=ean_code).values(*PRODUCT_LOOKUP_FIELDS)
+    yield "voucher", Voucher, (
+        Voucher.objects.filter(ean_code=ean_code, is_deleted=False)
+        .order_by("-id")
+        .values(*VOUCHER_LOOKUP_FIELDS)
+    )
+    yield "quick_sale", QuickSale, QuickSale.objects.filter(ean_code=ean_code).values(*QUICK_SALE_LOOKUP_FIELDS)
+
+
+def find_by_ean(ean_code):
+    """
+    Find the product, voucher or quick sale with the given EAN code.
+
+    Products are matched first, then non-deleted vouchers, then quick sales. Every
+    lookup is an exact match on the normalized code, so it uses the EAN indexes.
+
+    Args:
+        ean_code (str): The normalized EAN code.
+
+    Returns:
+        tuple: The lean lookup result (or None) and the (model label, primary key) of the match.
+    """
+    for kind, model, queryset in _lookup_querysets(ean_code):
+        row = queryset.first()
+        if row:
+            return {"type": kind, **row}, (model._meta.label, row["id"])
+    return None, None
+
+
+async def afind_by_ean(ean_code):
+    """
+    Async version of find_by_ean().
+    """
+    for kind, model, queryset in _lookup_querysets(ean_code):
+        row = await queryset.afirst()
+        if row:
+            return {"type": kind, **row}, (model._meta.label, row["id"])
+    return None, None
+
+
+def lookup_ean(ean_code):
+    """
+    Look up an EAN code, answering from the local cache when possible.
+
+    Args:
+        ean_code (str): The scanned EAN code; it is normalized first.
+
+    Returns:
+        dict or None: The lookup result, or None if no object has the EAN code.
+    """
+    ean_code = normalize_ean(ean_code)
+    if ean_code is None:
+        return None
+
+    hit, result = ean_cache.get(ean_code)
+    if hit:
+        return result
+    result, owner = find_by_ean(ean_code)
+    ean_cache.set(ean_code, result, owner)
+    return result
+
+
+async def alookup_ean(ean_code):
+    """
+    Async version of lookup_ean().
+
+    The cache is in memory and guarded by a lock held only briefly, so it is read
+    without leaving the event loop; only a miss awaits the database.
+    """
+    ean_code = normalize_ean(ean_code)
+    if ean_code is None:
+        return None
+
+    hit, result = ean_cache.get(ean_code)
+    if hit:
+        return result
+    result, owner = await afind_by_ean(ean_code)
+    ean_cache.set(ean_code, result, owner)
+    return result
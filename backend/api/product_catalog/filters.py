@@ -1,5 +1,6 @@
 import django_filters
 from api.product_catalog.models import Category, Product, Voucher
+from helpers.ean import normalize_ean
 
 
 class CategoryFilter(django_filters.FilterSet):
@@ -31,7 +32,8 @@ class ProductFilter(django_filters.FilterSet):
         price_with_vat__gt (NumberFilter): Filters products with price greater than specified value.
         price_with_vat__lt (NumberFilter): Filters products with price less than specified value.
         category (ModelChoiceFilter): Filters products by category.
-        ean_code (CharFilter): Filters products by exact EAN code, case-insensitive.
+        category_tree (ModelChoiceFilter): Filters products by category including all its descendants.
+        ean_code (CharFilter): Filters products by exact normalized EAN code.
     """
 
     name = django_filters.CharFilter(lookup_expr="icontains")
@@ -45,7 +47,10 @@ class ProductFilter(django_filters.FilterSet):
     category = django_filters.ModelChoiceFilter(
         queryset=Category.objects.all(), method="filter_category"
     )
-    ean_code = django_filters.CharFilter(lookup_expr="iexact")
+    category_tree = django_filters.ModelChoiceFilter(
+        queryset=Category.objects.all(), method="filter_category_tree"
+    )
+    ean_code = django_filters.CharFilter(method="filter_ean_code")
 
     class Meta:
         model = Product
@@ -72,6 +77,46 @@ class ProductFilter(django_filters.FilterSet):
             return queryset.filter(category=value)
         return queryset
 
+    def filter_category_tree(self, queryset, name, value):
+        """
+        Custom method to filter products by a category and all its descendants.
+
+        The descendants are matched by the prefix of their materialized path, which
+        is a single indexed lookup joined to the products. An empty path, e.g. before
+        rebuild_category_paths ran, would match every product, so the subtree is
+        then walked through the parent links instead.
+
+        Args:
+            queryset (QuerySet): The initial queryset to filter.
+            name (str): The name of the field to filter by (unused in this method).
+            value (Category): The root category of the subtree.
+
+        Returns:
+            QuerySet: The filtered queryset.
+        """
+        if value:
+            if not value.path:
+                return queryset.filter(category_id__in=Category.objects.descendant_ids(value))
+            return queryset.filter(category__path__startswith=value.path)
+        return queryset
+
+    def filter_ean_code(self, queryset, name, value):
+        """
+        Custom method to filter by EAN code.
+
+        The value is normalized the same way the EAN codes are stored, so the
+        lookup is an exact match that can use the index.
+
+        Args:
+            queryset (QuerySet): The initial queryset to filter.
+            name (str): The name of the field to filter by.
+            value (str): The EAN code to filter by.
+
+        Returns:
+            QuerySet: The filtered queryset.
+        """
+        return queryset.filter(**{name: normalize_ean(value)})
+
 
 class VoucherFilter(django_filters.FilterSet):
     """
@@ -82,13 +127,30 @@ class VoucherFilter(django_filters.FilterSet):
     Attributes:
         expiration_date (DateFromToRangeFilter): Filters vouchers by expiration date range.
         is_active (BooleanFilter): Filters vouchers by active status.
-        ean_code (CharFilter): Filters vouchers by exact EAN code, case-insensitive.
+        ean_code (CharFilter): Filters vouchers by exact normalized EAN code.
     """
 
     expiration_date = django_filters.DateFromToRangeFilter()
     is_active = django_filters.BooleanFilter()
-    ean_code = django_filters.CharFilter(lookup_expr="iexact")
+    ean_code = django_filters.CharFilter(method="filter_ean_code")
 
     class Meta:
         model = Voucher
         fields = ['ean_code', 'expiration_date', 'discount_type', 'discount_amount', 'is_active']
+
+    def filter_ean_code(self, queryset, name, value):
+        """
+        Custom method to filter by EAN code.
+
+        The value is normalized the same way the EAN codes are stored, so the
+        lookup is an exact match that can use the index.
+
+        Args:
+            queryset (QuerySet): The initial queryset to filter.
+            name (str): The name of the field to filter by.
+            value (str): The EAN code to filter by.
+
+        Returns:
+            QuerySet: The filtered queryset.
+        """
+        return queryset.filter(**{name: normalize_ean(value)})
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.product_catalog.ean_lookup import ean_cache
+from api.product_catalog.models import Product, QuickSale, Voucher
+from helpers.ean import normalize_ean
+
+
+class Command(BaseCommand):
+    """
+    Management command to normalize the stored EAN codes of products, vouchers and quick sales.
+
+    EAN codes are normalized whenever an object is saved, and lookups compare the
+    normalized codes exactly. This command normalizes the codes that were stored
+    before, or written outside of the ORM.
+    """
+
+    help = "Normalize the EAN codes of products, vouchers and quick sales."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model in (Product, Voucher, QuickSale):
+                changed = []
+                for instance in model.objects.exclude(ean_code=None).only("pk", "ean_code").iterator():
+                    ean_code = normalize_ean(instance.ean_code)
+                    if ean_code != instance.ean_code:
+                        instance.ean_code = ean_code
+                        changed.append(instance)
+                model.objects.bulk_update(changed, ["ean_code"], batch_size=1000)
+                self.stdout.write(f"{model._meta.verbose_name_plural}: {len(changed)} EAN codes normalized.")
+            transaction.on_commit(ean_cache.clear)
+
+        self.stdout.write(self.style.SUCCESS("EAN codes normalized."))
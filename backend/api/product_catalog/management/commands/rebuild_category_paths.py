@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.product_catalog.models import Category
+
+
+class Command(BaseCommand):
+    """
+    Management command to recompute the materialized paths of all categories.
+
+    The paths are maintained whenever a category is saved, moved, deleted or
+    merged. This command fills them for categories created before the paths
+    existed, or whose parents were written outside of the ORM.
+    """
+
+    help = "Recompute the materialized paths of the category hierarchy."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = Category.objects.rebuild_paths()
+
+        self.stdout.write(self.style.SUCCESS(f"Category paths rebuilt, {changed} changed."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.common.cache import bump_model_versions_on_commit
+from api.product_catalog.models import Product
+from api.product_catalog.search import ensure_search_index
+
+
+class Command(BaseCommand):
+    """
+    Management command to recompute the search text of all products.
+
+    The search text is updated whenever a product is saved or imported. This
+    command fills it for products stored before, or written outside of the ORM,
+    and creates the trigram index on PostgreSQL.
+    """
+
+    help = "Recompute the search text of all products and create the search index."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = []
+            products = Product.objects.only("pk", "name", "ean_code", "description", "search_text")
+            for product in products.iterator(chunk_size=2000):
+                search_text = product.search_text
+                product.update_search_text()
+                if product.search_text != search_text:
+                    changed.append(product)
+            Product.objects.bulk_update(changed, ["search_text"], batch_size=1000)
+            bump_model_versions_on_commit(Product)
+        ensure_search_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Product search rebuilt, {len(changed)} products changed."))
@@ -1,5 +1,13 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.common.cache import bump_model_versions_on_commit, invalidate_model_cache
+from helpers.ean import normalize_ean
+from helpers.search import normalize_search_text
 from helpers.validators.validate_positive import validate_positive
 from settings.models import BusinessSettings
 from .choices import ColorChoices, TaxRateChoices
@@ -36,6 +44,148 @@ class CategoryManager(models.Manager):
         """
         return self.filter(parent=category)
 
+    def delete_and_reparent(self, category):
+        """
+        Delete a category, moving its subcategories and products to its parent.
+
+        The moves are single set-based UPDATEs in one transaction, so the cost does
+        not depend on the number of moved rows.
+
+        Args:
+            category (Category): The category to delete.
+
+        Returns:
+            dict: The number of moved "categories" and "products".
+        """
+        with transaction.atomic():
+            category = self.select_for_update().get(pk=category.pk)
+            counts = self._move_contents(category, category.parent)
+            category.delete()
+        return counts
+
+    def merge(self, source, target):
+        """
+        Merge a category into another one and delete it.
+
+        The subcategories and products of the source are moved to the target with
+        set-based UPDATEs in one transaction.
+
+        Args:
+            source (Category): The category to merge and delete.
+            target (Category): The category receiving the contents of the source.
+
+        Returns:
+            dict: The number of moved "categories" and "products".
+
+        Raises:
+            ValidationError: If the target is the source or one of its descendants.
+        """
+        if source.pk == target.pk:
+            raise ValidationError("A category cannot be merged into itself.")
+        with transaction.atomic():
+            locked = {
+                category.pk: category
+                for category in self.select_for_update().filter(pk__in=[source.pk, target.pk]).order_by("pk")
+            }
+            source, target = locked[source.pk], locked[target.pk]
+            if source.pk in self.ancestor_ids(target):
+                raise ValidationError("A category cannot be merged into one of its subcategories.")
+            counts = self._move_contents(source, target)
+            source.delete()
+        return counts
+
+    def ancestor_ids(self, category):
+        """
+        Return the ids of the ancestors of a category, walking the parent links in the database.
+
+        Args:
+            category (Category): The category.
+
+        Returns:
+            list: The ids from the parent of the category up to its root.
+        """
+        ancestors = []
+        parent_id = category.parent_id
+        while parent_id is not None and parent_id not in ancestors and parent_id != category.pk:
+            ancestors.append(parent_id)
+            parent_id = self.filter(pk=parent_id).values_list("parent_id", flat=True).first()
+        return ancestors
+
+    def descendant_ids(self, category):
+        """
+        Return the ids of a category and its descendants, walking the child links in the database.
+
+        Used when the materialized paths are not filled yet; costs one query per level.
+
+        Args:
+            category (Category): The root category of the subtree.
+
+        Returns:
+            list: The id of the category followed by the ids of its descendants.
+        """
+        descendants = [category.pk]
+        level = [category.pk]
+        while level:
+            level = [pk for pk in self.filter(parent_id__in=level).values_list("id", flat=True) if pk not in descendants]
+            descendants.extend(level)
+        return descendants
+
+    def rebuild_paths(self):
+        """
+        Recompute the materialized paths of all categories from the parent links.
+
+        Needed after parents were written in bulk and to fill the paths of
+        categories created before the paths existed. A category on a parent cycle
+        is treated as a root where the cycle is cut.
+
+        Returns:
+            int: The number of categories whose path changed.
+        """
+        rows = {pk: (parent_id, path) for pk, parent_id, path in self.values_list("id", "parent_id", "path")}
+        paths = {}
+        for pk in rows:
+            chain = []
+            current = pk
+            while current is not None and current not in paths and current not in chain:
+                chain.append(current)
+                current = rows[current][0] if rows[current][0] in rows else None
+            prefix = paths.get(current, "")
+            for node in reversed(chain):
+                prefix = paths[node] = f"{prefix}{node}/"
+        changed = [self.model(pk=pk, path=path) for pk, path in paths.items() if rows[pk][1] != path]
+        self.bulk_update(changed, ["path"], batch_size=1000)
+        if changed:
+            bump_model_versions_on_commit(Category)
+        return len(changed)
+
+    def move_descendant_paths(self, old_path, new_path):
+        """
+        Replace the path prefix of all descendants of a category with one UPDATE.
+
+        Args:
+            old_path (str): The previous path of the category.
+            new_path (str): The new path prefix of its descendants.
+
+        Returns:
+            int: The number of updated descendants.
+        """
+        return self.filter(path__startswith=old_path).exclude(path=old_path).update(
+            path=Concat(Value(new_path), Substr("path", len(old_path) + 1), output_field=models.CharField())
+        )
+
+    def _move_contents(self, category, new_parent):
+        categories = self.filter(parent=category).update(parent=new_parent)
+        if category.path:
+            self.move_descendant_paths(category.path, new_parent.path if new_parent else "")
+        else:
+            self.rebuild_paths()
+        products = Product.objects.filter(category=category).update(
+            category=new_parent, date_updated=timezone.now()
+        )
+        # Set-based updates send no signals.
+        bump_model_versions_on_commit(Category, Product)
+        return {"categories": categories, "products": products}
+
 
 class Category(models.Model):
     """
@@ -47,10 +197,14 @@ class Category(models.Model):
     Attributes:
         name (CharField): The name of the category. Must be unique.
         parent (ForeignKey): Reference to the parent category, if any.
+        path (CharField): The materialized path, the ids from the root down to this
+            category each followed by a slash, e.g. "1/5/12/". The descendants of a
+            category are the categories whose path starts with its path.
     """
 
     name = models.CharField(max_length=200, unique=True)
     parent = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True)
+    path = models.CharField(max_length=255, db_index=True, default="", editable=False)
 
     objects = CategoryManager()
 
@@ -58,6 +212,38 @@ class Category(models.Model):
         verbose_name = "Category"
         verbose_name_plural = "Categories"
 
+    def save(self, *args, **kwargs):
+        """
+        Save the category and keep the materialized paths of it and its descendants up to date.
+
+        Moving a category rewrites the paths of its whole subtree with one UPDATE.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Raises:
+            ValidationError: If the category would become its own ancestor.
+        """
+        with transaction.atomic():
+            parent_path = ""
+            if self.parent_id is not None:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list("path", flat=True).first() or ""
+            old_path = ""
+            if not self._state.adding:
+                old_path = Category.objects.filter(pk=self.pk).values_list("path", flat=True).first() or ""
+            if old_path and parent_path.startswith(old_path):
+                raise ValidationError("A category cannot be moved into one of its subcategories.")
+
+            super().save(*args, **kwargs)
+
+            path = f"{parent_path}{self.pk}/"
+            if path != old_path:
+                Category.objects.filter(pk=self.pk).update(path=path)
+                if old_path:
+                    Category.objects.move_descendant_paths(old_path, path)
+            self.path = path
+
     def __str__(self):
         """
         Returns a string representation of the category.
@@ -92,6 +278,9 @@ class Product(models.Model):
         date_updated (DateTimeField): The date and time when the product was last updated.
         average_price (DecimalField): The average price of the product.
         is_active (BooleanField): Indicates whether the product is currently active.
+        incoming_quantity_total (IntegerField): Running total of all incoming stock quantities.
+        incoming_cost_total (DecimalField): Running total of quantity * import price of priced incoming stock.
+        search_text (TextField): The normalized name, EAN code and description the product is searched by.
     """
 
     name = models.CharField(max_length=200)
@@ -110,6 +299,17 @@ class Product(models.Model):
     date_updated = models.DateTimeField(auto_now=True)
     average_price = models.DecimalField(max_digits=50, decimal_places=40, default=0.00)
     is_active = models.BooleanField(default=True)
+    incoming_quantity_total = models.IntegerField(default=0, editable=False)
+    incoming_cost_total = models.DecimalField(max_digits=20, decimal_places=4, default=0, editable=False)
+    search_text = models.TextField(default="", editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date_created", "id"], name="product_created_idx"),
+            models.Index(
+                fields=["date_created", "id"], condition=models.Q(is_active=True), name="product_active_created_idx"
+            ),
+        ]
 
     def clean(self):
         """
@@ -136,14 +336,29 @@ class Product(models.Model):
         """
         Saves the product instance to the database.
 
-        This method calls the superclass save method to perform the actual saving.
+        This method normalizes the EAN code, updates the search text and calls the
+        superclass save method to perform the actual saving.
 
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
+        self.ean_code = normalize_ean(self.ean_code)
+        self.update_search_text()
         super().save(*args, **kwargs)
 
+    def update_search_text(self):
+        """
+        Recompute the search text from the name, EAN code and description.
+
+        Bulk writes, which bypass save, have to call this themselves.
+        """
+        self.search_text = " ".join(part for part in (
+            normalize_search_text(self.name),
+            normalize_search_text(self.ean_code),
+            normalize_search_text(self.description),
+        ) if part)
+
     def __str__(self):
         """
         Returns a string representation of the product.
@@ -205,6 +420,19 @@ class QuickSale(models.Model):
         if self.ean_code and QuickSale.objects.filter(ean_code=self.ean_code).exists():
             raise ValidationError("A quick sale with this EAN code already exists.")
 
+    def save(self, *args, **kwargs):
+        """
+        Saves the quick sale instance to the database.
+
+        This method normalizes the EAN code before saving.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+        """
+        self.ean_code = normalize_ean(self.ean_code)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """
         Returns a string representation of the quick sale.
@@ -267,12 +495,14 @@ class Voucher(models.Model):
         """
         Saves the voucher instance to the database.
 
-        This method performs full cleaning of the instance before saving.
+        This method normalizes the EAN code and performs full cleaning of the
+        instance before saving.
 
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
+        self.ean_code = normalize_ean(self.ean_code)
         self.full_clean()
         super().save(*args, **kwargs)
 
@@ -299,3 +529,38 @@ class Voucher(models.Model):
     class Meta:
         verbose_name = "Voucher"
         verbose_name_plural = "Vouchers"
+        indexes = [
+            models.Index(fields=["ean_code"], condition=models.Q(is_deleted=False), name="voucher_active_ean_idx"),
+        ]
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+@receiver(post_save, sender=QuickSale)
+@receiver(post_delete, sender=QuickSale)
+def invalidate_ean_lookup(sender, instance, **kwargs):
+    """
+    Signal receiver to evict the EAN lookup cache entries of a saved or deleted object.
+
+    Both the current EAN code and the code the object was cached under are evicted,
+    immediately and again once the transaction commits, so a lookup running
+    concurrently with the transaction cannot keep the old result.
+
+    Args:
+        sender: The model class.
+        instance: The actual instance being saved or deleted.
+        **kwargs: Additional keyword arguments.
+    """
+    from api.product_catalog.ean_lookup import ean_cache  # Lazy import
+
+    ean_code = normalize_ean(instance.ean_code)
+    owner = (sender._meta.label, instance.pk)
+    ean_cache.invalidate(ean_code, owner)
+    transaction.on_commit(lambda: ean_cache.invalidate(ean_code, owner))
+
+
+for model in (Category, Product, Voucher):
+    post_save.connect(invalidate_model_cache, sender=model)
+    post_delete.connect(invalidate_model_cache, sender=model)
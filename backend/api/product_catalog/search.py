@@ -0,0 +1,261 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import Q
+
+from api.common.cache import get_model_versions
+from api.product_catalog.models import Product
+from helpers.ean import normalize_ean
+from helpers.search import normalize_search_text, search_words, trigram_similarity, trigrams
+
+SEARCH_RESULT_LIMIT = 20
+CANDIDATE_LIMIT = 200
+FUZZY_THRESHOLD = 0.4
+NAME_WEIGHT = 2.0
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+SUBSTRING_SCORE = 1.5
+
+TRIGRAM_INDEX_NAME = "product_search_text_trgm"
+
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index of product words.
+
+    Every query token is matched against the indexed words exactly, as a prefix,
+    as a substring, and, for tokens of three or more characters, by trigram
+    similarity to tolerate typos. A product matches if every token matches one
+    of its words; its score is the sum of the best match of each token, with
+    matches in the name weighted higher than matches in the EAN code or
+    description.
+
+    Attributes:
+        name_ids (dict): Maps name words to the ids of the products having them.
+        text_ids (dict): Maps all words to the ids of the products having them.
+        words (list): The sorted indexed words.
+    """
+
+    def __init__(self, rows):
+        self.name_ids = defaultdict(set)
+        self.text_ids = defaultdict(set)
+        for product_id, name, search_text in rows:
+            for word in search_words(name):
+                self.name_ids[word].add(product_id)
+            for word in search_text.split():
+                self.text_ids[word].add(product_id)
+        self.words = sorted(self.text_ids)
+        self.trigram_words = defaultdict(set)
+        for word in self.words:
+            for trigram in trigrams(word):
+                self.trigram_words[trigram].add(word)
+
+    def match_words(self, token):
+        """
+        Return the indexed words matching a token with their match scores.
+
+        Numeric tokens, such as EAN codes, are only matched exactly or as prefixes.
+
+        Args:
+            token (str): A normalized query word.
+
+        Returns:
+            dict: Maps matching words to scores.
+        """
+        matches = {}
+        start = bisect_left(self.words, token)
+        end = bisect_left(self.words, token + "\uffff", start)
+        for word in self.words[start:end]:
+            matches[word] = EXACT_SCORE if word == token else PREFIX_SCORE
+        if len(token) >= 3 and not token.isdigit():
+            shared = Counter()
+            for trigram in trigrams(token):
+                shared.update(self.trigram_words.get(trigram, ()))
+            for word, count in shared.items():
+                if word in matches:
+                    continue
+                if token in word:
+                    matches[word] = SUBSTRING_SCORE
+                elif count >= 2:
+                    similarity = trigram_similarity(token, word)
+                    if similarity >= FUZZY_THRESHOLD:
+                        matches[word] = similarity
+        return matches
+
+    def token_scores(self, token, candidates=None):
+        """
+        Return the best score of a token for every product it matches.
+
+        Args:
+            token (str): A normalized query word.
+            candidates (set): If given, only these product ids are scored.
+
+        Returns:
+            dict: Maps product ids to scores.
+        """
+        postings = []
+        for word, score in self.match_words(token).items():
+            if word in self.name_ids:
+                postings.append((score * NAME_WEIGHT, self.name_ids[word]))
+            postings.append((score, self.text_ids[word]))
+        postings.sort(key=lambda posting: posting[0], reverse=True)
+
+        best = {}
+        scored = set()
+        for score, ids in postings:
+            if candidates is not None:
+                ids = ids & candidates
+            new_ids = ids - scored
+            scored |= new_ids
+            best.update(dict.fromkeys(new_ids, score))
+        return best
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """
+        Return the ids of the best matching products.
+
+        The longest tokens, which tend to be the most selective, are matched first
+        and the later tokens only score the products that are still candidates.
+
+        Args:
+            query (str): The search query.
+            limit (int): The maximum number of results.
+
+        Returns:
+            list: (score, product id) pairs, best first.
+        """
+        totals = None
+        for token in sorted(set(search_words(query)), key=len, reverse=True):
+            scores = self.token_scores(token, None if totals is None else set(totals))
+            if totals is None:
+                totals = scores
+            else:
+                totals = {product_id: totals[product_id] + score for product_id, score in scores.items()}
+            if not totals:
+                return []
+        if not totals:
+            return []
+        best_ids = heapq.nlargest(limit, totals, key=totals.__getitem__)
+        return sorted(((totals[product_id], product_id) for product_id in best_ids),
+                      key=lambda item: (-item[0], item[1]))
+
+
+class _LocalIndex:
+    """
+    Process-local ProductSearchIndex of all active products, rebuilt when the product cache version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = None
+
+    def get(self):
+        version = get_model_versions([Product])[0]
+        with self._lock:
+            if self._index is None or self._version != version:
+                rows = Product.objects.filter(is_active=True).values_list("id", "name", "search_text")
+                self._index = ProductSearchIndex(rows.iterator(chunk_size=2000))
+                self._version = version
+            return self._index
+
+
+local_index = _LocalIndex()
+
+
+def uses_postgres_search():
+    """
+    Return True if the products are searched with the PostgreSQL trigram index.
+    """
+    return connection.vendor == "postgresql"
+
+
+def postgres_candidates(query):
+    """
+    Return the products that may match a query, using the trigram index of the search text.
+
+    Every token of three or more characters has to be contained in the search
+    text or be similar to one of its words; shorter tokens have to start a word.
+    Both conditions can use the trigram index. At most CANDIDATE_LIMIT
+    candidates, the most similar first, are returned for ranking.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        list: (id, name, search text) tuples.
+    """
+    from django.contrib.postgres.search import TrigramWordSimilarity  # Only importable with psycopg
+
+    tokens = search_words(query)
+    queryset = Product.objects.filter(is_active=True)
+    for token in tokens:
+        if len(token) < 3:
+            queryset = queryset.filter(Q(search_text__startswith=token) | Q(search_text__contains=f" {token}"))
+        else:
+            queryset = queryset.filter(Q(search_text__contains=token) | Q(search_text__trigram_word_similar=token))
+    return list(
+        queryset.annotate(similarity=TrigramWordSimilarity(" ".join(tokens), "search_text"))
+        .order_by("-similarity", "id")
+        .values_list("id", "name", "search_text")[:CANDIDATE_LIMIT]
+    )
+
+
+def search_products(query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Search the active products by name, EAN code and description.
+
+    On PostgreSQL the candidates are selected with the trigram index and ranked
+    in memory, so the cost of a keystroke is bounded by CANDIDATE_LIMIT. Other
+    databases, such as SQLite in tests and development, use an in-memory index of
+    all active products kept per process. A product whose EAN code equals the
+    query always comes first.
+
+    Args:
+        query (str): The search query.
+        limit (int): The maximum number of results.
+
+    Returns:
+        list: The matching products, best first.
+    """
+    if not normalize_search_text(query):
+        return []
+    if uses_postgres_search():
+        index = ProductSearchIndex(postgres_candidates(query))
+    else:
+        index = local_index.get()
+    ids = [product_id for _, product_id in index.search(query, limit)]
+
+    products = Product.objects.in_bulk(ids)
+    results = [products[product_id] for product_id in ids if product_id in products]
+    ean_code = normalize_ean(query)
+    exact = Product.objects.filter(is_active=True, ean_code=ean_code).first() if ean_code else None
+    if exact is not None:
+        results = [exact] + [product for product in results if product.pk != exact.pk][:limit - 1]
+    return results
+
+
+def ensure_search_index(using="default", **kwargs):
+    """
+    Create the pg_trgm extension and the trigram index of the product search text on PostgreSQL.
+
+    Connected to post_migrate, because the index type is specific to PostgreSQL.
+
+    Args:
+        using (str): The database alias.
+        **kwargs: Additional keyword arguments.
+    """
+    from django.db import connections
+
+    db = connections[using]
+    if db.vendor != "postgresql":
+        return
+    table = Product._meta.db_table
+    with db.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX_NAME} ON {table} USING gin (search_text gin_trgm_ops)"
+        )
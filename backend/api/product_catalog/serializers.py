@@ -23,6 +23,23 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = "__all__"
 
+    def validate_parent(self, value):
+        """
+        Check that the category is not moved into its own subtree.
+
+        Args:
+            value (Category): The new parent category.
+
+        Returns:
+            Category: The validated parent category.
+
+        Raises:
+            serializers.ValidationError: If the parent is the category or one of its descendants.
+        """
+        if value and self.instance and self.instance.path and value.path.startswith(self.instance.path):
+            raise serializers.ValidationError("A category cannot be moved into one of its subcategories.")
+        return value
+
     @staticmethod
     def get_parent_name(obj):
         """
@@ -78,28 +95,32 @@ class CategoryWithoutChildrenSerializer(serializers.ModelSerializer):
         return obj.parent.name if obj.parent else None
 
 
+# Columns maintained for searching and the stock ledger, not part of the API.
+INTERNAL_PRODUCT_FIELDS = ("search_text", "incoming_quantity_total", "incoming_cost_total")
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """
     Serializer for the Product model.
 
-    This serializer includes all fields from the Product model and adds a nested
+    This serializer includes all public fields from the Product model and adds a nested
     serializer for the categories field.
     """
     categories = CategoryWithoutChildrenSerializer
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = INTERNAL_PRODUCT_FIELDS
 
 
 class ProductIDSerializer(serializers.ModelSerializer):
     """
-    Serializer for the Product model that includes all fields.
+    Serializer for the Product model that includes all public fields.
     """
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = INTERNAL_PRODUCT_FIELDS
 
 
 class ColorChoicesSerializer(serializers.Serializer):
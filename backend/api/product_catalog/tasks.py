@@ -0,0 +1,91 @@
+import io
+import tempfile
+
+from django.core.files import File
+
+from api.product_catalog.catalog_csv import (
+    CATALOG_COLUMNS,
+    IMPORT_BATCH_SIZE,
+    CatalogImporter,
+    gzip_stream,
+    iter_catalog_csv,
+)
+from api.product_catalog.models import Category, Product, Voucher
+from jobs.registry import PermanentJobError, job
+
+EXPORT_PROGRESS_EVERY = 1000
+
+
+@job("catalog_import", needs_file=True)
+def import_catalog(job):
+    """
+    Import the uploaded catalog CSV file of the job with CatalogImporter.
+
+    Payload:
+        batch_size (int): The number of rows written per query.
+        dry_run (bool): Only validate the file.
+
+    Returns:
+        dict: The import report.
+
+    Raises:
+        PermanentJobError: If the file is not UTF-8 or contains invalid rows.
+    """
+    with job.input_file.open("rb") as file:
+        total = sum(1 for _ in file)
+
+    importer = CatalogImporter(
+        batch_size=job.payload.get("batch_size", IMPORT_BATCH_SIZE),
+        dry_run=bool(job.payload.get("dry_run")),
+        progress=lambda rows: job.report_progress(rows, total),
+    )
+    with job.input_file.open("rb") as file:
+        lines = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            report = importer.run(lines)
+        except UnicodeDecodeError:
+            raise PermanentJobError("The file must be UTF-8 encoded.")
+    job.report_progress(total, total)
+
+    if report["error_count"]:
+        raise PermanentJobError("The catalog contains invalid rows.", result=report)
+    return report
+
+
+@job("catalog_export")
+def export_catalog(job):
+    """
+    Write the catalog export to the result file of the job.
+
+    Payload:
+        columns (list): The columns to export, or none for all of them.
+        compress (str): "gzip" to compress the file.
+
+    Returns:
+        dict: The number of exported rows.
+    """
+    columns = job.payload.get("columns") or None
+    unknown = [column for column in columns or [] if column not in CATALOG_COLUMNS]
+    if unknown:
+        raise PermanentJobError(f"Unknown columns: {', '.join(unknown)}")
+    compress = job.payload.get("compress") == "gzip"
+
+    exported = [Category.objects.all(), Product.objects.filter(is_active=True), Voucher.objects.filter(is_deleted=False)]
+    total = sum(queryset.count() for queryset in exported)
+
+    def lines():
+        for number, line in enumerate(iter_catalog_csv(columns)):
+            if number % EXPORT_PROGRESS_EVERY == 0:
+                job.report_progress(number, total)
+            yield line
+
+    with tempfile.TemporaryFile() as file:
+        if compress:
+            for block in gzip_stream(lines()):
+                file.write(block)
+        else:
+            for line in lines():
+                file.write(line.encode("utf-8"))
+        file.seek(0)
+        job.result_file.save("catalog.csv.gz" if compress else "catalog.csv", File(file), save=False)
+    return {"rows": total}
@@ -1,17 +1,30 @@
 import csv
+import gzip
+import time
+import warnings
 from datetime import timedelta
+from decimal import Decimal
 from io import StringIO
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from unittest import skipUnless
+from unittest.mock import patch
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from api.product_catalog.models import Category, Product, Voucher
-from api.warehouse.models import Stockentry, StockMovementType
+from api.common.query_plans import SUPPORTED_VENDORS, captured_sequential_scans
+from api.product_catalog.ean_lookup import ean_cache
+from api.product_catalog.models import Category, Product, QuickSale, Voucher
+from api.warehouse.models import Stockentry, StockMovementType, Supplier
 from authentication.models import CustomUser
 
 
@@ -34,6 +47,43 @@ class CategoryModelTests(TestCase):
         self.assertEqual(str(category), "Test Category")
 
 
+class CategoryPathTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name="Root")
+        self.child = Category.objects.create(name="Child", parent=self.root)
+        self.grandchild = Category.objects.create(name="Grandchild", parent=self.child)
+
+    def test_paths_are_maintained_on_save_and_move(self):
+        self.assertEqual(self.grandchild.path, f"{self.root.pk}/{self.child.pk}/{self.grandchild.pk}/")
+
+        other = Category.objects.create(name="Other")
+        self.child.parent = other
+        self.child.save()
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f"{other.pk}/{self.child.pk}/{self.grandchild.pk}/")
+
+        self.root.parent = self.grandchild
+        self.root.save()
+        self.assertEqual(self.root.path, f"{self.grandchild.path}{self.root.pk}/")
+
+    def test_category_cannot_become_its_own_ancestor(self):
+        self.root.parent = self.grandchild
+        with self.assertRaises(ValidationError):
+            self.root.save()
+
+    def test_paths_follow_delete_and_rebuild(self):
+        Category.objects.delete_and_reparent(self.child)
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f"{self.root.pk}/{self.grandchild.pk}/")
+
+        Category.objects.update(path="")
+        out = StringIO()
+        call_command("rebuild_category_paths", stdout=out)
+        self.assertIn("2 changed", out.getvalue())
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.path, f"{self.root.pk}/{self.grandchild.pk}/")
+
+
 class ProductModelTests(TestCase):
 
     def test_product_creation(self):
@@ -386,7 +436,7 @@ class VoucherViewSetTests(APITestCase):
         response = self.client.get(reverse("catalog-export_catalog"))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         reader = csv.reader(StringIO(content))
         rows = list(reader)
 
@@ -484,7 +534,7 @@ class CatalogViewSetTests(APITestCase):
         response = self.client.get(reverse("catalog-export_catalog"), format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         reader = csv.reader(StringIO(content))
 
         rows = list(reader)
@@ -564,7 +614,7 @@ class CatalogViewSetTests(APITestCase):
         response = self.client.get(reverse("catalog-export_catalog"), format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         reader = csv.reader(StringIO(content))
 
         rows = list(reader)
@@ -583,6 +633,68 @@ class CatalogViewSetTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_export_catalog_query_count_does_not_depend_on_catalog_size(self):
+        self.client.force_authenticate(user=self.admin_user)
+        parent = Category.objects.create(name="Parent Category")
+        for index in range(20):
+            category = Category.objects.create(name=f"Category {index}", parent=parent)
+            Product.objects.create(
+                name=f"Product {index}",
+                category=category,
+                price_with_vat=100.0,
+                price_without_vat=80.0,
+                inventory_count=10,
+                unit="pieces",
+                measurement_of_quantity=1.0,
+                tax_rate=20.0,
+            )
+
+        response = self.client.get(reverse("catalog-export_catalog"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # One query per exported model, whatever the number of rows.
+        with self.assertNumQueries(3):
+            content = b''.join(response.streaming_content).decode('utf-8')
+
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(len(rows), 1 + 21 + 20)
+        self.assertEqual(rows[2][12], "Parent Category")
+        self.assertEqual(rows[22][:3], ["product", "Product 0", "Category 0"])
+
+    def test_export_catalog_with_gzip_and_columns(self):
+        self.client.force_authenticate(user=self.admin_user)
+        category = Category.objects.create(name="Test Category")
+        Product.objects.create(
+            name="Test Product",
+            category=category,
+            price_with_vat=100.0,
+            price_without_vat=80.0,
+            inventory_count=10,
+            unit="pieces",
+            measurement_of_quantity=1.0,
+            tax_rate=20.0,
+            ean_code="1234567890123",
+        )
+
+        response = self.client.get(
+            reverse("catalog-export_catalog"), {"compress": "gzip", "columns": "ean_code,name"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows, [
+            ["type", "name", "ean_code"],
+            ["category", "Test Category", ""],
+            ["product", "Test Product", "1234567890123"],
+        ])
+
+    def test_export_catalog_with_unknown_column(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse("catalog-export_catalog"), {"columns": "name,secret"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_import_catalog_with_inactive_product(self):
         self.client.force_authenticate(user=self.admin_user)
         csv_content = (
@@ -634,7 +746,7 @@ class CatalogViewSetTests(APITestCase):
         response = self.client.get(reverse("catalog-export_catalog"), format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         reader = csv.reader(StringIO(content))
 
         rows = list(reader)
@@ -649,6 +761,134 @@ class CatalogViewSetTests(APITestCase):
         product_names = [row[1] for row in rows[1:]]
         self.assertNotIn("Inactive Product", product_names)
 
+    def post_catalog(self, csv_content, **params):
+        csv_file = SimpleUploadedFile("catalog.csv", csv_content.encode('utf-8'), content_type="text/csv")
+        url = reverse("catalog-import_catalog")
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        return self.client.post(url, {'file': csv_file}, format="multipart")
+
+    def test_import_catalog_upserts_products_by_ean_code(self):
+        self.client.force_authenticate(user=self.admin_user)
+        category = Category.objects.create(name="Old Category")
+        product = Product.objects.create(
+            name="Old Name",
+            category=category,
+            price_with_vat=100.0,
+            price_without_vat=80.0,
+            inventory_count=10,
+            unit="pieces",
+            measurement_of_quantity=1.0,
+            tax_rate=0.21,
+            ean_code="1234567890123",
+        )
+        csv_content = (
+            "type,name,category,price_with_vat,price_without_vat,inventory_count,measurement_of_quantity,unit,ean_code,color,description,tax_rate,parent,is_active\n"
+            "category,New Category,,,,,,,,,,,Old Category,\n"
+            "product,New Name,New Category,121.0,100.0,5,1.0,pieces,1234567890123,BLUE,,0.21,,True\n"
+            "product,Other Product,New Category,12.1,10.0,0,1.0,pieces,,,,0.21,,True\n"
+        )
+
+        response = self.post_catalog(csv_content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], {'category': 1, 'product': 1, 'voucher': 0})
+        self.assertEqual(response.data['updated'], {'category': 0, 'product': 1, 'voucher': 0})
+        product.refresh_from_db()
+        self.assertEqual(product.name, "New Name")
+        self.assertEqual(product.price_with_vat, Decimal("121.00"))
+        self.assertEqual(product.category.name, "New Category")
+        self.assertEqual(product.category.parent, category)
+        self.assertEqual(Product.objects.get(name="Other Product").inventory_count, 0)
+
+    def test_import_catalog_reports_invalid_rows_and_imports_nothing(self):
+        self.client.force_authenticate(user=self.admin_user)
+        csv_content = (
+            "type,name,category,price_with_vat,price_without_vat,inventory_count,measurement_of_quantity,unit,ean_code,color,description,tax_rate\n"
+            "product,Valid Product,Test Category,100.0,80.0,10,1.0,pieces,111,,,0.21\n"
+            "product,Invalid Price,Test Category,abc,80.0,10,1.0,pieces,222,,,0.21\n"
+            "product,Duplicate EAN,Test Category,100.0,80.0,10,1.0,pieces,111,,,0.21\n"
+            "unknown,Something\n"
+        )
+
+        response = self.post_catalog(csv_content, batch_size=1)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error_count'], 3)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('price_with_vat', response.data['errors'][0]['errors'])
+        self.assertIn('ean_code', response.data['errors'][1]['errors'])
+        self.assertEqual(Category.objects.count(), 0)
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_import_catalog_dry_run(self):
+        self.client.force_authenticate(user=self.admin_user)
+        csv_content = (
+            "type,name,category,price_with_vat,price_without_vat,inventory_count,measurement_of_quantity,unit,ean_code,color,description,tax_rate\n"
+            "product,Test Product,Test Category,100.0,80.0,10,1.0,pieces,,,,0.21\n"
+        )
+
+        response = self.post_catalog(csv_content, dry_run="true")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created']['product'], 1)
+        self.assertEqual(Category.objects.count(), 0)
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_import_catalog_round_trips_the_export(self):
+        self.client.force_authenticate(user=self.admin_user)
+        parent = Category.objects.create(name="Parent Category")
+        category = Category.objects.create(name="Child Category", parent=parent)
+        Product.objects.create(
+            name="Test Product",
+            category=category,
+            price_with_vat=100.0,
+            price_without_vat=80.0,
+            inventory_count=10,
+            unit="pieces",
+            measurement_of_quantity=1.0,
+            tax_rate=0.21,
+            ean_code="1234567890123",
+        )
+        Voucher.objects.create(
+            ean_code="1234567890",
+            expiration_date=timezone.now() + timedelta(days=7),
+            discount_type="Percentage",
+            discount_amount=10.0,
+            is_active=True,
+            description="Test Voucher",
+            title="Test Voucher",
+        )
+        export = b''.join(self.client.get(reverse("catalog-export_catalog")).streaming_content).decode('utf-8')
+
+        response = self.post_catalog(export)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], {'category': 0, 'product': 0, 'voucher': 0})
+        self.assertEqual(response.data['updated'], {'category': 2, 'product': 1, 'voucher': 1})
+        self.assertEqual(Category.objects.get(name="Child Category").parent, parent)
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(Voucher.objects.count(), 1)
+
+    def test_import_catalog_query_count_does_not_depend_on_row_count(self):
+        self.client.force_authenticate(user=self.admin_user)
+        header = "type,name,category,price_with_vat,price_without_vat,inventory_count,measurement_of_quantity,unit,ean_code,color,description,tax_rate\n"
+
+        def rows(count, offset):
+            return "".join(
+                f"product,Product {index},Category {offset + index % 3},100.0,80.0,10,1.0,pieces,{index},,,0.21\n"
+                for index in range(offset, offset + count)
+            )
+
+        with CaptureQueriesContext(connection) as small_import:
+            self.assertEqual(self.post_catalog(header + rows(3, 0)).status_code, status.HTTP_201_CREATED)
+        with CaptureQueriesContext(connection) as large_import:
+            self.assertEqual(self.post_catalog(header + rows(50, 100)).status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(len(large_import.captured_queries), len(small_import.captured_queries))
+        self.assertEqual(Product.objects.count(), 53)
+        self.assertEqual(Category.objects.count(), 6)
+
     def test_import_catalog_with_parent_category(self):
         self.client.force_authenticate(user=self.admin_user)
         csv_content = (
@@ -752,6 +992,15 @@ class ProductViewSetTests(TransactionTestCase):
         self.assertIn("Test Product", product_names)
         self.assertNotIn("Inactive Product", product_names)
 
+    def test_internal_fields_are_not_exposed(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse('product-list'))
+
+        product = response.data['results'][0]
+        self.assertIn("average_price", product)
+        for field in ("search_text", "incoming_quantity_total", "incoming_cost_total"):
+            self.assertNotIn(field, product)
+
 
 class ProductStockEntryHistoryViewTests(APITestCase):
     def setUp(self):
@@ -841,6 +1090,136 @@ class ProductStockEntryHistoryViewTests(APITestCase):
         self.assertEqual(response.data['import_price'], f"{self.stock_entry_latest.import_price:.2f}")
 
 
+class ProductStockTimelineViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="Test Category")
+        self.supplier = Supplier.objects.create(name="Test Supplier")
+        self.product = Product.objects.create(
+            name="Test Product",
+            category=self.category,
+            price_with_vat=100.0,
+            price_without_vat=80.0,
+            inventory_count=0,
+            unit="pieces",
+            measurement_of_quantity=1,
+            tax_rate=20.0,
+            is_active=True
+        )
+        now = timezone.now()
+        movements = [
+            (StockMovementType.INCOMING, 10, Decimal("50.00"), self.supplier, 5),
+            (StockMovementType.OUTGOING, 3, None, None, 4),
+            (StockMovementType.INCOMING, 5, Decimal("60.00"), None, 3),
+            (StockMovementType.OUTGOING, 4, None, None, 2),
+            (StockMovementType.INCOMING, 2, None, None, 1),
+        ]
+        self.entries = []
+        for movement_type, quantity, import_price, supplier, days_ago in movements:
+            entry = Stockentry.objects.create(
+                product=self.product, quantity=quantity, movement_type=movement_type,
+                import_price=import_price, supplier=supplier,
+            )
+            # date_created is set on creation, so the history is moved into the past afterwards.
+            Stockentry.objects.filter(pk=entry.pk).update(date_created=now - timedelta(days=days_ago))
+            self.entries.append(entry)
+        self.url = reverse("product-stock-timeline", args=[self.product.id])
+
+    def test_pages_are_newest_first_with_running_balance(self):
+        response = self.client.get(self.url, {"page_size": 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["product"], {"id": self.product.id, "name": "Test Product"})
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.entries[4].id, self.entries[3].id])
+        self.assertEqual([row["balance"] for row in response.data["results"]], [10, 8])
+        self.assertEqual([row["change"] for row in response.data["results"]], [2, -4])
+        self.assertIsNone(response.data["previous"])
+
+        balances = []
+        next_url = response.data["next"]
+        while next_url:
+            page = self.client.get(next_url).data
+            balances += [row["balance"] for row in page["results"]]
+            next_url = page["next"]
+        self.assertEqual(balances, [12, 7, 10])
+
+    def test_results_are_slim(self):
+        response = self.client.get(self.url, {"page_size": 10})
+
+        oldest = response.data["results"][-1]
+        self.assertEqual(oldest["supplier"], self.supplier.id)
+        self.assertEqual(oldest["supplier_name"], "Test Supplier")
+        self.assertEqual(oldest["import_price"], "50.00")
+        self.assertNotIn("product", oldest)
+        self.assertIsNone(response.data["results"][0]["supplier_name"])
+
+    def test_summary_aggregates_the_whole_ledger(self):
+        Product.objects.filter(pk=self.product.pk).update(inventory_count=9)
+
+        summary = self.client.get(self.url, {"page_size": 1}).data["summary"]
+
+        self.assertEqual(summary["incoming_quantity"], 17)
+        self.assertEqual(summary["outgoing_quantity"], 7)
+        self.assertEqual(summary["balance"], 10)
+        self.assertEqual(summary["inventory_count"], 9)
+        self.assertEqual(summary["drift"], -1)
+        self.assertEqual(summary["incoming_cost"], Decimal("800.00"))
+        self.assertEqual(summary["average_import_price"], Decimal("53.33"))
+        self.assertEqual(summary["movement_count"], 5)
+
+    def test_summary_reads_totals_from_snapshots(self):
+        expected = self.client.get(self.url, {"page_size": 1}).data["summary"]
+        call_command("build_stock_snapshots", stdout=StringIO())
+        # An edit bypassing the snapshot adjustments shows where the totals are read from.
+        Stockentry.objects.filter(pk__in=[self.entries[0].pk, self.entries[1].pk]).update(quantity=1000)
+
+        summary = self.client.get(self.url, {"page_size": 1}).data["summary"]
+
+        self.assertEqual(summary, expected)
+
+    def test_running_balance_uses_snapshots(self):
+        call_command("build_stock_snapshots", stdout=StringIO())
+
+        response = self.client.get(self.url, {"page_size": 3})
+        page = self.client.get(response.data["next"]).data
+
+        self.assertEqual([row["balance"] for row in page["results"]], [7, 10])
+
+    def test_entries_with_the_same_timestamp_are_ordered_by_id(self):
+        moment = timezone.now() - timedelta(days=2)
+        Stockentry.objects.filter(pk__in=[self.entries[2].pk, self.entries[3].pk]).update(date_created=moment)
+
+        response = self.client.get(self.url, {"page_size": 2})
+        page = self.client.get(response.data["next"]).data
+
+        self.assertEqual([row["id"] for row in page["results"]], [self.entries[2].id, self.entries[1].id])
+        self.assertEqual([row["balance"] for row in page["results"]], [12, 7])
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url, {"page_size": 1})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(self.url, {"page_size": 5})
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_unknown_product(self):
+        response = self.client.get(reverse("product-stock-timeline", args=[9999]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unauthenticated_user(self):
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
 class CategoryViewSetTests(APITestCase):
     def setUp(self):
         self.admin_user = CustomUser.objects.create_superuser(
@@ -901,6 +1280,87 @@ class CategoryViewSetTests(APITestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.category, self.parent_category)
 
+    def test_delete_category_moves_contents_with_constant_queries(self):
+        self.client.force_authenticate(user=self.admin_user)
+        for i in range(5):
+            Category.objects.create(name=f"Subcategory {i}", parent=self.child_category)
+            Product.objects.create(
+                name=f"Product {i}", category=self.child_category, price_with_vat=10, price_without_vat=8,
+                inventory_count=1, unit="pieces", measurement_of_quantity=1, tax_rate=0.21,
+            )
+        with CaptureQueriesContext(connection) as few:
+            self.client.delete(reverse('category-detail', args=[self.child_category.id]))
+        self.assertEqual(Category.objects.filter(parent=self.parent_category).count(), 5)
+        self.assertEqual(Product.objects.filter(category=self.parent_category).count(), 6)
+
+        middle = Category.objects.create(name="Middle", parent=self.parent_category)
+        for i in range(20):
+            Category.objects.create(name=f"Other Subcategory {i}", parent=middle)
+        Product.objects.filter(category=self.parent_category).update(category=middle)
+        with CaptureQueriesContext(connection) as many:
+            self.client.delete(reverse('category-detail', args=[middle.id]))
+        self.assertEqual(len(few), len(many))
+
+    def test_merge_category(self):
+        self.client.force_authenticate(user=self.admin_user)
+        target = Category.objects.create(name="Target Category")
+        Category.objects.create(name="Grandchild Category", parent=self.child_category)
+
+        response = self.client.post(reverse('category-merge', args=[self.child_category.id]), {'target': target.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'target': target.id, 'categories': 1, 'products': 1})
+        self.assertFalse(Category.objects.filter(id=self.child_category.id).exists())
+        self.assertEqual(Category.objects.get(name="Grandchild Category").parent, target)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.category, target)
+
+    def test_merge_category_into_descendant_is_rejected(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('category-merge', args=[self.parent_category.id])
+        response = self.client.post(url, {'target': self.child_category.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'target': self.parent_category.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'target': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Category.objects.filter(id=self.parent_category.id).exists())
+
+        self.client.force_authenticate(user=self.ca_user)
+        response = self.client.post(reverse('category-merge', args=[self.child_category.id]),
+                                    {'target': self.parent_category.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_filter_products_by_category_tree(self):
+        self.client.force_authenticate(user=self.admin_user)
+        grandchild = Category.objects.create(name="Grandchild Category", parent=self.child_category)
+        Product.objects.create(
+            name="Deep Product", category=grandchild, price_with_vat=10, price_without_vat=8,
+            inventory_count=1, unit="pieces", measurement_of_quantity=1, tax_rate=0.21,
+        )
+        Product.objects.create(
+            name="Other Product", category=Category.objects.create(name="Other Category"), price_with_vat=10,
+            price_without_vat=8, inventory_count=1, unit="pieces", measurement_of_quantity=1, tax_rate=0.21,
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product-list') + f'?category_tree={self.parent_category.id}')
+        self.assertEqual({p['name'] for p in response.data['results']}, {"Test Product", "Deep Product"})
+        self.assertFalse(any('WITH RECURSIVE' in query['sql'] for query in queries))
+
+        response = self.client.get(reverse('product-list') + f'?category_tree={grandchild.id}')
+        self.assertEqual([p['name'] for p in response.data['results']], ["Deep Product"])
+
+        # Paths not filled yet must not match every product.
+        Category.objects.update(path="")
+        response = self.client.get(reverse('product-list') + f'?category_tree={self.parent_category.id}')
+        self.assertEqual({p['name'] for p in response.data['results']}, {"Test Product", "Deep Product"})
+
+    def test_move_category_into_its_subtree_is_rejected(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.patch(reverse('category-detail', args=[self.parent_category.id]),
+                                     {'parent': self.child_category.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_delete_root_category(self):
         self.client.force_authenticate(user=self.admin_user)
         root_category = Category.objects.create(name="Root Category")
@@ -932,3 +1392,398 @@ class CategoryViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['name'], "Test Filter Category")
+
+    def test_category_tree_is_loaded_with_constant_queries(self):
+        self.client.force_authenticate(user=self.admin_user)
+        parent = self.child_category
+        for i in range(20):
+            parent = Category.objects.create(name=f"Level {i}", parent=parent)
+        Category.objects.create(name="Another Root")
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('category-tree'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([node['name'] for node in response.data], ["Another Root", "Parent Category"])
+        root = response.data[1]
+        self.assertEqual(root['product_count'], 0)
+        self.assertEqual(root['descendant_product_count'], 1)
+        child = root['children'][0]
+        self.assertEqual((child['name'], child['parent_name'], child['product_count']),
+                         ("Child Category", "Parent Category", 1))
+        self.assertEqual(child['children'][0]['name'], "Level 0")
+
+        response = self.client.get(reverse('category-tree') + '?depth=0')
+        self.assertEqual(response.data[1]['children'], [])
+        response = self.client.get(reverse('category-tree') + '?depth=x')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_category_subtree_and_ancestors(self):
+        self.client.force_authenticate(user=self.admin_user)
+        grandchild = Category.objects.create(name="Grandchild Category", parent=self.child_category)
+
+        response = self.client.get(reverse('category-subtree', args=[self.child_category.id]) + '?depth=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['descendant_product_count'], 1)
+        self.assertEqual([node['id'] for node in response.data['children']], [grandchild.id])
+
+        response = self.client.get(reverse('category-ancestors', args=[grandchild.id]))
+        self.assertEqual([node['name'] for node in response.data], ["Parent Category", "Child Category"])
+
+        response = self.client.get(reverse('category-ancestors', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_category_tree_survives_a_parent_cycle(self):
+        self.client.force_authenticate(user=self.admin_user)
+        Category.objects.filter(pk=self.parent_category.pk).update(parent=self.child_category)
+
+        response = self.client.get(reverse('category-subtree', args=[self.parent_category.id]))
+        self.assertEqual(response.data['children'][0]['children'], [])
+        response = self.client.get(reverse('category-ancestors', args=[self.parent_category.id]))
+        self.assertEqual([node['name'] for node in response.data], ["Child Category"])
+
+
+class CachedCatalogListTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.category = Category.objects.create(name="Drinks")
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_category_list_is_cached_until_a_category_changes(self):
+        response = self.client.get(reverse("category-list"))
+        self.assertEqual([c["name"] for c in response.data["results"]], ["Drinks"])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("category-list"))
+        self.assertEqual(response.data["count"], 1)
+
+        Category.objects.create(name="Juices", parent=self.category)
+        response = self.client.get(reverse("category-list"))
+        self.assertEqual(response.data["results"][0]["children"][0]["name"], "Juices")
+        self.assertEqual(response.data["count"], 2)
+
+        response = self.client.get(reverse("category-list") + "?name=Jui")
+        self.assertEqual(response.data["count"], 1)
+
+    def test_voucher_list_is_cached_until_a_voucher_changes(self):
+        voucher = Voucher.objects.create(
+            ean_code="222",
+            expiration_date=timezone.now() + timedelta(days=7),
+            discount_type="Percentage",
+            discount_amount=10.0,
+            title="Test Voucher",
+        )
+        self.assertEqual(self.client.get(reverse("voucher-list")).data["count"], 1)
+        with self.assertNumQueries(0):
+            self.client.get(reverse("voucher-list"))
+
+        voucher.soft_delete()
+        self.assertEqual(self.client.get(reverse("voucher-list")).data["count"], 0)
+
+    def test_choices_are_cached(self):
+        self.client.get(reverse("product-colors"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("product-colors"))
+        self.assertIn({"value": "RED", "label": "Červená"}, response.data["colors"])
+        response = self.client.get(reverse("product-tax-rates"))
+        self.assertIn({"value": "0.21", "label": "21%"}, response.data["tax_rates"])
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.chocolate = self.create_product("Hořká čokoláda 70%", "8594000000111", "Tabulka 100 g")
+        self.milk = self.create_product("Mléko polotučné", "8594000000222", "Čerstvé mléko z Vysočiny")
+        self.cake = self.create_product("Dort", "8594000000333", "S čokoládovou polevou")
+        self.create_product("Stará čokoláda", "8594000000444", "", is_active=False)
+
+    @staticmethod
+    def create_product(name, ean_code, description, is_active=True):
+        return Product.objects.create(
+            name=name, ean_code=ean_code, description=description, is_active=is_active, price_with_vat=10,
+            price_without_vat=8, inventory_count=1, unit="pieces", measurement_of_quantity=1, tax_rate=0.21,
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("product-search"), {"q": query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product["id"] for product in response.data]
+
+    def test_search_ignores_case_and_diacritics(self):
+        self.assertEqual(self.search("CHOKOLADA")[:1], [self.chocolate.id])
+        self.assertEqual(self.search("horka cokolada"), [self.chocolate.id])
+        self.assertEqual(self.search("mleko")[0], self.milk.id)
+
+    def test_search_matches_prefixes_and_typos(self):
+        self.assertEqual(self.search("polot"), [self.milk.id])
+        self.assertEqual(self.search("cokolda")[:1], [self.chocolate.id])
+        self.assertEqual(self.search("xyz"), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("cokolad"), [self.chocolate.id, self.cake.id])
+        self.assertEqual(self.search("cokolad", limit=1), [self.chocolate.id])
+
+    def test_search_by_ean_code(self):
+        self.assertEqual(self.search("8594000000222")[0], self.milk.id)
+        self.assertEqual(self.search("8594-000000-333")[0], self.cake.id)
+
+    def test_search_follows_product_changes(self):
+        self.assertEqual(self.search("jogurt"), [])
+        self.milk.name = "Jogurt bílý"
+        self.milk.save()
+        self.assertEqual(self.search("jogurt"), [self.milk.id])
+        self.milk.soft_delete()
+        self.assertEqual(self.search("jogurt"), [])
+
+    def test_search_validates_parameters(self):
+        self.assertEqual(self.search(""), [])
+        response = self.client.get(reverse("product-search"), {"q": "mleko", "limit": "0"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_imported_and_rebuilt_products_are_searchable(self):
+        Product.objects.filter(pk=self.milk.pk).update(search_text="")
+        out = StringIO()
+        call_command("rebuild_product_search", stdout=out)
+        self.assertIn("1 products changed", out.getvalue())
+        self.assertEqual(self.search("vysociny"), [self.milk.id])
+
+
+class EanLookupViewTests(APITestCase):
+    def setUp(self):
+        ean_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name="Test Product",
+            price_with_vat=12.1,
+            price_without_vat=10.0,
+            inventory_count=10,
+            unit="pieces",
+            measurement_of_quantity=1.0,
+            tax_rate=0.21,
+            ean_code=" 8594-000000012 ",
+        )
+
+    def tearDown(self):
+        ean_cache.clear()
+
+    def test_ean_codes_are_normalized_on_save(self):
+        self.assertEqual(self.product.ean_code, "8594000000012")
+
+    def test_lookup_product_is_cached(self):
+        response = self.client.get(reverse("ean-lookup", args=["8594000000012"]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["type"], "product")
+        self.assertEqual(response.data["id"], self.product.id)
+        self.assertEqual(response.data["name"], "Test Product")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("ean-lookup", args=["8594000000012"]))
+        self.assertEqual(response.data["id"], self.product.id)
+
+    def test_lookup_does_not_cache_the_inventory_count(self):
+        response = self.client.get(reverse("ean-lookup", args=["8594000000012"]))
+
+        self.assertNotIn("inventory_count", response.data)
+
+    def test_misses_expire_sooner_than_hits(self):
+        self.client.get(reverse("ean-lookup", args=["8594000000012"]))
+        self.client.get(reverse("ean-lookup", args=["444"]))
+        # Create the product behind the cache's back, as another process would.
+        Product.objects.filter(pk=self.product.pk).update(ean_code="444")
+
+        with patch("api.product_catalog.ean_lookup.time.monotonic", return_value=time.monotonic() + 10):
+            self.assertEqual(self.client.get(reverse("ean-lookup", args=["444"])).data["id"], self.product.id)
+            self.assertEqual(self.client.get(reverse("ean-lookup", args=["8594000000012"])).status_code, 200)
+
+    def test_lookup_is_invalidated_when_the_ean_code_changes(self):
+        self.assertEqual(self.client.get(reverse("ean-lookup", args=["8594000000012"])).status_code, 200)
+        self.assertEqual(self.client.get(reverse("ean-lookup", args=["111"])).status_code, 404)
+
+        self.product.ean_code = "111"
+        self.product.save()
+
+        self.assertEqual(self.client.get(reverse("ean-lookup", args=["8594000000012"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("ean-lookup", args=["111"])).data["id"], self.product.id)
+
+        self.product.soft_delete()
+        self.assertEqual(self.client.get(reverse("ean-lookup", args=["111"])).status_code, 404)
+
+    def test_lookup_vouchers_and_quick_sales(self):
+        voucher = Voucher.objects.create(
+            ean_code="222",
+            expiration_date=timezone.now() + timedelta(days=7),
+            discount_type="Percentage",
+            discount_amount=10.0,
+            title="Test Voucher",
+        )
+        quick_sale = QuickSale.objects.create(name="Coffee", ean_code="333", price_with_vat=50, tax_rate=0.12)
+
+        response = self.client.get(reverse("ean-lookup", args=["222"]))
+        self.assertEqual((response.data["type"], response.data["id"]), ("voucher", voucher.id))
+        response = self.client.get(reverse("ean-lookup", args=["333"]))
+        self.assertEqual((response.data["type"], response.data["id"]), ("quick_sale", quick_sale.id))
+
+        voucher.soft_delete()
+        self.assertEqual(self.client.get(reverse("ean-lookup", args=["222"])).status_code, 404)
+
+    def test_lookup_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse("ean-lookup", args=["8594000000012"]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_product_filter_matches_normalized_ean_code(self):
+        response = self.client.get(reverse("product-list"), {"ean_code": "8594 0000 00012"})
+        self.assertEqual([product["id"] for product in response.data["results"]], [self.product.id])
+
+
+class AsyncCatalogViewTests(TestCase):
+    """
+    The async catalog views, requested through the ASGI handler with a real JWT.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        cls.category = Category.objects.create(name="Drinks")
+        cls.products = [
+            Product.objects.create(
+                name=f"Product {number}",
+                category=cls.category if number == 0 else None,
+                price_with_vat=12.1,
+                price_without_vat=10.0,
+                inventory_count=10,
+                unit="pieces",
+                measurement_of_quantity=1.0,
+                tax_rate=0.21,
+                ean_code=f"859400000001{number}",
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        ean_cache.clear()
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+
+    def tearDown(self):
+        ean_cache.clear()
+
+    async def test_ean_lookup(self):
+        response = await self.async_client.get(reverse("ean-lookup", args=["8594000000011"]), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.json()["type"], response.json()["id"]), ("product", self.products[1].id))
+
+        response = await self.async_client.get(reverse("ean-lookup", args=["999"]), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_requests_without_a_valid_token_are_rejected(self):
+        response = await self.async_client.get(reverse("ean-lookup", args=["8594000000011"]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await self.async_client.get(
+            reverse("product-list"), headers={"Authorization": "Bearer invalid"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_product_list_is_paginated(self):
+        url = reverse("product-list")
+        response = await self.async_client.get(url, {"page_size": 2}, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(
+            [product["id"] for product in response.json()["results"]],
+            [self.products[2].id, self.products[1].id],
+        )
+
+        response = await self.async_client.get(url, {"page_size": 2, "page": 2}, headers=self.headers)
+        self.assertEqual([product["id"] for product in response.json()["results"]], [self.products[0].id])
+
+        response = await self.async_client.get(url, {"page_size": 2, "page": 3}, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_product_list_with_keyset_pagination(self):
+        url = reverse("product-list")
+        response = await self.async_client.get(url, {"pagination": "keyset", "page_size": 2}, headers=self.headers)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        response = await self.async_client.get(response.json()["next"], headers=self.headers)
+        self.assertEqual([product["id"] for product in response.json()["results"]], [self.products[0].id])
+        self.assertIsNone(response.json()["next"])
+
+    async def test_product_list_is_filtered(self):
+        url = reverse("product-list")
+        response = await self.async_client.get(url, {"category": self.category.id}, headers=self.headers)
+        self.assertEqual([product["id"] for product in response.json()["results"]], [self.products[0].id])
+
+        response = await self.async_client.get(url, {"category": 0}, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_sync_actions_of_the_viewset_still_work(self):
+        response = await self.async_client.get(
+            reverse("product-detail", args=[self.products[0].id]), headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["name"], "Product 0")
+
+    async def test_catalog_export_is_streamed_asynchronously(self):
+        manager = await CustomUser.objects.acreate(username="manager", role="MA", email="manager@example.com")
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(manager).access_token}"}
+
+        with warnings.catch_warnings():
+            warnings.filterwarnings("error", message="StreamingHttpResponse must consume")
+            response = await self.async_client.get(reverse("catalog-export_catalog"), headers=headers)
+            content = b"".join([part async for part in response.streaming_content]).decode("utf-8")
+
+        self.assertTrue(response.is_async)
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0][0], "type")
+        self.assertEqual([row[1] for row in rows if row[0] == "product"], ["Product 0", "Product 1", "Product 2"])
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "Query plans are not supported on this database.")
+class CatalogQueryPlanTests(TestCase):
+    def setUp(self):
+        ean_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        ))
+        Product.objects.create(
+            name="Test Product", price_with_vat=12.1, price_without_vat=10.0, inventory_count=10,
+            unit="pieces", measurement_of_quantity=1.0, tax_rate=0.21,
+        )
+
+    def tearDown(self):
+        ean_cache.clear()
+
+    def test_newest_active_products_use_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("product-list"), {"show_active": "True", "pagination": "keyset"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(captured_sequential_scans(queries.captured_queries, [Product]), [])
+
+    def test_voucher_by_ean_code_uses_index(self):
+        Voucher.objects.create(
+            ean_code="1234567890", expiration_date=timezone.now() + timedelta(days=7),
+            discount_type="Percentage", discount_amount=10.0, title="Test Voucher",
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("ean-lookup", args=["1234567890"]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(captured_sequential_scans(queries.captured_queries, [Product, Voucher]), [])
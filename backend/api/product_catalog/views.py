@@ -1,19 +1,32 @@
-import csv
+import io
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db.models import Q
-from django.http import HttpResponse
-from django.utils.dateparse import parse_datetime
 from django_filters import rest_framework as filters
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
+from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import FileUploadParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from api.common.pagination import CustomPageNumberPagination
+from api.common.async_views import AsyncAPIViewMixin
+from api.common.cache import cached_value
+from api.common.pagination import CustomPageNumberPagination, KeysetPagination
+from api.common.streaming import streaming_response
+from api.product_catalog.catalog_csv import (
+    CATALOG_COLUMNS,
+    IMPORT_BATCH_SIZE,
+    CatalogImporter,
+    gzip_stream,
+    iter_catalog_csv,
+)
+from api.product_catalog.category_tree import get_category_tree
+from api.product_catalog.ean_lookup import alookup_ean
+from api.product_catalog.search import SEARCH_RESULT_LIMIT, search_products
 from api.product_catalog.filters import ProductFilter, CategoryFilter, VoucherFilter
 from api.product_catalog.models import Product, Category, QuickSale, Voucher
 from api.product_catalog.serializers import (
@@ -25,20 +38,25 @@ from api.product_catalog.serializers import (
     TaxRateChoicesSerializer, VoucherSerializer,
 )
 from api.warehouse.models import Stockentry, StockMovementType
-from api.warehouse.serializers import StockentryReadSerializer
+from api.warehouse.serializers import StockMovementSerializer, StockentryReadSerializer
+from api.warehouse.timeline import annotate_running_balance, movement_summary
 from authentication.permissions import IsAdminOrManager, IsAdminOrManagerOrCashier
+from jobs.models import Job
+from jobs.serializers import JobSerializer
+from jobs.views import is_async
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(AsyncAPIViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Product instances.
 
     This ViewSet provides CRUD operations for Products, with custom behavior for
-    creation, updating, and deletion.
+    creation, updating, and deletion. Listing is async; the other actions are sync.
     """
 
     serializer_class = ProductSerializer
     pagination_class = CustomPageNumberPagination
+    keyset_ordering = ("date_created", "id")
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = ProductFilter
     filterset_fields = ["category", "ean_code"]
@@ -68,6 +86,18 @@ class ProductViewSet(viewsets.ModelViewSet):
         else:
             return ProductIDSerializer
 
+    async def list(self, request, *args, **kwargs):
+        """
+        List the products, fetching the count and the page with the async ORM.
+
+        The filters are applied in a thread, because validating the category
+        filters queries the database.
+        """
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def create(self, request, *args, **kwargs):
         """
         Create a new Product instance.
@@ -135,9 +165,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         Get a list of available colors.
         """
-        serializer = ColorChoicesSerializer(data={})
-        serializer.is_valid()
-        return Response(serializer.data)
+        return Response(cached_value("color-choices", self.serialize_choices(ColorChoicesSerializer)))
 
     @swagger_auto_schema(
         method="get",
@@ -153,9 +181,48 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         Get a list of available tax rates.
         """
-        serializer = TaxRateChoicesSerializer(data={})
-        serializer.is_valid()
-        return Response(serializer.data)
+        return Response(cached_value("tax-rate-choices", self.serialize_choices(TaxRateChoicesSerializer)))
+
+    @staticmethod
+    def serialize_choices(serializer_class):
+        """
+        Return a function serializing the choices of a choices serializer.
+
+        Args:
+            serializer_class (type): ColorChoicesSerializer or TaxRateChoicesSerializer.
+
+        Returns:
+            callable: A function returning the serialized choices as a dict.
+        """
+        def serialize():
+            serializer = serializer_class(data={})
+            serializer.is_valid()
+            return dict(serializer.data)
+        return serialize
+
+    @swagger_auto_schema(method="get", manual_parameters=[
+        openapi.Parameter("q", openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                          description="Words of the name, description or EAN code"),
+        openapi.Parameter("limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description=f"Maximum number of results, at most {SEARCH_RESULT_LIMIT * 5}"),
+    ])
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Search the active products, best match first.
+
+        Matching ignores case and diacritics, accepts prefixes of words and
+        tolerates small typos. Name matches rank above description matches and a
+        product whose EAN code equals the query comes first.
+        """
+        try:
+            limit = int(request.query_params.get("limit", SEARCH_RESULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= SEARCH_RESULT_LIMIT * 5:
+            return Response({"error": "Invalid limit."}, status=status.HTTP_400_BAD_REQUEST)
+        products = search_products(request.query_params.get("q", ""), limit)
+        return Response(ProductSerializer(products, many=True, context={"request": request}).data)
 
     @action(detail=False, methods=['get'])
     def latest(self, request):
@@ -174,13 +241,103 @@ class CategoryViewSet(viewsets.ModelViewSet):
     This ViewSet provides CRUD operations for Categories, with custom behavior for deletion.
     """
 
-    queryset = Category.objects.order_by("id")
+    queryset = Category.objects.select_related("parent").order_by("id")
     pagination_class = CustomPageNumberPagination
     serializer_class = CategorySerializer
     filterset_class = CategoryFilter
     swagger_tags = ["Category"]
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        """
+        List the categories with their children.
+
+        The response is cached per query string until a category changes.
+        """
+        data = cached_value(
+            "category-list",
+            lambda: super(CategoryViewSet, self).list(request, *args, **kwargs).data,
+            models=[Category],
+            key_parts=[request.get_full_path()],
+        )
+        return Response(data)
+
+    @staticmethod
+    def parse_depth(request):
+        """
+        Return the ?depth= query parameter as a non-negative integer or None.
+
+        Raises:
+            ValueError: If the parameter is not a non-negative integer.
+        """
+        depth = request.query_params.get("depth")
+        if depth in (None, ""):
+            return None
+        depth = int(depth)
+        if depth < 0:
+            raise ValueError(depth)
+        return depth
+
+    @swagger_auto_schema(method="get", manual_parameters=[
+        openapi.Parameter("depth", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description="Number of levels of children to include"),
+    ])
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        """
+        Get the whole category hierarchy as nested root categories.
+
+        Every node carries its number of active products and the number of active
+        products in its whole subtree. The hierarchy is loaded with one query and
+        cached until a category or product changes.
+        """
+        try:
+            depth = self.parse_depth(request)
+        except ValueError:
+            return Response({"error": "Invalid depth."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_category_tree().serialize_roots(depth))
+
+    @swagger_auto_schema(method="get", manual_parameters=[
+        openapi.Parameter("depth", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description="Number of levels of children to include"),
+    ])
+    @action(detail=True, methods=["get"])
+    def subtree(self, request, pk=None):
+        """
+        Get a category with all its descendants as a nested tree.
+        """
+        try:
+            depth = self.parse_depth(request)
+        except ValueError:
+            return Response({"error": "Invalid depth."}, status=status.HTTP_400_BAD_REQUEST)
+        tree = get_category_tree()
+        category_id = self.tree_category_id(tree, pk)
+        if category_id is None:
+            return Response({"error": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(tree.serialize(category_id, depth))
+
+    @action(detail=True, methods=["get"])
+    def ancestors(self, request, pk=None):
+        """
+        Get the ancestors of a category, starting at its root category.
+        """
+        tree = get_category_tree()
+        category_id = self.tree_category_id(tree, pk)
+        if category_id is None:
+            return Response({"error": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(tree.serialize_ancestors(category_id))
+
+    @staticmethod
+    def tree_category_id(tree, pk):
+        """
+        Return the primary key from the URL as an id of the tree, or None if the tree does not contain it.
+        """
+        try:
+            category_id = int(pk)
+        except (TypeError, ValueError):
+            return None
+        return category_id if category_id in tree else None
+
     def destroy(self, request, *args, **kwargs):
         """
         Delete a Category instance.
@@ -188,22 +345,33 @@ class CategoryViewSet(viewsets.ModelViewSet):
         This method moves subcategories and products to the parent category before deletion.
         """
         instance = self.get_object()
-        parent = instance.parent
-
-        # move subcategories to parent category
-        for subcategory in Category.objects.filter(parent=instance):
-            subcategory.parent = parent
-            subcategory.save()
-
-        # move products to parent category
-        for product in instance.product_set.all():
-            product.category = parent
-            product.save()
+        Category.objects.delete_and_reparent(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        # delete the category
-        instance.delete()
+    @swagger_auto_schema(method="post", request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=["target"],
+        properties={"target": openapi.Schema(type=openapi.TYPE_INTEGER, description="ID of the category to merge into")},
+    ))
+    @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated, IsAdminOrManager])
+    def merge(self, request, pk=None):
+        """
+        Merge the category into another one.
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        The subcategories and products of the category are moved to the target and
+        the category is deleted. The response contains the number of moved
+        categories and products.
+        """
+        source = self.get_object()
+        try:
+            target = Category.objects.get(pk=int(request.data.get("target")))
+        except (TypeError, ValueError, Category.DoesNotExist):
+            return Response({"error": "Invalid target category."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            counts = Category.objects.merge(source, target)
+        except DjangoValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"target": target.pk, **counts})
 
 
 class QuickSaleViewSet(viewsets.ModelViewSet):
@@ -272,6 +440,20 @@ class VoucherViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated, IsAdminOrManagerOrCashier]
         return [permission() for permission in permission_classes]
 
+    def list(self, request, *args, **kwargs):
+        """
+        List the non-deleted vouchers.
+
+        The response is cached per query string until a voucher changes.
+        """
+        data = cached_value(
+            "voucher-list",
+            lambda: super(VoucherViewSet, self).list(request, *args, **kwargs).data,
+            models=[Voucher],
+            key_parts=[request.get_full_path()],
+        )
+        return Response(data)
+
     def create(self, request, *args, **kwargs):
         """
         Create a new Voucher instance.
@@ -344,129 +526,87 @@ class CatalogViewSet(viewsets.ViewSet):
     def import_catalog(self, request):
         """
         Import a catalog from a CSV file.
+
+        The file is streamed through CatalogImporter. Products and vouchers whose EAN
+        code already exists are updated. If any row is invalid nothing is imported and
+        the response lists the errors per row. With ?dry_run=true the import is only
+        validated and rolled back. ?batch_size= sets the number of rows written per query.
         """
-        file = request.FILES['file']
-        data = csv.reader(file.read().decode('utf-8').splitlines())
-        header = next(data)  # Read the header row
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({"error": "No file was uploaded."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            is_active_index = header.index('is_active')
+            batch_size = int(request.query_params.get('batch_size', IMPORT_BATCH_SIZE))
         except ValueError:
-            is_active_index = None  # 'is_active' column not found
-
-        for row in data:
-            model_type, *fields = row
-            if model_type == 'category':
-                name, parent_name = fields[:2]
-                parent = None
-                if parent_name:
-                    parent, _ = Category.objects.get_or_create(name=parent_name)
-                Category.objects.create(name=name, parent=parent)
-            elif model_type == 'product':
-                name, category_name, price_with_vat, price_without_vat, inventory_count, measurement_of_quantity, unit, ean_code, color, description, tax_rate, *extra_fields = fields
-
-                is_active = True
-                if is_active_index is not None and len(fields) >= is_active_index:
-                    is_active_value = fields[is_active_index - 1].lower()
-                    is_active = is_active_value == 'true'
-
-                category, _ = Category.objects.get_or_create(name=category_name)
-                try:
-                    Product.objects.create(
-                        name=name,
-                        category=category,
-                        price_with_vat=float(price_with_vat),
-                        price_without_vat=float(price_without_vat),
-                        inventory_count=int(inventory_count),
-                        measurement_of_quantity=float(measurement_of_quantity),
-                        unit=unit,
-                        ean_code=ean_code if ean_code else None,
-                        color=color if color else None,
-                        description=description if description else None,
-                        tax_rate=float(tax_rate),
-                        is_active=is_active
-                    )
-                except ValidationError as e:
-                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            elif model_type == 'voucher':
-                ean_code, expiration_date, discount_type, discount_amount, is_active, description, title = fields
-                Voucher.objects.create(
-                    ean_code=ean_code,
-                    expiration_date=parse_datetime(expiration_date),
-                    discount_type=discount_type,
-                    discount_amount=float(discount_amount),
-                    is_active=is_active.lower() == 'true',
-                    description=description if description else None,
-                    title=title
-                )
-        return Response({"status": "Catalog imported successfully"}, status=status.HTTP_201_CREATED)
+            batch_size = 0
+        if batch_size <= 0:
+            return Response({"error": "Invalid batch_size."}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true')
 
+        if is_async(request):
+            job = Job.objects.enqueue('catalog_import', {'batch_size': batch_size, 'dry_run': dry_run},
+                                      user=request.user, input_file=file)
+            return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+        lines = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        try:
+            report = CatalogImporter(batch_size=batch_size, dry_run=dry_run).run(lines)
+        except UnicodeDecodeError:
+            return Response({"error": "The file must be UTF-8 encoded."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['error_count']:
+            return Response({"error": "The catalog contains invalid rows.", **report},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if dry_run:
+            return Response({"status": "Catalog is valid", **report}, status=status.HTTP_200_OK)
+        return Response({"status": "Catalog imported successfully", **report}, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(method="get", manual_parameters=[
+        openapi.Parameter("columns", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="Comma separated subset of the columns to export"),
+        openapi.Parameter("compress", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=["gzip"],
+                          description="Compress the exported file"),
+    ])
     @action(detail=False, methods=["get"])
     def export_catalog(self, request):
         """
         Export the catalog to a CSV file.
 
-        This method generates a CSV file containing all categories, active products,
-        and non-deleted vouchers in the catalog.
+        This method streams a CSV file containing all categories, active products,
+        and non-deleted vouchers in the catalog. The rows are read from the database
+        in chunks while the response is being sent, so the memory use does not depend
+        on the size of the catalog. With ?async=true the file is written by a
+        background job instead, and the queued job is returned with status 202; the
+        file is then downloaded from the job's result URL.
 
         Returns:
-            HttpResponse: A response containing the CSV file for download.
-        """
-        categories = Category.objects.all()
-        products = Product.objects.filter(is_active=True)
-        vouchers = Voucher.objects.filter(is_deleted=False)
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="catalog.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['type', 'name', 'category', 'price_with_vat', 'price_without_vat', 'inventory_count',
-                         'measurement_of_quantity', 'unit', 'ean_code', 'color', 'description', 'tax_rate', 'parent',
-                         'is_active', 'expiration_date', 'discount_type', 'discount_amount', 'title'])
-
-        for category in categories:
-            parent_name = category.parent.name if category.parent else ""
-            writer.writerow(['category', category.name, "", "", "", "", "", "", "", "", "", "", parent_name, ""])
-
-        for product in products:
-            color = product.color if product.color else "RED"
-            inventory_count = product.inventory_count if product.inventory_count is not None else 0
-            writer.writerow([
-                'product',
-                product.name,
-                product.category.name,
-                product.price_with_vat,
-                product.price_without_vat,
-                inventory_count,
-                product.measurement_of_quantity,
-                product.unit,
-                product.ean_code,
-                color,
-                product.description,
-                product.tax_rate,
-                "",
-                str(product.is_active),
-                "", "", "", ""  # Empty fields for voucher-specific data
-            ])
-
-        for voucher in vouchers:
-            writer.writerow([
-                'voucher',
-                "",  # Empty name field
-                "",  # Empty category field
-                "", "", "", "", "",  # Empty product-specific fields
-                voucher.ean_code,
-                "",  # Empty color field
-                voucher.description,
-                "",  # Empty tax_rate field
-                "",  # Empty parent field
-                str(voucher.is_active),
-                voucher.expiration_date.isoformat(),
-                voucher.discount_type,
-                voucher.discount_amount,
-                voucher.title
-            ])
-
+            StreamingHttpResponse: A response streaming the CSV file for download.
+        """
+        columns = None
+        if request.query_params.get('columns'):
+            columns = [column.strip() for column in request.query_params['columns'].split(',') if column.strip()]
+            unknown = [column for column in columns if column not in CATALOG_COLUMNS]
+            if unknown:
+                return Response({"error": f"Unknown columns: {', '.join(unknown)}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        compress = request.query_params.get('compress')
+        if compress not in (None, '', 'gzip'):
+            return Response({"error": "Invalid compress value. Use gzip."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if is_async(request):
+            job = Job.objects.enqueue('catalog_export', {'columns': columns, 'compress': compress},
+                                      user=request.user)
+            return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+        lines = iter_catalog_csv(columns)
+        if compress == 'gzip':
+            response = streaming_response(request, gzip_stream(lines), content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="catalog.csv.gz"'
+        else:
+            response = streaming_response(request, lines, content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="catalog.csv"'
         return response
 
 
@@ -491,7 +631,7 @@ class ProductStockEntryHistoryView(generics.GenericAPIView):
         Returns:
             Response: A response containing the serialized stock entry data or None if no entry exists.
         """
-        stock_entry = Stockentry.objects.filter(
+        stock_entry = Stockentry.objects.select_related("product", "supplier").filter(
             product_id=product_id,
             movement_type=StockMovementType.INCOMING
         ).order_by('-date_created').first()  # Fetch the latest entry only
@@ -501,3 +641,85 @@ class ProductStockEntryHistoryView(generics.GenericAPIView):
             return Response(serializer.data)
         else:
             return Response(None)
+
+
+class ProductStockTimelineView(generics.GenericAPIView):
+    """
+    API view for retrieving the full stock movement timeline of a product.
+
+    The entries are returned newest first with keyset pagination, each with the
+    ledger balance after it, together with aggregates of the whole ledger of the
+    product. A page costs a few queries however long the history is: the entries
+    with their supplier joined, and the balance before the page and the summary
+    from the stock snapshots plus the entries made since.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = StockMovementSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ("date_created", "id")
+    swagger_tags = ["Stockentry"]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="The cursor of the page, from the next or previous link"),
+        openapi.Parameter("page_size", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description="Number of entries per page"),
+    ])
+    def get(self, request, product_id):
+        """
+        Retrieve a page of the stock timeline of a product with its summary.
+
+        Args:
+            request (Request): The HTTP request object.
+            product_id (int): The ID of the product.
+
+        Returns:
+            Response: The product, the summary of its ledger and the paginated entries with running balances.
+        """
+        product = get_object_or_404(
+            Product.objects.only("id", "name", "inventory_count", "average_price"), pk=product_id
+        )
+        entries = Stockentry.objects.filter(product_id=product.pk).select_related("supplier").only(
+            "id", "product", "date_created", "movement_type", "quantity", "import_price",
+            "import_history", "supplier__name",
+        )
+        page = annotate_running_balance(self.paginate_queryset(entries))
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data = {
+            "product": {"id": product.pk, "name": product.name},
+            "summary": movement_summary(product),
+            **response.data,
+        }
+        return response
+
+
+class EanLookupView(AsyncAPIViewMixin, generics.GenericAPIView):
+    """
+    Async API view for looking up a scanned EAN code.
+
+    The code is matched against products, vouchers and quick sales and the result
+    is answered from a process-local cache when possible, so a scan at the till
+    usually costs no database query at all.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(responses={200: "The matched object with its type", 404: "No object has the EAN code"})
+    async def get(self, request, ean_code):
+        """
+        Retrieve the product, voucher or quick sale with an EAN code.
+
+        Args:
+            request (Request): The HTTP request object.
+            ean_code (str): The scanned EAN code.
+
+        Returns:
+            Response: A lean representation of the matched object, with a "type" of
+                "product", "voucher" or "quick_sale", or 404 if nothing matched.
+        """
+        result = await alookup_ean(ean_code)
+        if result is None:
+            return Response({"error": "No product, voucher or quick sale with this EAN code."},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(result)
@@ -28,6 +28,10 @@ class Sale(models.Model):
     class Meta:
         verbose_name = "Sale"
         verbose_name_plural = "Sales"
+        indexes = [
+            models.Index(fields=["date_created", "id"], name="sale_created_idx"),
+            models.Index(fields=["cashier", "date_created"], name="sale_cashier_created_idx"),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -84,6 +88,9 @@ class Payment(models.Model):
     class Meta:
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
+        indexes = [
+            models.Index(fields=["sale_id", "payment_type"], name="payment_sale_type_idx"),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -1,5 +1,6 @@
+from django.db import transaction
 from rest_framework import serializers
-from api.warehouse.models import StockMovementType, Stockentry
+from api.warehouse.ledger import record_outgoing_movements
 from .models import Sale, SaleItem, Payment
 
 
@@ -54,7 +55,7 @@ class SaleSerializer(serializers.ModelSerializer):
         Returns:
             list: A list of serialized SaleItem instances.
         """
-        items = SaleItem.objects.filter(sale=obj)
+        items = SaleItem.objects.filter(sale=obj).select_related("product")
         return SaleItemSerializer(items, many=True).data
 
     @staticmethod
@@ -77,39 +78,75 @@ class SaleSerializer(serializers.ModelSerializer):
         """
         Create a new Sale instance along with associated SaleItems, Stockentries, and Payment.
 
+        The sale items, the outgoing stock entries and the inventory decrements are
+        written with a fixed number of bulk statements inside one transaction,
+        regardless of the number of lines in the basket.
+
         Args:
             validated_data (dict): The validated data for creating the Sale.
 
         Returns:
             Sale: The created Sale instance.
         """
-        sale = Sale.objects.create(**validated_data)
-
         items_data = self.initial_data.get("items", [])
-        for item_data in items_data:
-            product_id = item_data["product_id"]
-            quantity = item_data["quantity"]
-            price = item_data["price"]
+        payment_data = self.initial_data.get("payment")
+
+        with transaction.atomic():
+            sale = Sale.objects.create(**validated_data)
 
-            SaleItem.objects.create(
-                sale=sale, product_id=product_id, quantity=quantity, price=price
-            )
+            sale_items = [
+                SaleItem(
+                    sale=sale,
+                    product_id=item_data["product_id"],
+                    quantity=item_data["quantity"],
+                    price=item_data["price"],
+                )
+                for item_data in items_data
+            ]
+            SaleItem.objects.bulk_create(sale_items)
 
             # Create stock entry for each sale item
-            Stockentry.objects.create(
-                product_id=product_id,
-                quantity=quantity,
-                movement_type=StockMovementType.OUTGOING,
-                supplier=None,
-            )
+            record_outgoing_movements((item.product_id, item.quantity) for item in sale_items)
 
-        payment_data = self.initial_data.get("payment")
-        if payment_data:
-            Payment.objects.create(sale_id=sale, **payment_data)
+            if payment_data:
+                Payment.objects.create(sale_id=sale, **payment_data)
 
         return sale
 
 
+class SaleReadSerializer(serializers.ModelSerializer):
+    """
+    Read-only serializer for listing and retrieving Sale instances.
+
+    Items and payments are read from the related managers, so a queryset built with
+    SaleViewSet's prefetches serializes a whole page with a constant number of queries.
+    """
+
+    items = SaleItemSerializer(source="saleitem_set", many=True, read_only=True)
+    payment = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Sale
+        fields = ["id", "date_created", "cashier", "total_amount", "items", "payment"]
+        read_only_fields = fields
+
+    @staticmethod
+    def get_payment(obj):
+        """
+        Get the payment associated with this sale.
+
+        Args:
+            obj (Sale): The Sale instance.
+
+        Returns:
+            dict: The serialized Payment instance, or None if no payment exists.
+        """
+        payments = list(obj.payment_set.all())
+        if payments:
+            return PaymentSerializer(payments[0]).data
+        return None
+
+
 class TipSerializer(serializers.Serializer):
     """
     Serializer for handling tip data.
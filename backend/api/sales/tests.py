@@ -1,6 +1,14 @@
+import threading
+
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from unittest import skipUnless
+
+from api.common.query_plans import SUPPORTED_VENDORS, captured_sequential_scans
 from api.warehouse.models import StockMovementType, Stockentry
 from api.product_catalog.models import Product, Category, Voucher
 from .models import Sale, SaleItem, Payment
@@ -87,6 +95,54 @@ class SaleViewSetTests(APITestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.inventory_count, 8)
 
+    def test_create_sale_with_multiple_lines(self):
+        self.client.force_authenticate(user=self.ca_user)
+        other_product = Product.objects.create(
+            name="Other Product",
+            price_with_vat=5.6,
+            price_without_vat=5.0,
+            tax_rate=0.12,
+            inventory_count=None,
+            measurement_of_quantity=1,
+            category=self.category,
+        )
+        self.sale_data["items"] = self.create_sale_items(2) + self.create_sale_items(3) + [
+            {"product_id": other_product.id, "quantity": 4, "price": 5.6}
+        ]
+        self.sale_data["cashier"] = self.ca_user.id
+        response = self.client.post(reverse("sale-list"), self.sale_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(SaleItem.objects.count(), 3)
+        self.assertEqual(Stockentry.objects.filter(movement_type=StockMovementType.OUTGOING).count(), 3)
+        self.assertEqual(
+            sorted(Stockentry.objects.values_list("quantity", flat=True)), [2, 3, 4]
+        )
+
+        self.product.refresh_from_db()
+        other_product.refresh_from_db()
+        self.assertEqual(self.product.inventory_count, 5)
+        self.assertEqual(other_product.inventory_count, -4)
+
+    def test_create_sale_query_count_does_not_depend_on_basket_size(self):
+        self.client.force_authenticate(user=self.ca_user)
+        self.sale_data["cashier"] = self.ca_user.id
+
+        self.sale_data["items"] = self.create_sale_items(1)
+        with CaptureQueriesContext(connection) as small_basket:
+            response = self.client.post(reverse("sale-list"), self.sale_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.sale_data["items"] = self.create_sale_items(1) * 40
+        with CaptureQueriesContext(connection) as large_basket:
+            response = self.client.post(reverse("sale-list"), self.sale_data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        writes = [q for q in large_basket.captured_queries if not q["sql"].startswith("SELECT")]
+        small_writes = [q for q in small_basket.captured_queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(len(writes), len(small_writes))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory_count, 10 - 1 - 40)
+
     def test_create_sale_with_unauthenticated_user(self):
         self.sale_data["items"] = self.create_sale_items(2)
         response = self.client.post(reverse("sale-list"), self.sale_data, format="json")
@@ -300,6 +356,63 @@ class SaleViewSetTests(APITestCase):
         self.assertEqual(decimal.Decimal(response.data['results'][0]['total_amount']), decimal.Decimal('22.4'))
         self.assertEqual(decimal.Decimal(response.data['results'][1]['total_amount']), decimal.Decimal('44.8'))
 
+    def test_keyset_pagination_follows_supported_ordering(self):
+        self.client.force_authenticate(user=self.admin_user)
+        Sale.objects.all().delete()
+        older = Sale.objects.create(cashier=self.ca_user, total_amount=22.4)
+        newer = Sale.objects.create(cashier=self.ca_user, total_amount=44.8)
+        Sale.objects.filter(pk=older.pk).update(date_created=timezone.now() - timedelta(days=1))
+
+        response = self.client.get(reverse("sale-list"), {"pagination": "keyset", "ordering": "date_created"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([sale["id"] for sale in response.data["results"]], [older.id, newer.id])
+
+    def test_keyset_pagination_rejects_other_ordering(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.get(reverse("sale-list"), {"pagination": "keyset", "ordering": "total_amount"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ordering", response.data)
+
+    def test_list_sales_query_count_does_not_depend_on_page_size(self):
+        self.client.force_authenticate(user=self.admin_user)
+        other_product = Product.objects.create(
+            name="Other Product",
+            price_with_vat=5.6,
+            price_without_vat=5.0,
+            tax_rate=0.12,
+            inventory_count=10,
+            measurement_of_quantity=1,
+            category=self.category,
+        )
+
+        def create_sale():
+            sale = Sale.objects.create(cashier=self.ca_user, total_amount=28.0)
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=2, price=11.2)
+            SaleItem.objects.create(sale=sale, product=other_product, quantity=1, price=5.6)
+            Payment.objects.create(sale_id=sale, payment_type="Card")
+
+        create_sale()
+        with CaptureQueriesContext(connection) as single_sale:
+            response = self.client.get(reverse("sale-list"), {"page_size": 1000}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for _ in range(20):
+            create_sale()
+        with self.assertNumQueries(len(single_sale.captured_queries)):
+            response = self.client.get(reverse("sale-list"), {"page_size": 1000}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 21)
+
+        sale_data = response.data["results"][0]
+        self.assertEqual(
+            [(item["product_name"], item["quantity"]) for item in sale_data["items"]],
+            [("Test Product", 2), ("Other Product", 1)],
+        )
+        self.assertEqual(sale_data["payment"], {"payment_type": "Card"})
+
     def test_set_tip_valid(self):
         self.client.force_authenticate(user=self.ca_user)
         sale = Sale.objects.create(
@@ -319,3 +432,78 @@ class SaleViewSetTests(APITestCase):
         )
         response = self.client.post(reverse('sale-set-tip', args=[sale.id]), {"tip": -5.0}, format="json")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    checkouts = 10
+
+    def setUp(self):
+        self.ca_user = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        self.category = Category.objects.create(name="Test Category")
+        self.products = [
+            Product.objects.create(
+                name=f"Test Product {index}",
+                price_with_vat=11.2,
+                price_without_vat=10.0,
+                tax_rate=0.12,
+                inventory_count=100,
+                measurement_of_quantity=2,
+                category=self.category,
+            )
+            for index in range(2)
+        ]
+
+    def checkout(self, barrier, products, results):
+        client = APIClient()
+        client.force_authenticate(user=self.ca_user)
+        data = {
+            "cashier": self.ca_user.id,
+            "total_amount": 44.8,
+            "payment": {"payment_type": "Cash"},
+            "items": [{"product_id": product.id, "quantity": 2, "price": 11.2} for product in products],
+        }
+        try:
+            barrier.wait()
+            results.append(client.post(reverse("sale-list"), data, format="json").status_code)
+        finally:
+            connection.close()
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_concurrent_checkouts_of_the_same_products(self):
+        barrier = threading.Barrier(self.checkouts)
+        results = []
+        threads = []
+        for index in range(self.checkouts):
+            # Half of the baskets list the products in reverse order to provoke lock ordering issues.
+            products = self.products if index % 2 else list(reversed(self.products))
+            threads.append(threading.Thread(target=self.checkout, args=(barrier, products, results)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [status.HTTP_201_CREATED] * self.checkouts)
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.inventory_count, 100 - 2 * self.checkouts)
+        self.assertEqual(Stockentry.objects.count(), 2 * self.checkouts)
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "Query plans are not supported on this database.")
+class SaleQueryPlanTests(TestCase):
+    def setUp(self):
+        self.cashier = CustomUser.objects.create_user(
+            username="cashier", password="cashierpassword", role="CA", email="cashier@example.com"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.cashier)
+        Sale.objects.create(cashier=self.cashier, total_amount=10)
+
+    def test_latest_sales_use_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("sale-list"), {"pagination": "keyset"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(captured_sequential_scans(queries.captured_queries, [Sale, SaleItem, Payment]), [])
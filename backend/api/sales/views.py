@@ -4,9 +4,10 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters import rest_framework as filters
+from django.db.models import Prefetch
 from django.utils import timezone
-from .models import Sale, Payment
-from .serializers import SaleSerializer, TipSerializer
+from .models import Sale, SaleItem, Payment
+from .serializers import SaleReadSerializer, SaleSerializer, TipSerializer
 from .filters import SaleFilter
 from ..product_catalog.models import Voucher
 from api.common.pagination import CustomPageNumberPagination
@@ -24,11 +25,42 @@ class SaleViewSet(viewsets.ModelViewSet):
     queryset = Sale.objects.order_by("-date_created")
     serializer_class = SaleSerializer
     pagination_class = CustomPageNumberPagination
+    keyset_ordering = ("date_created", "id")
     filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
     filterset_class = SaleFilter
     ordering_fields = ['date_created', 'total_amount']
     permission_classes = [IsAuthenticated, IsAdminOrManagerOrCashier]
 
+    def get_queryset(self):
+        """
+        Get the list of sales for this view.
+
+        For list and retrieve actions the sale items (with their product names) and
+        payments are prefetched, so a page of sales costs a constant number of queries.
+        """
+        queryset = super().get_queryset()
+        if self.action in ["list", "retrieve"]:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "saleitem_set",
+                    queryset=SaleItem.objects.select_related("product")
+                    .only("id", "sale_id", "quantity", "price", "product__id", "product__name")
+                    .order_by("id"),
+                ),
+                Prefetch("payment_set", queryset=Payment.objects.order_by("id")),
+            )
+        return queryset
+
+    def get_serializer_class(self):
+        """
+        Return the class to use for the serializer.
+
+        Uses the read-only serializer for list and retrieve actions.
+        """
+        if self.action in ["list", "retrieve"]:
+            return SaleReadSerializer
+        return SaleSerializer
+
     def create(self, request, *args, **kwargs):
         """
         Create a new Sale instance.
@@ -6,9 +6,16 @@ from api.daily_closure.views import DailySummaryViewSet, WithdrawalViewSet
 from api.product_catalog.views import (
     ProductViewSet,
     CategoryViewSet,
-    QuickSaleViewSet, VoucherViewSet, CatalogViewSet, ProductStockEntryHistoryView,
+    QuickSaleViewSet, VoucherViewSet, CatalogViewSet, ProductStockEntryHistoryView, EanLookupView,
+    ProductStockTimelineView,
+)
+from api.warehouse.views import (
+    InventoryValuationView,
+    ReorderSuggestionView,
+    StockImportViewSet,
+    SupplierViewSet,
+    StockentryViewSet,
 )
-from api.warehouse.views import StockImportViewSet, SupplierViewSet, StockentryViewSet
 from api.invoices.views import InvoiceViewSet
 from api.sales.views import SaleViewSet
 
@@ -35,8 +42,14 @@ urlpatterns = [
     path('catalog/import_catalog/', catalog_list, name='catalog-import_catalog'),
     path('catalog/export_catalog/', catalog_list, name='catalog-export_catalog'),
     path('product/<int:product_id>/stock-entry-history/', ProductStockEntryHistoryView.as_view(), name='product-stock-entry-history'),
+    path('product/<int:product_id>/stock-timeline/', ProductStockTimelineView.as_view(), name='product-stock-timeline'),
+    path('ean/<str:ean_code>/', EanLookupView.as_view(), name='ean-lookup'),
+    path('stock-valuation/', InventoryValuationView.as_view(), name='stock-valuation'),
+    path('reorder-suggestions/', ReorderSuggestionView.as_view(), name='reorder-suggestions'),
     path('daily_closure/calculate/', DailySummaryViewSet.as_view({'post': 'calculate_daily_summary'}),
          name='dailysummary-calculate-daily-summary'),
     path('daily_closure/summaries/', DailySummaryViewSet.as_view({'get': 'list_daily_summaries'}),
          name='dailysummary-list-daily-summaries'),
+    path('daily_closure/store/', DailySummaryViewSet.as_view({'get': 'store_daily_summary'}),
+         name='dailysummary-store-daily-summary'),
 ]
@@ -0,0 +1,247 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.common.cache import bump_model_versions_on_commit
+from api.product_catalog.models import Product, invalidate_ean_lookup
+from api.warehouse.models import Stockentry, StockMovementType
+
+
+def net_inventory_changes(entries):
+    """
+    Sum the signed inventory change of each product over a batch of stock entries.
+
+    Incoming entries increase the inventory count, outgoing entries decrease it.
+
+    Args:
+        entries (iterable): Stockentry instances (saved or not).
+
+    Returns:
+        dict: A mapping of product ID to the net inventory change.
+    """
+    changes = defaultdict(int)
+    for entry in entries:
+        if entry.movement_type == StockMovementType.INCOMING:
+            changes[entry.product_id] += entry.quantity
+        elif entry.movement_type == StockMovementType.OUTGOING:
+            changes[entry.product_id] -= entry.quantity
+    return dict(changes)
+
+
+def lock_products(product_ids):
+    """
+    Lock the rows of the given products until the end of the current transaction.
+
+    The rows are always locked in primary key order, so two transactions touching
+    an overlapping set of products cannot deadlock on each other. The lock is FOR
+    NO KEY UPDATE: the rows referencing the products inserted earlier in the
+    transaction (sale items, stock entries) hold FOR KEY SHARE on them, which a
+    FOR UPDATE lock would conflict with. On databases without SELECT ... FOR
+    UPDATE support this is a plain query.
+
+    Args:
+        product_ids (iterable): The IDs of the products to lock.
+
+    Returns:
+        list: The IDs of the locked products.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return []
+    return list(
+        Product.objects.select_for_update(no_key=True)
+        .filter(pk__in=product_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def apply_inventory_changes(changes):
+    """
+    Apply inventory changes to several products in a single UPDATE statement.
+
+    The new count is computed by the database from the current column value, so
+    concurrent sales of the same product never overwrite each other's decrements.
+    A missing inventory count is treated as zero, the same way the Stockentry
+    signal receivers treat it. Must be called inside a transaction; the affected
+    rows are locked in primary key order first.
+
+    Args:
+        changes (dict): A mapping of product ID to the net inventory change.
+
+    Returns:
+        int: The number of updated products.
+    """
+    changes = {product_id: delta for product_id, delta in changes.items() if delta}
+    if not changes:
+        return 0
+
+    lock_products(changes.keys())
+    delta = Case(
+        *[When(pk=product_id, then=Value(change)) for product_id, change in changes.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return Product.objects.filter(pk__in=changes.keys()).update(
+        inventory_count=Coalesce(F("inventory_count"), Value(0)) + delta,
+        date_updated=timezone.now(),
+    )
+
+
+def apply_incoming_totals(entries, sign=1):
+    """
+    Update the running incoming totals and the weighted average price of products.
+
+    Every product keeps the total quantity of its incoming stock and the total cost
+    of its priced incoming stock, so the average price is maintained in constant
+    time per movement instead of being re-aggregated over the whole history.
+    As before, the average price only changes when a priced entry is applied.
+    The products are locked like in lock_products(). Must be called inside a
+    transaction.
+
+    Args:
+        entries (iterable): Stockentry instances; outgoing entries are ignored.
+        sign (int): 1 to apply the entries, -1 to revert them.
+
+    Returns:
+        int: The number of updated products.
+    """
+    totals = {}
+    for entry in entries:
+        if entry.movement_type != StockMovementType.INCOMING:
+            continue
+        quantity, cost, priced = totals.get(entry.product_id, (0, Decimal(0), False))
+        quantity += sign * entry.quantity
+        if entry.import_price is not None:
+            cost += sign * entry.quantity * Decimal(str(entry.import_price))
+            priced = True
+        totals[entry.product_id] = (quantity, cost, priced)
+    if not totals:
+        return 0
+
+    products = list(
+        Product.objects.select_for_update(no_key=True)
+        .filter(pk__in=totals.keys())
+        .order_by("pk")
+        .only("pk", "incoming_quantity_total", "incoming_cost_total", "average_price")
+    )
+    for product in products:
+        quantity, cost, priced = totals[product.pk]
+        product.incoming_quantity_total += quantity
+        product.incoming_cost_total += cost
+        if priced:
+            product.average_price = (
+                product.incoming_cost_total / product.incoming_quantity_total
+                if product.incoming_quantity_total > 0 else 0
+            )
+    Product.objects.bulk_update(products, ["incoming_quantity_total", "incoming_cost_total", "average_price"])
+    return len(products)
+
+
+def apply_import_prices(prices):
+    """
+    Set the selling prices of several products from a delivery note.
+
+    The price without VAT is derived from the tax rate of each product. The
+    products are read with one query and written with one bulk UPDATE; as that
+    bypasses Product.save() and its signals, the EAN lookup entries and the
+    cached catalog values of the products are invalidated here. Must be called
+    inside a transaction.
+
+    Args:
+        prices (dict): A mapping of product ID to the new price with VAT.
+
+    Returns:
+        int: The number of updated products.
+    """
+    if not prices:
+        return 0
+
+    now = timezone.now()
+    products = list(Product.objects.filter(pk__in=prices.keys()).only("pk", "tax_rate", "ean_code"))
+    for product in products:
+        price_with_vat = Decimal(str(prices[product.pk]))
+        product.price_with_vat = price_with_vat
+        product.price_without_vat = (price_with_vat / (1 + product.tax_rate)).quantize(
+            Decimal("0.01"), rounding=ROUND_HALF_UP
+        )
+        product.date_updated = now
+    Product.objects.bulk_update(products, ["price_with_vat", "price_without_vat", "date_updated"])
+
+    for product in products:
+        invalidate_ean_lookup(Product, product)
+    bump_model_versions_on_commit(Product)
+    return len(products)
+
+
+def record_incoming_movements(lines, stock_import=None, supplier=None):
+    """
+    Write incoming stock entries for a batch of delivered products.
+
+    All entries are inserted with one bulk INSERT, the inventory of every
+    affected product is incremented with one UPDATE and the incoming totals and
+    average prices are written with one bulk UPDATE, so the number of queries
+    does not depend on the number of lines. The caller is responsible for
+    wrapping the call in a transaction.
+
+    Args:
+        lines (iterable): Triples of (product_id, quantity, import_price).
+        stock_import (StockImport): The import the entries belong to, if any.
+        supplier (Supplier): The supplier of the delivery, if any.
+
+    Returns:
+        list: The created Stockentry instances.
+    """
+    entries = [
+        Stockentry(
+            product_id=product_id,
+            quantity=quantity,
+            movement_type=StockMovementType.INCOMING,
+            import_history=stock_import,
+            supplier=supplier,
+            import_price=import_price,
+        )
+        for product_id, quantity, import_price in lines
+    ]
+    if not entries:
+        return entries
+
+    Stockentry.objects.bulk_create(entries)
+    apply_inventory_changes(net_inventory_changes(entries))
+    apply_incoming_totals(entries)
+    return entries
+
+
+def record_outgoing_movements(lines):
+    """
+    Write outgoing stock entries for a batch of sold products.
+
+    All entries are inserted with one bulk INSERT and the inventory of every
+    affected product is decremented with one UPDATE, so the number of queries
+    does not depend on the number of lines. The caller is responsible for
+    wrapping the call in a transaction.
+
+    Args:
+        lines (iterable): Pairs of (product_id, quantity).
+
+    Returns:
+        list: The created Stockentry instances.
+    """
+    entries = [
+        Stockentry(
+            product_id=product_id,
+            quantity=quantity,
+            movement_type=StockMovementType.OUTGOING,
+            supplier=None,
+        )
+        for product_id, quantity in lines
+    ]
+    if not entries:
+        return entries
+
+    Stockentry.objects.bulk_create(entries)
+    apply_inventory_changes(net_inventory_changes(entries))
+    return entries
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.warehouse.models import SnapshotGranularity, StockSnapshot
+from api.warehouse.snapshots import build_stock_snapshots
+
+
+class Command(BaseCommand):
+    """
+    Management command to take the missing stock snapshots of all periods that have ended.
+
+    The snapshots let inventory-at-date queries read the totals at the latest period
+    end and sum only the entries made since, instead of scanning the whole ledger.
+    Run it periodically, e.g. daily from cron or as the build_stock_snapshots job;
+    each run only takes the periods that ended since the previous one.
+    """
+
+    help = "Take the daily or monthly stock snapshots used by the inventory-at-date queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--granularity",
+            choices=SnapshotGranularity.values,
+            default=SnapshotGranularity.DAY,
+            help="The length of the snapshot periods.",
+        )
+        parser.add_argument(
+            "--until",
+            help="Only take the periods ending by this date (YYYY-MM-DD). Defaults to today.",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Delete the snapshots of the granularity and take them again from the first stock entry.",
+        )
+
+    def handle(self, *args, **options):
+        until = None
+        if options["until"]:
+            try:
+                until = timezone.make_aware(datetime.strptime(options["until"], "%Y-%m-%d"))
+            except ValueError:
+                raise CommandError("Invalid --until format. Use YYYY-MM-DD.")
+
+        if options["rebuild"]:
+            StockSnapshot.objects.filter(granularity=options["granularity"]).delete()
+        periods = build_stock_snapshots(options["granularity"], until)
+
+        self.stdout.write(self.style.SUCCESS(f"Took {periods} {options['granularity']} stock snapshots."))
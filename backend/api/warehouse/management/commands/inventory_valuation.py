@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.warehouse.valuation import VALUATION_GROUPS, VALUATION_METHODS, inventory_valuation, iter_valuation_csv, parse_as_of
+
+
+class Command(BaseCommand):
+    """
+    Management command to write an inventory valuation report as CSV.
+
+    The stock is valued with the weighted average or FIFO method, currently or at the
+    end of a past date, and grouped by category, supplier, tax rate or product. Past
+    dates are answered from the stock snapshots (see build_stock_snapshots).
+    """
+
+    help = "Write the value of the stock per category, supplier, tax rate or product as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--method",
+            choices=VALUATION_METHODS,
+            default="average",
+            help="The valuation method.",
+        )
+        parser.add_argument(
+            "--group-by",
+            choices=VALUATION_GROUPS,
+            default="category",
+            help="The grouping of the report.",
+        )
+        parser.add_argument(
+            "--as-of",
+            help="Value the stock at the end of this date (YYYY-MM-DD). Defaults to the current stock.",
+        )
+        parser.add_argument(
+            "--output",
+            help="The file to write the CSV to. Defaults to the standard output.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            as_of = parse_as_of(options["as_of"])
+        except ValueError:
+            raise CommandError("Invalid --as-of format. Use YYYY-MM-DD.")
+
+        report = inventory_valuation(options["method"], options["group_by"], as_of)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as file:
+                file.writelines(iter_valuation_csv(report))
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {len(report['rows'])} rows with a total value of {report['total_value']} to {options['output']}."
+            ))
+        else:
+            for line in iter_valuation_csv(report):
+                self.stdout.write(line, ending="")
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from api.product_catalog.models import Product
+from api.warehouse.models import Stockentry, StockMovementType
+
+
+class Command(BaseCommand):
+    """
+    Management command to rebuild the running incoming totals of products from the stock ledger.
+
+    The totals are normally maintained incrementally by the Stockentry signal receivers.
+    This command recomputes them, together with the weighted average price, from all
+    incoming stock entries. It is needed once after the totals are introduced and
+    whenever the ledger was changed outside of the ORM.
+    """
+
+    help = "Rebuild Product.incoming_quantity_total, incoming_cost_total and average_price from the stock ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of products updated per UPDATE statement.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        ledger_totals = {
+            row["product_id"]: row
+            for row in Stockentry.objects.filter(movement_type=StockMovementType.INCOMING)
+            .values("product_id")
+            .annotate(
+                total_quantity=Sum("quantity"),
+                total_cost=Sum(F("quantity") * F("import_price")),
+                priced_entries=Count("import_price"),
+            )
+            .order_by()
+        }
+
+        updated = 0
+        batch = []
+        fields = ["incoming_quantity_total", "incoming_cost_total", "average_price"]
+        products = Product.objects.only("pk", *fields).order_by("pk")
+
+        with transaction.atomic():
+            for product in products.iterator(chunk_size=batch_size):
+                totals = ledger_totals.get(product.pk)
+                product.incoming_quantity_total = totals["total_quantity"] if totals else 0
+                product.incoming_cost_total = (totals["total_cost"] or 0) if totals else 0
+                if totals and totals["priced_entries"]:
+                    product.average_price = (
+                        product.incoming_cost_total / product.incoming_quantity_total
+                        if product.incoming_quantity_total > 0 else 0
+                    )
+                batch.append(product)
+
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+
+            if batch:
+                Product.objects.bulk_update(batch, fields)
+                updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stock totals of {updated} products."))
@@ -0,0 +1,131 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.product_catalog.models import Product
+from api.warehouse.ledger import lock_products
+from api.warehouse.models import StockSnapshot
+from api.warehouse.snapshots import (
+    EMPTY_POSITION,
+    LedgerPosition,
+    latest_snapshot_end,
+    ledger_movements,
+    ledger_positions_at,
+)
+
+
+class Command(BaseCommand):
+    """
+    Management command to find products whose stock counters drifted from the stock ledger.
+
+    Product.inventory_count and the incoming totals are maintained incrementally, so
+    changes made outside of the ORM, or a product created with an initial count and
+    no stock entry, make them disagree with the ledger. The ledger totals are read
+    as the latest snapshot plus the entries made since. With --verify-snapshots the
+    latest snapshots are also compared with a full scan of the ledger.
+    """
+
+    help = "Report products whose inventory count or incoming totals differ from the stock ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Set the drifted counters to the ledger values.",
+        )
+        parser.add_argument(
+            "--verify-snapshots",
+            action="store_true",
+            help="Also compare the latest snapshots with a full scan of the ledger.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=50,
+            help="Number of drifted products listed in the report.",
+        )
+
+    def handle(self, *args, **options):
+        snapshot_errors = self.verify_snapshots(options["limit"]) if options["verify_snapshots"] else 0
+
+        with transaction.atomic():
+            products = Product.objects.only("pk", "name", "inventory_count", "incoming_quantity_total",
+                                            "incoming_cost_total").order_by("pk")
+            if options["fix"]:
+                lock_products(products.values_list("pk", flat=True))
+            positions = ledger_positions_at(timezone.now())
+
+            drifted = []
+            for product in products.iterator(chunk_size=1000):
+                position = positions.get(product.pk, EMPTY_POSITION)
+                counters = (product.inventory_count or 0, product.incoming_quantity_total,
+                            Decimal(product.incoming_cost_total))
+                if counters != (position.balance, position.incoming_quantity, position.incoming_cost):
+                    drifted.append((product, position))
+
+            for product, position in drifted[:options["limit"]]:
+                self.stdout.write(
+                    f"{product.pk} {product.name}: inventory {product.inventory_count} != {position.balance}, "
+                    f"incoming {product.incoming_quantity_total} != {position.incoming_quantity}, "
+                    f"cost {product.incoming_cost_total} != {position.incoming_cost}"
+                )
+
+            if drifted and options["fix"]:
+                for product, position in drifted:
+                    product.inventory_count = position.balance
+                    product.incoming_quantity_total = position.incoming_quantity
+                    product.incoming_cost_total = position.incoming_cost
+                Product.objects.bulk_update(
+                    [product for product, _ in drifted],
+                    ["inventory_count", "incoming_quantity_total", "incoming_cost_total"],
+                    batch_size=1000,
+                )
+
+        if not drifted and not snapshot_errors:
+            self.stdout.write(self.style.SUCCESS("Stock counters match the ledger."))
+            return
+        if drifted:
+            action = "Fixed" if options["fix"] else "Found"
+            self.stdout.write(self.style.WARNING(f"{action} {len(drifted)} products with drifted stock counters."))
+        if snapshot_errors:
+            self.stdout.write(self.style.WARNING(
+                f"Found {snapshot_errors} wrong snapshots; rebuild them with build_stock_snapshots --rebuild."
+            ))
+
+    def verify_snapshots(self, limit):
+        """
+        Compare the snapshots of the latest period end with a full scan of the ledger.
+
+        Args:
+            limit (int): The number of mismatches listed.
+
+        Returns:
+            int: The number of products whose snapshot differs from the ledger.
+        """
+        latest = latest_snapshot_end(timezone.now())
+        if not latest:
+            return 0
+        granularity, period_end = latest
+        expected = ledger_movements(end=period_end)
+        mismatches = 0
+        snapshots = StockSnapshot.objects.filter(granularity=granularity, period_end=period_end)
+        for snapshot in snapshots.iterator(chunk_size=1000):
+            position = expected.pop(snapshot.product_id, EMPTY_POSITION)
+            stored = LedgerPosition(
+                snapshot.incoming_quantity_total,
+                snapshot.outgoing_quantity_total,
+                Decimal(snapshot.incoming_cost_total),
+                snapshot.priced_quantity_total,
+                snapshot.entry_count,
+            )
+            if stored != position:
+                mismatches += 1
+                if mismatches <= limit:
+                    self.stdout.write(f"Snapshot of {snapshot.product_id} at {period_end}: {snapshot.balance} != {position.balance}")
+        for product_id, position in expected.items():
+            mismatches += 1
+            if mismatches <= limit:
+                self.stdout.write(f"Snapshot of {product_id} at {period_end}: missing, ledger has {position.balance}")
+        return mismatches
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.warehouse.reorder import rebuild_sales_velocity, refresh_sales_velocity
+
+
+class Command(BaseCommand):
+    """
+    Management command to move the sales velocity window used by the reorder suggestions forward to now.
+
+    The window is also refreshed before the suggestions are read, so running the
+    command only keeps that refresh short. --rebuild recomputes the window from the
+    outgoing ledger, which is needed after stock entries were changed outside of the ORM.
+    """
+
+    help = "Refresh the rolling sales velocity of the products used by the reorder suggestions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute the whole window instead of moving it forward.",
+        )
+
+    def handle(self, *args, **options):
+        products = rebuild_sales_velocity() if options["rebuild"] else refresh_sales_velocity()
+        self.stdout.write(self.style.SUCCESS(f"Sales velocity covers {products} selling products."))
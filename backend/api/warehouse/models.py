@@ -1,9 +1,10 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from api.product_catalog.models import Product
 from helpers.validators.validate_positive import validate_positive
 from django.core.validators import FileExtensionValidator
-from django.db.models import Sum, F
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
 
@@ -26,6 +27,7 @@ class Supplier(models.Model):
         email (EmailField): The email of the supplier (optional).
         ico (CharField): The Identification Number of Organization.
         dic (CharField): The Tax Identification Number.
+        lead_time_days (PositiveIntegerField): The usual number of days between an order and its delivery.
         date_created (DateTimeField): The date and time when the supplier was created.
         date_updated (DateTimeField): The date and time when the supplier was last updated.
     """
@@ -35,6 +37,7 @@ class Supplier(models.Model):
     email = models.EmailField(max_length=200, blank=True, null=True)
     ico = models.CharField(max_length=200)
     dic = models.CharField(max_length=200)
+    lead_time_days = models.PositiveIntegerField(default=7)
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
@@ -101,38 +104,173 @@ class Stockentry(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "movement_type", "date_created"], name="stockentry_product_type_idx"),
+            models.Index(fields=["date_created", "id"], name="stockentry_created_idx"),
+            models.Index(fields=["product", "date_created", "id"], name="stockentry_product_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.movement_type} - {self.product.name} - {self.quantity}"
 
 
+class SnapshotGranularity(models.TextChoices):
+    """
+    Enumeration of the period lengths of the stock snapshots.
+    """
+    DAY = "day", "Day"
+    MONTH = "month", "Month"
+
+
+class StockSnapshot(models.Model):
+    """
+    Model representing the cumulative stock ledger totals of a product at the end of a period.
+
+    Snapshots are taken for every product with stock entries up to the end of the
+    period, so the totals of all products at a period end are one indexed read, and
+    the stock at any moment is the latest snapshot plus the entries made since.
+
+    Attributes:
+        product (ForeignKey): The product the totals belong to.
+        granularity (CharField): The length of the period (day or month).
+        period_start (DateTimeField): The start of the period in the local time zone.
+        period_end (DateTimeField): The end of the period (exclusive); the totals include all entries before it.
+        incoming_quantity_total (IntegerField): The total quantity of the incoming entries.
+        outgoing_quantity_total (IntegerField): The total quantity of the outgoing entries.
+        incoming_cost_total (DecimalField): The total cost of the priced incoming entries.
+        priced_quantity_total (IntegerField): The total quantity of the priced incoming entries.
+        entry_count (IntegerField): The number of entries.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="stock_snapshots")
+    granularity = models.CharField(max_length=10, choices=SnapshotGranularity.choices)
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    incoming_quantity_total = models.IntegerField(default=0)
+    outgoing_quantity_total = models.IntegerField(default=0)
+    incoming_cost_total = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    priced_quantity_total = models.IntegerField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("granularity", "period_start", "product")
+        indexes = [
+            models.Index(fields=["period_end", "granularity"], name="stocksnapshot_end_idx"),
+            models.Index(fields=["product", "period_end"], name="stocksnapshot_product_idx"),
+        ]
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+
+    @property
+    def balance(self):
+        """
+        The stock of the product at the end of the period according to the ledger.
+        """
+        return self.incoming_quantity_total - self.outgoing_quantity_total
+
+    def __str__(self):
+        return f"{self.granularity} {self.period_start} - {self.product_id}"
+
+
+class SalesVelocity(models.Model):
+    """
+    Model representing the quantity of a product that left the stock in a rolling window.
+
+    Only products with outgoing stock in the window have a row. The rows are moved
+    forward incrementally, so the daily velocity of all selling products is one small
+    table read instead of a scan of the outgoing ledger.
+
+    Attributes:
+        product (OneToOneField): The product the velocity belongs to.
+        quantity_sold (IntegerField): The outgoing quantity in [window_end - window_days, window_end).
+        window_days (PositiveIntegerField): The length of the window in days.
+        window_end (DateTimeField): The end of the window (exclusive).
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="sales_velocity")
+    quantity_sold = models.IntegerField(default=0)
+    window_days = models.PositiveIntegerField()
+    window_end = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Sales Velocity"
+        verbose_name_plural = "Sales Velocities"
+
+    @property
+    def daily_velocity(self):
+        """
+        The average outgoing quantity per day in the window.
+        """
+        return Decimal(self.quantity_sold) / self.window_days
+
+    def __str__(self):
+        return f"{self.product_id}: {self.quantity_sold} in {self.window_days} days"
+
+
+def apply_stockentry_to_product(instance, sign=1):
+    """
+    Apply the effect of a stock entry to its product's inventory and average price.
+
+    The inventory count is changed with a database-side expression and the running
+    incoming totals are updated while the product row is locked, so concurrent
+    movements of the same product cannot lose each other's updates. Stock snapshots
+    taken after the entry was made and the sales velocity window containing it are
+    corrected as well.
+
+    Args:
+        instance (Stockentry): The stock entry being applied.
+        sign (int): 1 to apply the entry, -1 to revert it.
+    """
+    from api.warehouse.ledger import apply_incoming_totals, apply_inventory_changes, net_inventory_changes  # Lazy import
+    from api.warehouse.reorder import adjust_sales_velocity  # Lazy import
+    from api.warehouse.snapshots import adjust_snapshots  # Lazy import
+
+    with transaction.atomic():
+        apply_inventory_changes({
+            product_id: sign * change for product_id, change in net_inventory_changes([instance]).items()
+        })
+        apply_incoming_totals([instance], sign=sign)
+        adjust_snapshots(instance, sign=sign)
+        adjust_sales_velocity(instance, sign=sign)
+
+
+@receiver(pre_save, sender=Stockentry)
+def remember_previous_stockentry(sender, instance, **kwargs):
+    """
+    Signal receiver to remember the stored state of a Stockentry before it is updated.
+
+    Args:
+        sender: The model class.
+        instance: The actual instance being saved.
+        **kwargs: Additional keyword arguments.
+    """
+    instance._previous_state = None
+    if instance.pk is not None:
+        instance._previous_state = (
+            Stockentry.objects.filter(pk=instance.pk)
+            .values("product_id", "quantity", "movement_type", "import_price", "date_created")
+            .first()
+        )
+
+
 @receiver(post_save, sender=Stockentry)
 def update_product_inventory_and_average_price(sender, instance, created, **kwargs):
     """
     Signal receiver to update product inventory and average price after a Stockentry is saved.
 
+    When an existing entry is updated, the previously stored version is reverted
+    before the new one is applied.
+
     Args:
         sender: The model class.
         instance: The actual instance being saved.
         created: A boolean; True if a new record was created.
         **kwargs: Additional keyword arguments.
     """
-    if instance.product.inventory_count is None:
-        instance.product.inventory_count = 0
-
-    if instance.movement_type == StockMovementType.INCOMING:
-        if instance.import_price is not None:
-            total_quantity = \
-                Stockentry.objects.filter(product=instance.product, movement_type=StockMovementType.INCOMING).aggregate(
-                    Sum('quantity'))['quantity__sum'] or 0
-            total_cost = \
-                Stockentry.objects.filter(product=instance.product, movement_type=StockMovementType.INCOMING).aggregate(
-                    total_cost=Sum(F('quantity') * F('import_price')))['total_cost'] or 0
-            instance.product.average_price = total_cost / total_quantity if total_quantity > 0 else 0
-        instance.product.inventory_count += instance.quantity
-    elif instance.movement_type == StockMovementType.OUTGOING:
-        instance.product.inventory_count -= instance.quantity
-
-    instance.product.save()
+    with transaction.atomic():
+        previous_state = getattr(instance, "_previous_state", None)
+        if not created and previous_state:
+            apply_stockentry_to_product(Stockentry(**previous_state), sign=-1)
+        apply_stockentry_to_product(instance)
 
 
 @receiver(post_delete, sender=Stockentry)
@@ -145,20 +283,4 @@ def update_product_inventory_and_average_price_on_delete(sender, instance, **kwa
         instance: The actual instance being deleted.
         **kwargs: Additional keyword arguments.
     """
-    if instance.product.inventory_count is None:
-        instance.product.inventory_count = 0
-
-    if instance.movement_type == StockMovementType.INCOMING:
-        if instance.import_price is not None:
-            total_quantity = \
-                Stockentry.objects.filter(product=instance.product, movement_type=StockMovementType.INCOMING).aggregate(
-                    Sum('quantity'))['quantity__sum'] or 0
-            total_cost = \
-                Stockentry.objects.filter(product=instance.product, movement_type=StockMovementType.INCOMING).aggregate(
-                    total_cost=Sum(F('quantity') * F('import_price')))['total_cost'] or 0
-            instance.product.average_price = total_cost / total_quantity if total_quantity > 0 else 0
-        instance.product.inventory_count -= instance.quantity
-    elif instance.movement_type == StockMovementType.OUTGOING:
-        instance.product.inventory_count += instance.quantity
-
-    instance.product.save()
+    apply_stockentry_to_product(instance, sign=-1)
@@ -0,0 +1,201 @@
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from api.warehouse.models import SalesVelocity, StockMovementType, Supplier
+from api.warehouse.snapshots import SETTLE_DELAY, ledger_movements
+from api.warehouse.valuation import latest_supplier
+
+VELOCITY_WINDOW_DAYS = 28
+DEFAULT_LEAD_TIME_DAYS = 7
+SAFETY_DAYS = 3
+REVIEW_DAYS = 7
+
+
+def _outgoing_quantities(start, end):
+    return {
+        product_id: position.outgoing_quantity
+        for product_id, position in ledger_movements(start, end).items()
+        if position.outgoing_quantity
+    }
+
+
+def rebuild_sales_velocity(now=None, window_days=VELOCITY_WINDOW_DAYS):
+    """
+    Replace the sales velocity rows with the outgoing quantities of the window ending now.
+
+    The rows are upserted, so two rebuilds running at the same time do not collide
+    on the product keys.
+
+    Args:
+        now (datetime): The end of the window; defaults to SETTLE_DELAY before now.
+        window_days (int): The length of the window in days.
+
+    Returns:
+        int: The number of products with sales in the window.
+    """
+    now = now or timezone.now() - SETTLE_DELAY
+    with transaction.atomic():
+        sold = _outgoing_quantities(now - timedelta(days=window_days), now)
+        SalesVelocity.objects.all().delete()
+        SalesVelocity.objects.bulk_create(
+            [
+                SalesVelocity(product_id=product_id, quantity_sold=quantity, window_days=window_days, window_end=now)
+                for product_id, quantity in sold.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=["quantity_sold", "window_days", "window_end"],
+        )
+    return len(sold)
+
+
+def refresh_sales_velocity(now=None, window_days=VELOCITY_WINDOW_DAYS):
+    """
+    Move the sales velocity window forward to now.
+
+    Only the entries made since the previous refresh are added and the entries that
+    left the window are subtracted, so a refresh reads two short ranges of the
+    outgoing ledger however long the window is. The rows are rebuilt instead when
+    there are none, the window length changed or the window moved by more than its
+    length.
+
+    The rows are locked before the previous window end is read, so concurrent
+    refreshes run one after the other and each moves the window on from where the
+    previous one left it, instead of both adding the same entries.
+
+    Args:
+        now (datetime): The new end of the window; defaults to SETTLE_DELAY before now.
+        window_days (int): The length of the window in days.
+
+    Returns:
+        int: The number of products with sales in the window.
+    """
+    now = now or timezone.now() - SETTLE_DELAY
+    window = timedelta(days=window_days)
+    with transaction.atomic():
+        rows = list(
+            SalesVelocity.objects.select_for_update().order_by("pk").values_list("pk", "window_end", "window_days")
+        )
+        previous = max((window_end for _, window_end, _ in rows), default=None)
+        if previous is None or {days for _, _, days in rows} != {window_days} or now - previous >= window:
+            return rebuild_sales_velocity(now, window_days)
+        if now <= previous:
+            return len(rows)
+
+        changes = _outgoing_quantities(previous, now)
+        for product_id, quantity in _outgoing_quantities(previous - window, now - window).items():
+            changes[product_id] = changes.get(product_id, 0) - quantity
+
+        existing = {pk for pk, _, _ in rows}
+        updates = {product_id: change for product_id, change in changes.items() if product_id in existing and change}
+        quantity_sold = F("quantity_sold")
+        if updates:
+            quantity_sold = quantity_sold + Case(
+                *[When(pk=product_id, then=Value(change)) for product_id, change in updates.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        SalesVelocity.objects.filter(window_end=previous).update(quantity_sold=quantity_sold, window_end=now)
+        SalesVelocity.objects.bulk_create(
+            [
+                SalesVelocity(product_id=product_id, quantity_sold=change, window_days=window_days, window_end=now)
+                for product_id, change in changes.items()
+                if product_id not in existing and change > 0
+            ],
+            batch_size=1000,
+        )
+        SalesVelocity.objects.filter(quantity_sold__lte=0).delete()
+    return SalesVelocity.objects.count()
+
+
+def adjust_sales_velocity(entry, sign=1):
+    """
+    Correct the sales velocity when an outgoing entry inside the current window is saved or deleted.
+
+    Entries made after the window end are counted by the next refresh, so new
+    entries need no change.
+
+    Args:
+        entry (Stockentry): The stock entry being applied.
+        sign (int): 1 to apply the entry, -1 to revert it.
+
+    Returns:
+        int: The number of updated rows.
+    """
+    if entry.movement_type != StockMovementType.OUTGOING or entry.date_created is None:
+        return 0
+    return SalesVelocity.objects.filter(
+        product_id=entry.product_id,
+        window_end__gt=entry.date_created,
+        window_end__lte=entry.date_created + timedelta(days=VELOCITY_WINDOW_DAYS),
+    ).update(quantity_sold=F("quantity_sold") + sign * entry.quantity)
+
+
+def reorder_suggestions(supplier_id=None, safety_days=SAFETY_DAYS, review_days=REVIEW_DAYS):
+    """
+    Return the products that should be reordered, grouped by the supplier that last delivered them.
+
+    A product is due when its stock no longer covers its daily velocity for the
+    lead time of its supplier plus the safety days. The suggested quantity brings
+    the stock up to the demand of the lead time, safety and review days. The
+    velocity window is refreshed first, then the selling products are read with
+    their stock and supplier in one query.
+
+    Args:
+        supplier_id (int): Only return the products of this supplier.
+        safety_days (int): Extra days of demand kept as a buffer.
+        review_days (int): The days until the next order, to be covered by this one.
+
+    Returns:
+        list: One dictionary per supplier with its ID, name, lead time and due products,
+            the most urgent products first; products of an unknown supplier come last.
+    """
+    refresh_sales_velocity()
+
+    velocities = (
+        SalesVelocity.objects.filter(quantity_sold__gt=0)
+        .annotate(supplier_id=latest_supplier())
+        .values_list("product_id", "product__name", "product__inventory_count", "quantity_sold", "window_days",
+                     "supplier_id")
+    )
+    if supplier_id is not None:
+        velocities = velocities.filter(supplier_id=supplier_id)
+    rows = list(velocities)
+    suppliers = Supplier.objects.in_bulk({row[5] for row in rows if row[5] is not None})
+
+    groups = {}
+    for product_id, name, inventory_count, quantity_sold, window_days, product_supplier_id in rows:
+        supplier = suppliers.get(product_supplier_id)
+        lead_time_days = supplier.lead_time_days if supplier else DEFAULT_LEAD_TIME_DAYS
+        daily_velocity = Decimal(quantity_sold) / window_days
+        stock = inventory_count or 0
+        reorder_point = daily_velocity * (lead_time_days + safety_days)
+        if stock > reorder_point:
+            continue
+
+        order_up_to = daily_velocity * (lead_time_days + safety_days + review_days)
+        group = groups.setdefault(product_supplier_id, {
+            "supplier_id": product_supplier_id,
+            "supplier_name": supplier.name if supplier else None,
+            "lead_time_days": lead_time_days,
+            "products": [],
+        })
+        group["products"].append({
+            "product_id": product_id,
+            "name": name,
+            "inventory_count": stock,
+            "daily_velocity": daily_velocity.quantize(Decimal("0.001")),
+            "days_of_stock": (Decimal(max(stock, 0)) / daily_velocity).quantize(Decimal("0.1")),
+            "reorder_point": math.ceil(reorder_point),
+            "suggested_quantity": max(math.ceil(order_up_to - stock), 1),
+        })
+
+    for group in groups.values():
+        group["products"].sort(key=lambda product: (product["days_of_stock"], product["name"]))
+    return sorted(groups.values(), key=lambda group: (group["supplier_name"] is None, group["supplier_name"] or ""))
@@ -2,7 +2,11 @@ from rest_framework import serializers
 from drf_yasg.utils import swagger_serializer_method
 from django.db import transaction
 
-from api.warehouse.models import StockImport, StockMovementType, Supplier, Stockentry
+from api.product_catalog.models import Product
+from api.product_catalog.serializers import ProductSerializer
+from api.warehouse.ledger import apply_import_prices, record_incoming_movements
+from api.warehouse.models import StockImport, Supplier, Stockentry
+from api.warehouse.timeline import signed_quantity
 from helpers.validators.validate_positive import validate_positive
 
 
@@ -77,10 +81,50 @@ class StockentryReadSerializer(serializers.ModelSerializer):
         Returns:
             dict: Serialized data of the associated product.
         """
-        from api.product_catalog.serializers import ProductSerializer
         return ProductSerializer(obj.product).data
 
 
+class StockMovementSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the entries of a product's stock timeline.
+
+    The product is implied by the timeline and the supplier is reduced to its name,
+    read through a join, so a page is serialized without further queries. The
+    balance is the ledger stock after the entry, set by annotate_running_balance().
+    """
+    supplier_name = serializers.CharField(source="supplier.name", read_only=True, default=None)
+    change = serializers.SerializerMethodField()
+    balance = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Stockentry
+        fields = [
+            "id",
+            "date_created",
+            "movement_type",
+            "quantity",
+            "change",
+            "balance",
+            "import_price",
+            "supplier",
+            "supplier_name",
+            "import_history",
+        ]
+
+    @staticmethod
+    def get_change(obj):
+        """
+        Return the quantity signed by the direction of the movement.
+
+        Args:
+            obj (Stockentry): The Stockentry instance being serialized.
+
+        Returns:
+            int: The quantity, negative for outgoing entries.
+        """
+        return signed_quantity(obj)
+
+
 class ProductQuantitySerializer(serializers.Serializer):
     """
     Serializer for product quantity data in stock imports.
@@ -93,6 +137,7 @@ class ProductQuantitySerializer(serializers.Serializer):
     price_with_vat = serializers.DecimalField(
         max_digits=6, decimal_places=2, validators=[validate_positive]
     )
+    import_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
 
 
 class StockImportCreateSerializer(serializers.ModelSerializer):
@@ -146,12 +191,14 @@ class StockImportCreateSerializer(serializers.ModelSerializer):
 
         This method performs custom validation on the input data, ensuring that
         all required fields are present and that the data structure is correct.
+        Every line is validated with ProductQuantitySerializer and the existence
+        of all products is checked with a single query.
 
         Args:
             data (dict): The input data to be validated.
 
         Returns:
-            dict: The validated data.
+            dict: The validated data, with the lines of "products" converted to their field types.
 
         Raises:
             serializers.ValidationError: If the data fails validation.
@@ -165,7 +212,11 @@ class StockImportCreateSerializer(serializers.ModelSerializer):
         if not data.get("supplier") and not data.get("ico"):
             raise serializers.ValidationError("Either 'supplier' or 'ico' must be provided.")
 
-        for product_data in data["products"]:
+        if not data["products"]:
+            raise serializers.ValidationError("At least one product must be imported.")
+
+        products_data = data["products"]
+        for product_data in products_data:
             product_required_fields = ["product_id", "quantity", "price_with_vat", "import_price"]
             missing_product_fields = [field for field in product_required_fields if field not in product_data]
             if missing_product_fields:
@@ -173,6 +224,18 @@ class StockImportCreateSerializer(serializers.ModelSerializer):
                     f"Each product entry must include the following fields: {', '.join(missing_product_fields)}"
                 )
 
+        lines = ProductQuantitySerializer(data=products_data, many=True)
+        if not lines.is_valid():
+            raise serializers.ValidationError({"products": lines.errors})
+
+        product_ids = list(dict.fromkeys(line["product_id"] for line in lines.validated_data))
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True))
+        missing_products = [product_id for product_id in product_ids if product_id not in existing]
+        if missing_products:
+            raise serializers.ValidationError(
+                f"Products with IDs {', '.join(map(str, missing_products))} do not exist.")
+
+        data["products"] = lines.validated_data
         return data
 
     def create(self, validated_data):
@@ -181,64 +244,34 @@ class StockImportCreateSerializer(serializers.ModelSerializer):
 
         This method handles the creation of a StockImport and its related Stockentries.
         It also updates the prices of the associated products based on the import data.
+        The prices are written with one bulk update and the entries with one bulk
+        insert, followed by set-based inventory and average price updates, so the
+        number of queries does not depend on the number of lines. A product listed
+        on several lines gets an entry per line, so its stock grows by their summed
+        quantity, and the price with VAT of its last line.
 
         Args:
             validated_data (dict): The validated data for creating the StockImport.
 
         Returns:
             StockImport: The created StockImport instance.
-
-        Raises:
-            serializers.ValidationError: If any of the specified products do not exist.
         """
-        from api.product_catalog.models import Product  # Lazy import
-
         supplier = validated_data.get("supplier")
-        invoice_pdf = validated_data.get("invoice_pdf")
-        ico = validated_data.get("ico")
-        note = validated_data.get("note")
-        invoice_number = validated_data.get("invoice_number")
         products_data = validated_data["products"]
 
-        missing_products = []
-        for product_data in products_data:
-            product_id = product_data["product_id"]
-            if not Product.objects.filter(id=product_id).exists():
-                missing_products.append(product_id)
-
-        if missing_products:
-            raise serializers.ValidationError(
-                f"Products with IDs {', '.join(map(str, missing_products))} do not exist.")
-
         with transaction.atomic():
             stock_import = StockImport.objects.create(
                 supplier=supplier,
-                invoice_pdf=invoice_pdf,
-                ico=ico,
-                note=note,
-                invoice_number=invoice_number,
+                invoice_pdf=validated_data.get("invoice_pdf"),
+                ico=validated_data.get("ico"),
+                note=validated_data.get("note"),
+                invoice_number=validated_data.get("invoice_number"),
+            )
+            apply_import_prices({line["product_id"]: line["price_with_vat"] for line in products_data})
+            record_incoming_movements(
+                [(line["product_id"], line["quantity"], line["import_price"]) for line in products_data],
+                stock_import=stock_import,
+                supplier=supplier,
             )
-
-            for product_data in products_data:
-                product_id = product_data["product_id"]
-                quantity = int(product_data["quantity"])
-                price_with_vat = product_data["price_with_vat"]
-                import_price = product_data["import_price"]
-                product = Product.objects.get(id=product_id)
-
-                # Update product prices
-                product.price_with_vat = price_with_vat
-                tax_rate = float(product.tax_rate)
-                product.price_without_vat = round(float(price_with_vat) / (1 + float(tax_rate)), 2)
-                product.save()
-
-                Stockentry.objects.create(
-                    product=product,
-                    quantity=quantity,
-                    movement_type=StockMovementType.INCOMING,
-                    import_history=stock_import,
-                    supplier=supplier,
-                    import_price=import_price,
-                )
 
         return stock_import
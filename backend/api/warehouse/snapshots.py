@@ -0,0 +1,343 @@
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from api.warehouse.models import SnapshotGranularity, StockSnapshot, Stockentry, StockMovementType
+
+# Stock entries are dated when they are saved, before their transaction commits, so
+# summaries of the ledger stop this long before now to not pass entries not yet visible.
+SETTLE_DELAY = timedelta(minutes=5)
+
+
+@dataclass(frozen=True)
+class LedgerPosition:
+    """
+    The cumulative stock ledger totals of a product, or their change over a range.
+
+    Attributes:
+        incoming_quantity (int): The total quantity of the incoming entries.
+        outgoing_quantity (int): The total quantity of the outgoing entries.
+        incoming_cost (Decimal): The total cost of the priced incoming entries.
+        priced_quantity (int): The total quantity of the priced incoming entries.
+        entry_count (int): The number of entries.
+    """
+
+    incoming_quantity: int = 0
+    outgoing_quantity: int = 0
+    incoming_cost: Decimal = Decimal(0)
+    priced_quantity: int = 0
+    entry_count: int = 0
+
+    @property
+    def balance(self):
+        """
+        The stock according to the ledger.
+        """
+        return self.incoming_quantity - self.outgoing_quantity
+
+    def __add__(self, other):
+        return LedgerPosition(
+            self.incoming_quantity + other.incoming_quantity,
+            self.outgoing_quantity + other.outgoing_quantity,
+            self.incoming_cost + other.incoming_cost,
+            self.priced_quantity + other.priced_quantity,
+            self.entry_count + other.entry_count,
+        )
+
+    def __sub__(self, other):
+        return LedgerPosition(
+            self.incoming_quantity - other.incoming_quantity,
+            self.outgoing_quantity - other.outgoing_quantity,
+            self.incoming_cost - other.incoming_cost,
+            self.priced_quantity - other.priced_quantity,
+            self.entry_count - other.entry_count,
+        )
+
+
+EMPTY_POSITION = LedgerPosition()
+
+
+def period_start(value, granularity):
+    """
+    Return the start of the local day or month containing the given datetime.
+    """
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    day = timezone.localtime(value).date()
+    if granularity == SnapshotGranularity.MONTH:
+        day = day.replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def next_period_start(start, granularity):
+    """
+    Return the start of the period following the one starting at the given datetime.
+    """
+    day = timezone.localtime(start).date()
+    if granularity == SnapshotGranularity.MONTH:
+        day = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    else:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def ledger_movements(start=None, end=None, product_ids=None):
+    """
+    Sum the stock entries of each product made in [start, end).
+
+    Args:
+        start (datetime): The start of the range, or None for the beginning of the ledger.
+        end (datetime): The end of the range (exclusive), or None for no limit.
+        product_ids (iterable): Only sum the entries of these products.
+
+    Returns:
+        dict: A mapping of product ID to the LedgerPosition of its entries.
+    """
+    entries = Stockentry.objects.all()
+    if start is not None:
+        entries = entries.filter(date_created__gte=start)
+    if end is not None:
+        entries = entries.filter(date_created__lt=end)
+    if product_ids is not None:
+        entries = entries.filter(product_id__in=product_ids)
+
+    incoming = Q(movement_type=StockMovementType.INCOMING)
+    rows = (
+        entries.values("product_id")
+        .annotate(
+            incoming_quantity=Sum("quantity", filter=incoming),
+            outgoing_quantity=Sum("quantity", filter=Q(movement_type=StockMovementType.OUTGOING)),
+            incoming_cost=Sum(F("quantity") * F("import_price"), filter=incoming),
+            priced_quantity=Sum("quantity", filter=incoming & Q(import_price__isnull=False)),
+            entry_count=Count("id"),
+        )
+        .order_by()
+    )
+    return {
+        row["product_id"]: LedgerPosition(
+            row["incoming_quantity"] or 0,
+            row["outgoing_quantity"] or 0,
+            Decimal(str(row["incoming_cost"] or 0)),
+            row["priced_quantity"] or 0,
+            row["entry_count"],
+        )
+        for row in rows
+    }
+
+
+def latest_snapshot_end(at):
+    """
+    Return the granularity and end of the latest snapshot period ending at or before a moment.
+
+    Day snapshots are preferred over month snapshots ending at the same time; both
+    hold the same totals.
+
+    Args:
+        at (datetime): The moment.
+
+    Returns:
+        tuple: The granularity and the period end, or None if no snapshot was taken before.
+    """
+    return (
+        StockSnapshot.objects.filter(period_end__lte=at)
+        .order_by("-period_end", "granularity")
+        .values_list("granularity", "period_end")
+        .first()
+    )
+
+
+def _snapshot_positions(granularity, period_end, product_ids=None):
+    snapshots = StockSnapshot.objects.filter(granularity=granularity, period_end=period_end)
+    if product_ids is not None:
+        snapshots = snapshots.filter(product_id__in=product_ids)
+    return {
+        product_id: LedgerPosition(*totals)
+        for product_id, *totals in snapshots.values_list(
+            "product_id",
+            "incoming_quantity_total",
+            "outgoing_quantity_total",
+            "incoming_cost_total",
+            "priced_quantity_total",
+            "entry_count",
+        )
+    }
+
+
+def ledger_positions_at(at, product_ids=None):
+    """
+    Return the cumulative ledger totals of the products at a moment.
+
+    The totals are read from the latest snapshot before the moment, and only the
+    entries made since are summed, so the cost does not grow with the age of the
+    ledger. Without snapshots the whole ledger is summed.
+
+    Args:
+        at (datetime): The moment; entries made at or after it are not counted.
+        product_ids (iterable): Only return the totals of these products.
+
+    Returns:
+        dict: A mapping of product ID to its LedgerPosition, for products with entries before the moment.
+    """
+    if product_ids is not None:
+        product_ids = list(product_ids)
+
+    positions = {}
+    since = None
+    latest = latest_snapshot_end(at)
+    if latest:
+        granularity, since = latest
+        positions = _snapshot_positions(granularity, since, product_ids)
+
+    for product_id, delta in ledger_movements(since, at, product_ids).items():
+        positions[product_id] = positions.get(product_id, EMPTY_POSITION) + delta
+    return positions
+
+
+def inventory_at(at, product_ids=None):
+    """
+    Return the stock of the products at a moment according to the ledger.
+
+    Args:
+        at (datetime): The moment.
+        product_ids (iterable): Only return the stock of these products.
+
+    Returns:
+        dict: A mapping of product ID to its stock, for products with entries before the moment.
+    """
+    return {product_id: position.balance for product_id, position in ledger_positions_at(at, product_ids).items()}
+
+
+def movements_between(start, end, product_ids=None):
+    """
+    Return the incoming and outgoing movements of the products in [start, end).
+
+    Both bounds are answered from snapshots plus the entries made since, so a
+    range a year back costs about as much as one of yesterday.
+
+    Args:
+        start (datetime): The start of the range.
+        end (datetime): The end of the range (exclusive).
+        product_ids (iterable): Only return the movements of these products.
+
+    Returns:
+        dict: A mapping of product ID to the LedgerPosition of its movements, for products that moved.
+    """
+    if product_ids is not None:
+        product_ids = list(product_ids)
+    before = ledger_positions_at(start, product_ids)
+    movements = {}
+    for product_id, position in ledger_positions_at(end, product_ids).items():
+        change = position - before.get(product_id, EMPTY_POSITION)
+        if change != EMPTY_POSITION:
+            movements[product_id] = change
+    return movements
+
+
+def build_stock_snapshots(granularity, until=None):
+    """
+    Take the missing snapshots of the given granularity for all periods that ended before a moment.
+
+    The periods are taken in order, one transaction each, starting after the latest
+    snapshot of the granularity or at the first stock entry. Each period only sums
+    the entries made in it and adds them to the totals of the previous period.
+    A period is only taken SETTLE_DELAY after it ended, so the entries dated in it
+    whose transactions were still open at its end are included; the bulk ledger
+    writes do not correct snapshots afterwards.
+
+    Args:
+        granularity (str): One of SnapshotGranularity.
+        until (datetime): Only take periods ending at or before this moment; defaults to now.
+
+    Returns:
+        int: The number of periods taken.
+    """
+    settled = timezone.now() - SETTLE_DELAY
+    until = period_start(min(until or settled, settled), granularity)
+
+    latest = StockSnapshot.objects.filter(granularity=granularity).aggregate(end=Max("period_end"))["end"]
+    if latest:
+        start = latest
+        positions = _snapshot_positions(granularity, latest)
+    else:
+        first = Stockentry.objects.aggregate(first=Min("date_created"))["first"]
+        if first is None:
+            return 0
+        start = period_start(first, granularity)
+        positions = {}
+
+    periods = 0
+    while start < until:
+        end = next_period_start(start, granularity)
+        with transaction.atomic():
+            for product_id, delta in ledger_movements(start, end).items():
+                positions[product_id] = positions.get(product_id, EMPTY_POSITION) + delta
+            StockSnapshot.objects.bulk_create(
+                [
+                    StockSnapshot(
+                        product_id=product_id,
+                        granularity=granularity,
+                        period_start=start,
+                        period_end=end,
+                        incoming_quantity_total=position.incoming_quantity,
+                        outgoing_quantity_total=position.outgoing_quantity,
+                        incoming_cost_total=position.incoming_cost,
+                        priced_quantity_total=position.priced_quantity,
+                        entry_count=position.entry_count,
+                    )
+                    for product_id, position in positions.items()
+                ],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+        start = end
+        periods += 1
+    return periods
+
+
+def adjust_snapshots(entry, sign=1):
+    """
+    Correct the snapshots taken after a stock entry was made when the entry is saved or deleted.
+
+    New entries are made after every snapshot, so this is a single query that finds
+    nothing to do. When a past entry is changed, the snapshots of its product from
+    the following periods are updated in one UPDATE, after creating the ones missing
+    for a product that had no entries before.
+
+    Args:
+        entry (Stockentry): The stock entry being applied.
+        sign (int): 1 to apply the entry, -1 to revert it.
+
+    Returns:
+        int: The number of updated snapshots.
+    """
+    if entry.date_created is None:
+        return 0
+    periods = list(
+        StockSnapshot.objects.filter(period_end__gt=entry.date_created)
+        .values_list("granularity", "period_start", "period_end")
+        .distinct()
+    )
+    if not periods:
+        return 0
+
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(product_id=entry.product_id, granularity=granularity, period_start=start, period_end=end)
+            for granularity, start, end in periods
+        ],
+        ignore_conflicts=True,
+    )
+    quantity = sign * entry.quantity
+    changes = {"entry_count": F("entry_count") + sign}
+    if entry.movement_type == StockMovementType.INCOMING:
+        changes["incoming_quantity_total"] = F("incoming_quantity_total") + quantity
+        if entry.import_price is not None:
+            changes["incoming_cost_total"] = F("incoming_cost_total") + quantity * Decimal(str(entry.import_price))
+            changes["priced_quantity_total"] = F("priced_quantity_total") + quantity
+    elif entry.movement_type == StockMovementType.OUTGOING:
+        changes["outgoing_quantity_total"] = F("outgoing_quantity_total") + quantity
+    return StockSnapshot.objects.filter(product_id=entry.product_id, period_end__gt=entry.date_created).update(**changes)
@@ -0,0 +1,82 @@
+import tempfile
+from io import StringIO
+
+from django.core.files import File
+from django.core.management import call_command
+
+from api.warehouse.reorder import refresh_sales_velocity
+from api.warehouse.valuation import inventory_valuation, iter_valuation_csv, parse_as_of
+from jobs.registry import PermanentJobError, job
+
+
+@job("rebuild_stock_totals")
+def rebuild_stock_totals(job):
+    """
+    Rebuild the incoming totals and average prices of the products with the rebuild_stock_totals command.
+
+    Payload:
+        batch_size (int): The number of products updated per UPDATE statement.
+
+    Returns:
+        dict: The output of the command.
+    """
+    output = StringIO()
+    call_command("rebuild_stock_totals", batch_size=job.payload.get("batch_size", 1000), stdout=output)
+    return {"output": output.getvalue().strip()}
+
+
+@job("build_stock_snapshots")
+def build_stock_snapshots(job):
+    """
+    Take the missing stock snapshots with the build_stock_snapshots command.
+
+    Payload:
+        granularity (str): "day" or "month".
+
+    Returns:
+        dict: The output of the command.
+    """
+    output = StringIO()
+    call_command("build_stock_snapshots", granularity=job.payload.get("granularity", "day"), stdout=output)
+    return {"output": output.getvalue().strip()}
+
+
+@job("inventory_valuation")
+def inventory_valuation_report(job):
+    """
+    Write an inventory valuation report to the result file of the job as CSV.
+
+    Payload:
+        method (str): "average" or "fifo".
+        group_by (str): "category", "supplier", "tax_rate" or "product".
+        as_of (str): Value the stock at the end of this date (YYYY-MM-DD) instead of now.
+
+    Returns:
+        dict: The number of rows and the total value.
+    """
+    try:
+        report = inventory_valuation(
+            job.payload.get("method", "average"),
+            job.payload.get("group_by", "category"),
+            parse_as_of(job.payload.get("as_of")),
+        )
+    except ValueError as e:
+        raise PermanentJobError(str(e))
+
+    with tempfile.TemporaryFile() as file:
+        for line in iter_valuation_csv(report):
+            file.write(line.encode("utf-8"))
+        file.seek(0)
+        job.result_file.save("inventory-valuation.csv", File(file), save=False)
+    return {"rows": len(report["rows"]), "total_value": str(report["total_value"])}
+
+
+@job("refresh_sales_velocity")
+def refresh_velocity(job):
+    """
+    Move the sales velocity window forward ahead of the next reorder suggestions request.
+
+    Returns:
+        dict: The number of products with sales in the window.
+    """
+    return {"products": refresh_sales_velocity()}
@@ -1,14 +1,50 @@
+import tempfile
+from datetime import datetime, timedelta
 from decimal import Decimal
+from io import StringIO
 
-from django.test import TestCase
+from django.core.management import call_command
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from unittest.mock import patch
+
+from api.common.query_plans import SUPPORTED_VENDORS, captured_sequential_scans
 from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.files.uploadedfile import SimpleUploadedFile
-from api.warehouse.models import Supplier, Stockentry, StockImport, StockMovementType
+from api.warehouse.models import (
+    SalesVelocity,
+    SnapshotGranularity,
+    StockImport,
+    StockSnapshot,
+    Stockentry,
+    StockMovementType,
+    Supplier,
+)
+from api.warehouse.snapshots import (
+    SETTLE_DELAY,
+    build_stock_snapshots,
+    inventory_at,
+    ledger_movements,
+    ledger_positions_at,
+    movements_between,
+    next_period_start,
+    period_start,
+)
+from api.warehouse.reorder import rebuild_sales_velocity, refresh_sales_velocity, reorder_suggestions
+from api.warehouse.valuation import inventory_valuation, parse_as_of
 from api.product_catalog.models import Category, Product
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
 from authentication.models import CustomUser
+from jobs.models import Job, JobStatus
+from jobs.worker import Worker
 
 
 class SupplierTests(TestCase):
@@ -285,6 +321,68 @@ class StockentryTests(TestCase):
         actual_inventory_value = self.product.inventory_count * float(self.product.average_price)
         self.assertAlmostEqual(actual_inventory_value, expected_inventory_value, places=2)
 
+    def test_updating_stockentry_replaces_its_previous_effect(self):
+        stockentry = Stockentry.objects.create(
+            product=self.product,
+            quantity=10,
+            movement_type=StockMovementType.INCOMING,
+            supplier=self.supplier,
+            import_price=10
+        )
+        stockentry.quantity = 20
+        stockentry.import_price = 16
+        stockentry.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory_count, 20)
+        self.assertEqual(self.product.incoming_quantity_total, 20)
+        self.assertEqual(float(self.product.average_price), 16.0)
+
+    def test_unpriced_incoming_stockentry_counts_towards_quantity_only(self):
+        Stockentry.objects.create(
+            product=self.product,
+            quantity=10,
+            movement_type=StockMovementType.INCOMING,
+            supplier=self.supplier,
+            import_price=10
+        )
+        Stockentry.objects.create(
+            product=self.product,
+            quantity=10,
+            movement_type=StockMovementType.INCOMING,
+            supplier=self.supplier,
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(float(self.product.average_price), 10.0)
+        Stockentry.objects.create(
+            product=self.product,
+            quantity=5,
+            movement_type=StockMovementType.INCOMING,
+            supplier=self.supplier,
+            import_price=20
+        )
+        self.product.refresh_from_db()
+        self.assertAlmostEqual(float(self.product.average_price), (10 * 10 + 5 * 20) / 25, places=6)
+
+    def test_rebuild_stock_totals_command(self):
+        for quantity, import_price in [(10, 10), (5, 12), (3, None)]:
+            Stockentry.objects.create(
+                product=self.product,
+                quantity=quantity,
+                movement_type=StockMovementType.INCOMING,
+                supplier=self.supplier,
+                import_price=import_price
+            )
+        Product.objects.filter(pk=self.product.pk).update(
+            incoming_quantity_total=0, incoming_cost_total=0, average_price=0
+        )
+
+        call_command("rebuild_stock_totals", stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.incoming_quantity_total, 18)
+        self.assertEqual(self.product.incoming_cost_total, Decimal("160"))
+        self.assertAlmostEqual(float(self.product.average_price), 160 / 18, places=6)
+
 
 class SupplierViewSetTests(APITestCase):
     def setUp(self):
@@ -481,6 +579,47 @@ class StockentryViewSetTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Stockentry.objects.count(), 0)
 
+    def test_list_stockentries_with_keyset_pagination(self):
+        self.client.force_authenticate(user=self.admin_user)
+        Stockentry.objects.bulk_create([
+            Stockentry(product=self.product, quantity=index + 1, movement_type=StockMovementType.INCOMING)
+            for index in range(7)
+        ])
+        # Entries sharing a timestamp must still be paged by their id.
+        Stockentry.objects.filter(quantity__gt=3).update(date_created=timezone.now())
+        expected = list(Stockentry.objects.order_by("-date_created", "-id").values_list("id", flat=True))
+
+        seen = []
+        url = reverse("stockentry-list") + "?pagination=keyset&page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(entry["id"] for entry in response.data["results"])
+            last_page = response.data
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(last_page["previous"])
+        self.assertEqual([entry["id"] for entry in response.data["results"]], expected[3:6])
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([entry["id"] for entry in response.data["results"]], expected[:3])
+        self.assertIsNone(response.data["previous"])
+
+    def test_list_stockentries_with_estimated_count(self):
+        self.client.force_authenticate(user=self.admin_user)
+        Stockentry.objects.create(product=self.product, quantity=1, movement_type=StockMovementType.INCOMING)
+
+        response = self.client.get(reverse("stockentry-list"), {"count": "estimate"})
+        self.assertEqual(response.data["count"], 1)
+        response = self.client.get(reverse("stockentry-list"), {"pagination": "keyset", "count": "estimate"})
+        self.assertEqual(response.data["count"], 1)
+
+    def test_list_stockentries_with_invalid_cursor(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse("stockentry-list"), {"pagination": "keyset", "cursor": "invalid"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class StockImportViewSetTests(TestCase):
     def setUp(self):
@@ -652,15 +791,74 @@ class StockImportViewSetTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(StockImport.objects.count(), 0)
 
-    def test_create_stock_import_with_duplicate_product(self):
+    def post_form(self, fields):
+        # The body the browser sends for the FormData built by createStockImport().
+        body = "".join(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields
+        ) + f"--{BOUNDARY}--\r\n"
+        return self.client.generic("POST", reverse("stock-import-list"), body.encode(), MULTIPART_CONTENT)
+
+    def test_create_stock_import_from_the_frontend_form(self):
         self.client.force_authenticate(user=self.admin_user)
-        self.stock_import_data["products"].append(
-            {"product_id": self.product1.id, "quantity": 5, "price_with_vat": 10.0, "import_price": 8.0}
+        response = self.post_form([
+            ("supplier", self.supplier.id),
+            ("note", "Monday delivery"),
+            ("products[0].product_id", self.product2.id),
+            ("products[0].quantity", 3),
+            ("products[0].price_with_vat", "25.00"),
+            ("products[0].import_price", "19.50"),
+            ("products[1].product_id", self.product1.id),
+            ("products[1].quantity", 4),
+            ("products[1].price_with_vat", "12.00"),
+            ("products[1].import_price", "9.00"),
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        stock_import = StockImport.objects.get()
+        self.assertEqual(stock_import.note, "Monday delivery")
+        self.assertEqual(
+            sorted(stock_import.stock_entries.values_list("product_id", "quantity", "import_price")),
+            sorted([(self.product2.id, 3, Decimal("19.50")), (self.product1.id, 4, Decimal("9.00"))]),
         )
-        response = self.client.post(reverse("stock-import-list"), self.stock_import_data)
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.price_with_vat, Decimal("25.00"))
+
+    def test_create_stock_import_with_malformed_line_keys(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.post_form([
+            ("supplier", self.supplier.id),
+            ("products[0].product_id", self.product1.id),
+            ("products[0]..quantity", 3),
+            ("products[0].price_with_vat", "12.00"),
+            ("products[0].import_price", "9.00"),
+        ])
+
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(StockImport.objects.count(), 0)
 
+    def test_create_stock_import_with_duplicate_product(self):
+        self.client.force_authenticate(user=self.admin_user)
+        lines = [
+            (self.product1.id, 10, 10.0, 8.0),
+            (self.product2.id, 20, 22.4, 18.0),
+            (self.product1.id, 5, 11.2, 11.0),
+        ]
+        data = {"supplier": self.supplier.id}
+        for number, (product_id, quantity, price_with_vat, import_price) in enumerate(lines):
+            data[f"products[{number}].product_id"] = product_id
+            data[f"products[{number}].quantity"] = quantity
+            data[f"products[{number}].price_with_vat"] = price_with_vat
+            data[f"products[{number}].import_price"] = import_price
+        response = self.client.post(reverse("stock-import-list"), data, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(StockImport.objects.get().stock_entries.count(), 3)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.inventory_count, 15)
+        self.assertEqual(self.product1.price_with_vat, Decimal("11.20"))
+        self.assertAlmostEqual(self.product1.average_price, 9.0)
+
     def test_create_stock_import_with_invalid_invoice_pdf(self):
         self.client.force_authenticate(user=self.admin_user)
         self.stock_import_data["invoice_pdf"] = SimpleUploadedFile(
@@ -855,3 +1053,503 @@ class StockImportUpdateProductPricesTests(APITestCase):
 
         # Ensure average price is updated correctly
         self.assertEqual(float(self.product.average_price), 20.0)
+
+
+class StockImportBatchTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.supplier = Supplier.objects.create(
+            name="Test Supplier", ico="12345678", dic="1234567890"
+        )
+        self.category = Category.objects.create(name="Test Category")
+        self.products = Product.objects.bulk_create(
+            Product(
+                name=f"Product {number}",
+                price_with_vat=11.2,
+                price_without_vat=10.0,
+                tax_rate=0.12,
+                inventory_count=5,
+                measurement_of_quantity=2,
+                category=self.category,
+                average_price=0.0,
+            )
+            for number in range(500)
+        )
+
+    def post_import(self, products, quantity=3, import_price=8.0):
+        data = {"supplier": self.supplier.id}
+        for index, product_id in enumerate(products):
+            data[f"products[{index}].product_id"] = product_id
+            data[f"products[{index}].quantity"] = quantity
+            data[f"products[{index}].price_with_vat"] = 22.4
+            data[f"products[{index}].import_price"] = import_price
+        return self.client.post(reverse("stock-import-list"), data, format="multipart")
+
+    def test_query_count_does_not_depend_on_number_of_lines(self):
+        # Both sizes fit in one bulk statement even on SQLite, which splits large batches.
+        product_ids = [product.id for product in self.products]
+        with CaptureQueriesContext(connection) as small:
+            response = self.post_import(product_ids[:5])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with CaptureQueriesContext(connection) as large:
+            response = self.post_import(product_ids[5:105])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(large), len(small))
+
+    def test_large_import_updates_inventory_prices_and_average_price(self):
+        self.post_import([product.id for product in self.products], import_price=8.0)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_import([product.id for product in self.products], quantity=1, import_price=12.0)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertLess(len(queries), 30)
+
+        self.assertEqual(Stockentry.objects.filter(movement_type=StockMovementType.INCOMING).count(), 1000)
+        for product in Product.objects.all():
+            self.assertEqual(product.inventory_count, 9)
+            self.assertEqual(product.price_with_vat, Decimal("22.40"))
+            self.assertEqual(product.price_without_vat, Decimal("20.00"))
+            self.assertEqual(product.average_price, Decimal("9.00"))  # (3 * 8 + 1 * 12) / 4
+
+    def test_unknown_product_rejects_whole_import(self):
+        response = self.post_import([self.products[0].id, 999999])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("999999", str(response.data))
+        self.assertEqual(StockImport.objects.count(), 0)
+        self.assertEqual(Stockentry.objects.count(), 0)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].price_with_vat, Decimal("11.20"))
+        self.assertEqual(self.products[0].inventory_count, 5)
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "Query plans are not supported on this database.")
+class StockentryQueryPlanTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Test Product",
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=0,
+            measurement_of_quantity=2,
+            average_price=0.0
+        )
+        Stockentry.objects.create(product=self.product, quantity=1, movement_type=StockMovementType.INCOMING)
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD"
+        ))
+
+    def test_latest_incoming_entry_of_product_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("product-stock-entry-history", args=[self.product.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(captured_sequential_scans(queries.captured_queries, [Stockentry]), [])
+
+    def test_entries_in_creation_order_use_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("stockentry-list"), {"pagination": "keyset"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(captured_sequential_scans(queries.captured_queries, [Stockentry]), [])
+
+
+class StockSnapshotTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name="Test Supplier", ico="12345678", dic="1234567890")
+        self.product = Product.objects.create(
+            name="Snapshot Product",
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=0,
+            measurement_of_quantity=2,
+            average_price=0.0
+        )
+        self.other_product = Product.objects.create(
+            name="Other Product",
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=0,
+            measurement_of_quantity=2,
+            average_price=0.0
+        )
+        self.entries = [
+            self.add_entry(self.product, 10, StockMovementType.INCOMING, datetime(2024, 1, 10, 12), import_price=8),
+            self.add_entry(self.product, 4, StockMovementType.OUTGOING, datetime(2024, 1, 20, 12)),
+            self.add_entry(self.other_product, 7, StockMovementType.INCOMING, datetime(2024, 2, 5, 12)),
+            self.add_entry(self.product, 6, StockMovementType.INCOMING, datetime(2024, 2, 10, 12), import_price=10),
+            self.add_entry(self.product, 3, StockMovementType.OUTGOING, datetime(2024, 3, 15, 12)),
+        ]
+
+    def add_entry(self, product, quantity, movement_type, date_created, import_price=None):
+        entry = Stockentry.objects.create(
+            product=product, quantity=quantity, movement_type=movement_type,
+            supplier=self.supplier, import_price=import_price
+        )
+        Stockentry.objects.filter(pk=entry.pk).update(date_created=timezone.make_aware(date_created))
+        entry.refresh_from_db()
+        return entry
+
+    def at(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def test_inventory_at_without_snapshots_scans_ledger(self):
+        self.assertEqual(inventory_at(self.at(2024, 1, 15)), {self.product.id: 10})
+        self.assertEqual(inventory_at(self.at(2024, 2, 20)), {self.product.id: 12, self.other_product.id: 7})
+        self.assertEqual(inventory_at(self.at(2024, 1, 1)), {})
+
+    def test_build_waits_for_the_entries_of_a_period_just_ended(self):
+        midnight = self.at(2024, 3, 1)
+        with patch("api.warehouse.snapshots.timezone.now", return_value=midnight + SETTLE_DELAY / 2):
+            self.assertEqual(build_stock_snapshots(SnapshotGranularity.MONTH), 1)
+        self.assertFalse(StockSnapshot.objects.filter(period_end=midnight).exists())
+
+        with patch("api.warehouse.snapshots.timezone.now", return_value=midnight + SETTLE_DELAY):
+            self.assertEqual(build_stock_snapshots(SnapshotGranularity.MONTH), 1)
+        self.assertTrue(StockSnapshot.objects.filter(period_end=midnight).exists())
+
+    def test_build_takes_each_closed_period_once(self):
+        periods = build_stock_snapshots(SnapshotGranularity.MONTH, until=self.at(2024, 3, 20))
+        self.assertEqual(periods, 2)
+        self.assertEqual(build_stock_snapshots(SnapshotGranularity.MONTH, until=self.at(2024, 3, 20)), 0)
+
+        february = StockSnapshot.objects.get(
+            granularity=SnapshotGranularity.MONTH, period_end=self.at(2024, 3, 1), product=self.product
+        )
+        self.assertEqual(february.period_start, self.at(2024, 2, 1))
+        self.assertEqual(february.balance, 12)
+        self.assertEqual(february.incoming_cost_total, Decimal("140"))
+        # The other product has no entries in January, so it only has a February snapshot.
+        self.assertEqual(StockSnapshot.objects.filter(product=self.other_product).count(), 1)
+
+    def test_queries_match_ledger_scan_with_snapshots(self):
+        build_stock_snapshots(SnapshotGranularity.DAY, until=self.at(2024, 3, 1))
+        build_stock_snapshots(SnapshotGranularity.MONTH, until=self.at(2024, 3, 1))
+
+        # The latest period end, its snapshots and the entries made since.
+        with self.assertNumQueries(3):
+            self.assertEqual(inventory_at(self.at(2024, 3, 20)), {self.product.id: 9, self.other_product.id: 7})
+        self.assertEqual(inventory_at(self.at(2024, 1, 20, 12)), {self.product.id: 10})
+        self.assertEqual(inventory_at(self.at(2024, 1, 20, 13), [self.product.id]), {self.product.id: 6})
+
+        movements = movements_between(self.at(2024, 1, 15), self.at(2024, 3, 1))
+        self.assertEqual(movements[self.product.id].incoming_quantity, 6)
+        self.assertEqual(movements[self.product.id].outgoing_quantity, 4)
+        self.assertEqual(movements[self.product.id].incoming_cost, Decimal("60"))
+        self.assertEqual(movements[self.other_product.id].balance, 7)
+        self.assertNotIn(self.product.id, movements_between(self.at(2024, 3, 16), self.at(2024, 4, 1)))
+
+    def test_changing_past_entry_corrects_later_snapshots(self):
+        build_stock_snapshots(SnapshotGranularity.MONTH, until=self.at(2024, 3, 1))
+
+        outgoing = self.entries[1]
+        outgoing.quantity = 1
+        outgoing.save()
+        self.assertEqual(inventory_at(self.at(2024, 2, 1)), {self.product.id: 9})
+        self.assertEqual(inventory_at(self.at(2024, 3, 1))[self.product.id], 15)
+
+        self.entries[0].delete()
+        self.assertEqual(inventory_at(self.at(2024, 3, 1))[self.product.id], 5)
+        self.assertEqual(
+            ledger_positions_at(self.at(2024, 3, 1))[self.product.id].incoming_cost, Decimal("60")
+        )
+        # The priced quantity and the entry count are corrected along with the totals.
+        self.assertEqual(
+            ledger_positions_at(self.at(2024, 3, 1))[self.product.id],
+            ledger_movements(end=self.at(2024, 3, 1))[self.product.id],
+        )
+
+    def test_month_periods_roll_over_the_year(self):
+        start = period_start(self.at(2024, 12, 31, 23, 30), SnapshotGranularity.MONTH)
+        self.assertEqual(start, self.at(2024, 12, 1))
+        self.assertEqual(next_period_start(start, SnapshotGranularity.MONTH), self.at(2025, 1, 1))
+
+
+class ReconcileStockCommandTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Reconciled Product",
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=0,
+            measurement_of_quantity=2,
+            average_price=0.0
+        )
+        Stockentry.objects.create(
+            product=self.product, quantity=10, movement_type=StockMovementType.INCOMING, import_price=5
+        )
+        Stockentry.objects.create(product=self.product, quantity=3, movement_type=StockMovementType.OUTGOING)
+
+    def test_matching_counters_are_reported_clean(self):
+        output = StringIO()
+        call_command("reconcile_stock", stdout=output)
+        self.assertIn("match the ledger", output.getvalue())
+
+    def test_drifted_inventory_is_reported_and_fixed(self):
+        Product.objects.filter(pk=self.product.pk).update(inventory_count=42)
+
+        output = StringIO()
+        call_command("reconcile_stock", stdout=output)
+        self.assertIn("Found 1 products", output.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory_count, 42)
+
+        call_command("reconcile_stock", fix=True, stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory_count, 7)
+
+    def test_verify_snapshots_detects_wrong_snapshot(self):
+        Stockentry.objects.update(date_created=timezone.now() - timedelta(days=3))
+        call_command("build_stock_snapshots", stdout=StringIO())
+        StockSnapshot.objects.update(outgoing_quantity_total=0)
+
+        output = StringIO()
+        call_command("reconcile_stock", verify_snapshots=True, stdout=output)
+        self.assertIn("1 wrong snapshots", output.getvalue())
+
+
+class InventoryValuationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.manager = CustomUser.objects.create_user(username="manager", password="password", role="MA")
+        self.cashier = CustomUser.objects.create_user(username="cashier", password="password", role="CA")
+        self.first_supplier = Supplier.objects.create(name="First Supplier", ico="12345678", dic="1234567890")
+        self.second_supplier = Supplier.objects.create(name="Second Supplier", ico="87654321", dic="0987654321")
+        self.drinks = Category.objects.create(name="Drinks")
+        self.snacks = Category.objects.create(name="Snacks")
+        self.water = self.create_product("Water", self.drinks, 0.21)
+        self.chips = self.create_product("Chips", self.snacks, 0.12)
+
+        self.add_entry(self.chips, 5, StockMovementType.INCOMING, datetime(2024, 1, 5, 12), self.first_supplier, 4)
+        self.add_entry(self.water, 10, StockMovementType.INCOMING, datetime(2024, 1, 10, 12), self.first_supplier, 8)
+        self.add_entry(self.water, 10, StockMovementType.INCOMING, datetime(2024, 2, 10, 12), self.second_supplier, 12)
+        self.add_entry(self.water, 15, StockMovementType.OUTGOING, datetime(2024, 3, 1, 12))
+
+    def create_product(self, name, category, tax_rate, **fields):
+        return Product.objects.create(
+            name=name,
+            category=category,
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=tax_rate,
+            inventory_count=fields.pop("inventory_count", 0),
+            measurement_of_quantity=1,
+            average_price=fields.pop("average_price", 0.0),
+        )
+
+    def add_entry(self, product, quantity, movement_type, date_created, supplier=None, import_price=None):
+        entry = Stockentry.objects.create(
+            product=product, quantity=quantity, movement_type=movement_type,
+            supplier=supplier, import_price=import_price
+        )
+        Stockentry.objects.filter(pk=entry.pk).update(date_created=timezone.make_aware(date_created))
+
+    def values(self, report):
+        return {row["name"]: row["value"] for row in report["rows"]}
+
+    def test_weighted_average_by_category_is_one_aggregate_query(self):
+        # The aggregate and the category names.
+        with self.assertNumQueries(2):
+            report = inventory_valuation("average", "category")
+        self.assertEqual(self.values(report), {"Drinks": Decimal("50.00"), "Snacks": Decimal("20.00")})
+        self.assertEqual(report["total_quantity"], 10)
+        self.assertEqual(report["total_value"], Decimal("70.00"))
+
+    def test_weighted_average_by_supplier_uses_latest_delivery(self):
+        report = inventory_valuation("average", "supplier")
+        self.assertEqual(self.values(report), {"Second Supplier": Decimal("50.00"), "First Supplier": Decimal("20.00")})
+
+    def test_fifo_values_remaining_stock_at_latest_deliveries(self):
+        report = inventory_valuation("fifo", "supplier")
+        self.assertEqual(self.values(report), {"Second Supplier": Decimal("60.00"), "First Supplier": Decimal("20.00")})
+
+        report = inventory_valuation("fifo", "tax_rate")
+        self.assertEqual(self.values(report), {"21 %": Decimal("60.00"), "12 %": Decimal("20.00")})
+
+    def test_fifo_values_stock_without_deliveries_at_average_price(self):
+        self.create_product("Counted", self.snacks, 0.12, inventory_count=3, average_price=2.0)
+        report = inventory_valuation("fifo", "category")
+        self.assertEqual(self.values(report)["Snacks"], Decimal("26.00"))
+
+    def test_valuation_as_of_date_reads_ledger(self):
+        as_of = parse_as_of("2024-01-31")
+        self.assertEqual(self.values(inventory_valuation("average", "category", as_of)),
+                         {"Drinks": Decimal("80.00"), "Snacks": Decimal("20.00")})
+
+        build_stock_snapshots(SnapshotGranularity.MONTH, until=parse_as_of("2024-03-31"))
+        report = inventory_valuation("fifo", "product", parse_as_of("2024-02-29"))
+        self.assertEqual(self.values(report), {"Water": Decimal("200.00"), "Chips": Decimal("20.00")})
+        report = inventory_valuation("average", "product", parse_as_of("2024-03-01"))
+        self.assertEqual(self.values(report)["Water"], Decimal("50.00"))
+
+    def test_endpoint_returns_report_and_streams_csv(self):
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(reverse("stock-valuation"), {"method": "fifo", "group_by": "category"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_value"], Decimal("80.00"))
+
+        response = self.client.get(reverse("stock-valuation"), {"output": "csv"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "group,name,quantity,value")
+        self.assertEqual(lines[-1], "total,,10,70.00")
+
+    async def test_csv_is_streamed_asynchronously_over_asgi(self):
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.manager).access_token}"}
+        response = await self.async_client.get(reverse("stock-valuation"), {"output": "csv"}, headers=headers)
+
+        self.assertTrue(response.is_async)
+        lines = b"".join([part async for part in response.streaming_content]).decode().splitlines()
+        self.assertEqual(lines[0], "group,name,quantity,value")
+        self.assertEqual(lines[-1], "total,,10,70.00")
+
+    def test_endpoint_validates_parameters_and_permissions(self):
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(reverse("stock-valuation"), {"method": "lifo"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("stock-valuation"), {"as_of": "31.1.2024"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.cashier)
+        response = self.client.get(reverse("stock-valuation"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_endpoint_queues_job(self):
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(reverse("stock-valuation"), {"async": "true", "method": "fifo"})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            Worker().run_once()
+            job = Job.objects.get(pk=response.data["id"])
+            self.assertEqual(job.status, JobStatus.SUCCEEDED)
+            self.assertEqual(job.result, {"rows": 2, "total_value": "80.00"})
+            self.assertIn(b"Drinks,5,60.00", job.result_file.read())
+            job.result_file.close()
+
+    def test_command_writes_csv(self):
+        output = StringIO()
+        call_command("inventory_valuation", method="fifo", group_by="supplier", stdout=output)
+        self.assertIn("Second Supplier,5,60.00", output.getvalue())
+
+
+class ReorderSuggestionTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.manager = CustomUser.objects.create_user(username="manager", password="password", role="MA")
+        self.cashier = CustomUser.objects.create_user(username="cashier", password="password", role="CA")
+        self.slow_supplier = Supplier.objects.create(name="Slow Supplier", ico="1", dic="1", lead_time_days=7)
+        self.fast_supplier = Supplier.objects.create(name="Fast Supplier", ico="2", dic="2", lead_time_days=2)
+        self.now = timezone.now()
+
+        self.cola = self.create_product("Cola")
+        self.chips = self.create_product("Chips")
+        self.water = self.create_product("Water")
+        self.add_entry(self.cola, 100, StockMovementType.INCOMING, 40, self.slow_supplier)
+        self.add_entry(self.chips, 100, StockMovementType.INCOMING, 40, self.fast_supplier)
+        self.add_entry(self.water, 100, StockMovementType.INCOMING, 40)
+        for days_ago in range(28):
+            self.add_entry(self.cola, 2, StockMovementType.OUTGOING, days_ago + 0.5)
+            self.add_entry(self.chips, 1, StockMovementType.OUTGOING, days_ago + 0.5)
+        self.add_entry(self.water, 14, StockMovementType.OUTGOING, 3)
+        self.add_entry(self.water, 9, StockMovementType.OUTGOING, 30)
+
+        for product, inventory_count in [(self.cola, 5), (self.chips, 50), (self.water, 0)]:
+            Product.objects.filter(pk=product.pk).update(inventory_count=inventory_count)
+
+    def create_product(self, name):
+        return Product.objects.create(
+            name=name,
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=0,
+            measurement_of_quantity=1,
+            average_price=0.0,
+        )
+
+    def add_entry(self, product, quantity, movement_type, days_ago, supplier=None):
+        entry = Stockentry.objects.create(
+            product=product, quantity=quantity, movement_type=movement_type, supplier=supplier
+        )
+        Stockentry.objects.filter(pk=entry.pk).update(date_created=self.now - timedelta(days=days_ago))
+        entry.refresh_from_db()
+        return entry
+
+    def velocities(self):
+        return dict(SalesVelocity.objects.values_list("product_id", "quantity_sold"))
+
+    def test_rebuild_counts_outgoing_quantity_in_window(self):
+        self.assertEqual(rebuild_sales_velocity(self.now), 3)
+        self.assertEqual(self.velocities(), {self.cola.id: 56, self.chips.id: 28, self.water.id: 14})
+
+    def test_refresh_moves_window_incrementally(self):
+        rebuild_sales_velocity(self.now)
+        self.add_entry(self.water, 4, StockMovementType.OUTGOING, -0.5)
+        later = self.now + timedelta(days=1)
+
+        refresh_sales_velocity(later)
+        incremental = self.velocities()
+        rebuild_sales_velocity(later)
+        self.assertEqual(incremental, self.velocities())
+        self.assertEqual(incremental[self.cola.id], 54)
+        self.assertEqual(incremental[self.water.id], 18)
+
+    def test_refresh_stops_short_of_entries_that_may_not_be_committed(self):
+        rebuild_sales_velocity(self.now - timedelta(hours=1))
+        self.add_entry(self.water, 4, StockMovementType.OUTGOING, 0)
+
+        refresh_sales_velocity()
+        self.assertLessEqual(SalesVelocity.objects.get(pk=self.water.id).window_end, timezone.now() - SETTLE_DELAY)
+        self.assertEqual(self.velocities()[self.water.id], 14)
+
+        refresh_sales_velocity(timezone.now())
+        refresh_sales_velocity(timezone.now())
+        self.assertEqual(self.velocities()[self.water.id], 18)
+
+    def test_changing_entry_in_window_adjusts_velocity(self):
+        rebuild_sales_velocity(self.now)
+        entry = Stockentry.objects.filter(product=self.water, quantity=14).get()
+        entry.delete()
+        self.assertNotIn(self.water.id, dict(SalesVelocity.objects.filter(quantity_sold__gt=0)
+                                             .values_list("product_id", "quantity_sold")))
+
+    def test_suggestions_are_grouped_per_supplier(self):
+        groups = reorder_suggestions()
+        self.assertEqual([group["supplier_name"] for group in groups], ["Slow Supplier", None])
+
+        cola = groups[0]["products"][0]
+        self.assertEqual(cola["product_id"], self.cola.id)
+        self.assertEqual(cola["daily_velocity"], Decimal("2.000"))
+        self.assertEqual(cola["days_of_stock"], Decimal("2.5"))
+        self.assertEqual(cola["reorder_point"], 20)  # 2 a day for 7 days of lead time and 3 safety days
+        self.assertEqual(cola["suggested_quantity"], 29)  # 2 a day for 17 days, minus the stock of 5
+
+        water = groups[1]["products"][0]
+        self.assertEqual(groups[1]["lead_time_days"], 7)
+        self.assertEqual(water["suggested_quantity"], 9)
+
+    def test_endpoint_returns_suggestions(self):
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(reverse("reorder-suggestions"), {"supplier": self.slow_supplier.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["supplier_id"], self.slow_supplier.id)
+
+        response = self.client.get(reverse("reorder-suggestions"), {"safety_days": 50})
+        self.assertIn("Fast Supplier", [group["supplier_name"] for group in response.data])
+
+    def test_endpoint_validates_parameters_and_permissions(self):
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(reverse("reorder-suggestions"), {"safety_days": "many"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.cashier)
+        response = self.client.get(reverse("reorder-suggestions"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
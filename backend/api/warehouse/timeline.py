@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from api.warehouse.models import Stockentry, StockMovementType
+from api.warehouse.snapshots import EMPTY_POSITION, ledger_positions_at
+
+
+def signed_quantity(entry):
+    """
+    Return the change of the stock caused by a stock entry.
+    """
+    return entry.quantity if entry.movement_type == StockMovementType.INCOMING else -entry.quantity
+
+
+def balance_before(entry):
+    """
+    Return the ledger balance of the product of a stock entry just before the entry.
+
+    The balance at the start of the entry's timestamp is read from the snapshots
+    plus the entries made since, and the entries sharing the timestamp with a lower
+    ID are added, matching the (date_created, id) order of the timeline.
+
+    Args:
+        entry (Stockentry): The stock entry.
+
+    Returns:
+        int: The incoming minus the outgoing quantity of the earlier entries.
+    """
+    position = ledger_positions_at(entry.date_created, [entry.product_id]).get(entry.product_id, EMPTY_POSITION)
+    ties = Stockentry.objects.filter(
+        product_id=entry.product_id, date_created=entry.date_created, id__lt=entry.id
+    ).aggregate(
+        incoming=Sum("quantity", filter=Q(movement_type=StockMovementType.INCOMING)),
+        outgoing=Sum("quantity", filter=Q(movement_type=StockMovementType.OUTGOING)),
+    )
+    return position.balance + (ties["incoming"] or 0) - (ties["outgoing"] or 0)
+
+
+def annotate_running_balance(entries):
+    """
+    Set the balance after each entry of a page of one product's timeline.
+
+    Only the balance before the oldest entry of the page is queried, the others
+    follow from the quantities on the page, so every page costs the same however
+    deep into the history it is.
+
+    Args:
+        entries (list): Stock entries of one product, in any order.
+
+    Returns:
+        list: The same entries, each with a balance attribute.
+    """
+    if not entries:
+        return entries
+    ordered = sorted(entries, key=lambda entry: (entry.date_created, entry.id))
+    balance = balance_before(ordered[0])
+    for entry in ordered:
+        balance += signed_quantity(entry)
+        entry.balance = balance
+    return entries
+
+
+def movement_summary(product):
+    """
+    Summarize the stock ledger of a product.
+
+    The quantities, the incoming cost, the priced quantity and the number of entries
+    are read from the stock snapshots plus the entries made since, and the first and
+    last entry dates are two single-row reads of the (product, date_created) index,
+    so the summary costs the same however long the history is. The average import
+    price is weighted by the quantity of the priced incoming entries; without any,
+    the average price of the product is returned. The drift is the difference
+    between the inventory counter and the ledger balance, which is where shrinkage
+    and manual corrections show up.
+
+    Args:
+        product (Product): The product, with its inventory_count and average_price loaded.
+
+    Returns:
+        dict: The incoming and outgoing quantities, ledger balance, inventory count, drift,
+            incoming cost, average import price, number of entries and first and last entry dates.
+    """
+    now = timezone.now()
+    position = ledger_positions_at(now, [product.pk]).get(product.pk, EMPTY_POSITION)
+    dates = (
+        Stockentry.objects.filter(product_id=product.pk, date_created__lt=now)
+        .order_by("date_created", "id")
+        .values_list("date_created", flat=True)
+    )
+    incoming_cost = Decimal(str(position.incoming_cost or 0))
+    if position.priced_quantity:
+        average_import_price = incoming_cost / position.priced_quantity
+    else:
+        average_import_price = Decimal(str(product.average_price or 0))
+    inventory_count = product.inventory_count or 0
+    return {
+        "incoming_quantity": position.incoming_quantity,
+        "outgoing_quantity": position.outgoing_quantity,
+        "balance": position.balance,
+        "inventory_count": inventory_count,
+        "drift": inventory_count - position.balance,
+        "incoming_cost": incoming_cost.quantize(Decimal("0.01")),
+        "average_import_price": average_import_price.quantize(Decimal("0.01")),
+        "movement_count": position.entry_count,
+        "first_movement": dates.first() if position.entry_count else None,
+        "last_movement": dates.last() if position.entry_count else None,
+    }
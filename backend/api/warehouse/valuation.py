@@ -0,0 +1,264 @@
+import csv
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import F, OuterRef, Subquery, Sum, Window
+from django.utils import timezone
+
+from api.product_catalog.catalog_csv import Echo
+from api.product_catalog.models import Category, Product
+from api.warehouse.models import Stockentry, StockMovementType, Supplier
+from api.warehouse.snapshots import EMPTY_POSITION, ledger_positions_at
+
+VALUATION_METHODS = ("average", "fifo")
+VALUATION_GROUPS = ("category", "supplier", "tax_rate", "product")
+VALUATION_COLUMNS = ["group", "name", "quantity", "value"]
+CHUNK_SIZE = 2000
+CENT = Decimal("0.01")
+
+
+def parse_as_of(value):
+    """
+    Return the moment a valuation "as of" a date refers to: the end of that local day.
+
+    Args:
+        value (str): A date in the YYYY-MM-DD format, or an empty value for the current stock.
+
+    Returns:
+        datetime: The start of the following day, or None for an empty value.
+
+    Raises:
+        ValueError: If the date is invalid.
+    """
+    if not value:
+        return None
+    day = datetime.strptime(value, "%Y-%m-%d").date() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def latest_supplier(as_of=None):
+    """
+    Return a subquery selecting the supplier of the latest incoming entry of the outer product.
+
+    Args:
+        as_of (datetime): Only consider entries made before this moment.
+
+    Returns:
+        Subquery: The supplier ID, or NULL if the product was never delivered by a known supplier.
+    """
+    entries = Stockentry.objects.filter(
+        product=OuterRef("pk"), movement_type=StockMovementType.INCOMING, supplier__isnull=False
+    )
+    if as_of is not None:
+        entries = entries.filter(date_created__lt=as_of)
+    return Subquery(entries.order_by("-date_created", "-id").values("supplier_id")[:1])
+
+
+def _group_keys(group_by, product_id, category_id, tax_rate, supplier_id):
+    return {
+        "category": category_id,
+        "supplier": supplier_id,
+        "tax_rate": tax_rate,
+        "product": product_id,
+    }[group_by]
+
+
+def _average_rows_in_database(group_by):
+    """
+    Value the current stock at the weighted average prices, grouped in a single aggregate query.
+    """
+    fields = {"category": "category_id", "supplier": "supplier_key", "tax_rate": "tax_rate", "product": "pk"}
+    products = Product.objects.filter(inventory_count__gt=0)
+    if group_by == "supplier":
+        products = products.annotate(supplier_key=latest_supplier())
+    rows = (
+        products.values(key=F(fields[group_by]))
+        .annotate(quantity=Sum("inventory_count"), value=Sum(F("inventory_count") * F("average_price")))
+        .order_by()
+    )
+    return {row["key"]: [row["quantity"], Decimal(str(row["value"] or 0))] for row in rows}
+
+
+def _products(as_of, with_supplier):
+    """
+    Yield the ID, category, tax rate, latest supplier, stock and average price of every product with stock.
+
+    The stock and average price are the current counters, or the ledger totals at
+    as_of read from the snapshots.
+    """
+    fields = ["pk", "category_id", "tax_rate", "inventory_count", "average_price"]
+    products = Product.objects.order_by("pk")
+    if with_supplier:
+        products = products.annotate(supplier_key=latest_supplier(as_of))
+        fields.append("supplier_key")
+
+    positions = None
+    if as_of is not None:
+        positions = ledger_positions_at(as_of)
+    else:
+        products = products.filter(inventory_count__gt=0)
+
+    for pk, category_id, tax_rate, quantity, average_price, *supplier in products.values_list(*fields).iterator(
+        chunk_size=CHUNK_SIZE
+    ):
+        if positions is not None:
+            position = positions.get(pk, EMPTY_POSITION)
+            if position.balance <= 0:
+                continue
+            quantity = position.balance
+            average_price = (
+                position.incoming_cost / position.incoming_quantity if position.incoming_quantity > 0 else Decimal(0)
+            )
+        yield pk, category_id, tax_rate, supplier[0] if supplier else None, quantity, Decimal(str(average_price))
+
+
+def _fifo_layers(as_of):
+    """
+    Yield the incoming entries of every product from the newest, with the quantity delivered after each.
+
+    The running quantity is computed by a window function in the database, so the
+    layers still covering the stock are found in one pass without loading the
+    whole history of each product.
+    """
+    entries = Stockentry.objects.filter(movement_type=StockMovementType.INCOMING)
+    if as_of is not None:
+        entries = entries.filter(date_created__lt=as_of)
+    else:
+        entries = entries.filter(product__inventory_count__gt=0)
+    entries = entries.annotate(
+        newer_quantity=Window(
+            Sum("quantity"),
+            partition_by=[F("product_id")],
+            order_by=[F("date_created").desc(), F("id").desc()],
+        ) - F("quantity"),
+    ).order_by("product_id", "-date_created", "-id")
+    yield from entries.values_list(
+        "product_id", "newer_quantity", "quantity", "import_price", "supplier_id"
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _rows_in_python(method, group_by, as_of):
+    """
+    Value the stock product by product for FIFO or an as-of date, summing the values per group.
+    """
+    groups = defaultdict(lambda: [0, Decimal(0)])
+    products = {}
+    for pk, category_id, tax_rate, supplier_id, quantity, average_price in _products(
+        as_of, with_supplier=group_by == "supplier" and method == "average"
+    ):
+        if method == "average":
+            group = groups[_group_keys(group_by, pk, category_id, tax_rate, supplier_id)]
+            group[0] += quantity
+            group[1] += quantity * average_price
+        else:
+            products[pk] = (category_id, tax_rate, quantity, average_price)
+    if method == "average":
+        return groups
+
+    # The stock left is the latest deliveries: walk the layers from the newest until the stock is covered.
+    covered = defaultdict(int)
+    for product_id, newer_quantity, quantity, import_price, supplier_id in _fifo_layers(as_of):
+        product = products.get(product_id)
+        if product is None or newer_quantity >= product[2]:
+            continue
+        category_id, tax_rate, stock, average_price = product
+        taken = min(quantity, stock - newer_quantity)
+        price = Decimal(str(import_price)) if import_price is not None else average_price
+        group = groups[_group_keys(group_by, product_id, category_id, tax_rate, supplier_id)]
+        group[0] += taken
+        group[1] += taken * price
+        covered[product_id] += taken
+
+    # Stock not explained by any delivery, e.g. an initial count, is valued at the average price.
+    for product_id, (category_id, tax_rate, stock, average_price) in products.items():
+        uncovered = stock - covered[product_id]
+        if uncovered > 0:
+            group = groups[_group_keys(group_by, product_id, category_id, tax_rate, None)]
+            group[0] += uncovered
+            group[1] += uncovered * average_price
+    return groups
+
+
+def _group_names(group_by, keys):
+    models = {"category": Category, "supplier": Supplier, "product": Product}
+    if group_by in models:
+        return dict(models[group_by].objects.values_list("pk", "name").iterator(chunk_size=CHUNK_SIZE))
+    return {key: f"{(Decimal(key) * 100).normalize():f} %" for key in keys if key is not None}
+
+
+def inventory_valuation(method="average", group_by="category", as_of=None):
+    """
+    Compute the value of the stock per category, supplier, tax rate or product.
+
+    With the weighted average method the stock is valued at the average import price
+    of each product. With FIFO the stock is assumed to be the latest deliveries, and
+    each delivery still in stock is valued at its own import price and counted under
+    its own supplier; deliveries without an import price and stock not explained by
+    any delivery are valued at the average price.
+
+    The current weighted average valuation is a single aggregate query over the
+    product counters. Other valuations read the stock at as_of from the ledger
+    snapshots and the delivery layers in one windowed query, so the number of
+    queries does not grow with the number of products. Nothing is locked, so the report can
+    run next to the tills.
+
+    Args:
+        method (str): One of VALUATION_METHODS.
+        group_by (str): One of VALUATION_GROUPS.
+        as_of (datetime): Value the stock at this moment from the ledger, or None for the current counters.
+
+    Returns:
+        dict: The rows with the group key, its name, the quantity and the value, sorted by
+            value, and the total quantity and value.
+
+    Raises:
+        ValueError: If the method or grouping is unknown.
+    """
+    if method not in VALUATION_METHODS:
+        raise ValueError(f"Unknown valuation method '{method}', use one of: {', '.join(VALUATION_METHODS)}.")
+    if group_by not in VALUATION_GROUPS:
+        raise ValueError(f"Unknown grouping '{group_by}', use one of: {', '.join(VALUATION_GROUPS)}.")
+
+    if method == "average" and as_of is None:
+        groups = _average_rows_in_database(group_by)
+    else:
+        groups = _rows_in_python(method, group_by, as_of)
+
+    names = _group_names(group_by, groups.keys())
+    rows = [
+        {
+            "group": str(key) if key is not None else None,
+            "name": names.get(key, ""),
+            "quantity": quantity,
+            "value": value.quantize(CENT, rounding=ROUND_HALF_UP),
+        }
+        for key, (quantity, value) in groups.items()
+        if quantity
+    ]
+    rows.sort(key=lambda row: (-row["value"], row["name"]))
+    return {
+        "method": method,
+        "group_by": group_by,
+        "as_of": as_of.isoformat() if as_of is not None else None,
+        "rows": rows,
+        "total_quantity": sum(row["quantity"] for row in rows),
+        "total_value": sum((row["value"] for row in rows), Decimal(0)),
+    }
+
+
+def iter_valuation_csv(report):
+    """
+    Yield a valuation report as CSV lines, including the header and a total line.
+
+    Args:
+        report (dict): A report returned by inventory_valuation().
+
+    Yields:
+        str: One CSV line.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(VALUATION_COLUMNS)
+    for row in report["rows"]:
+        yield writer.writerow([row[column] if row[column] is not None else "" for column in VALUATION_COLUMNS])
+    yield writer.writerow(["total", "", report["total_quantity"], report["total_value"]])
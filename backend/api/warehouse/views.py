@@ -1,9 +1,17 @@
+import re
+
 from rest_framework.filters import OrderingFilter
 from django_filters import rest_framework as filters
-from rest_framework import viewsets
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status, viewsets
 from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from api.common.pagination import CustomPageNumberPagination
+from api.common.streaming import streaming_response
 from api.warehouse.filters import SupplierFilter, StockentryFilter, StockImportFilter
 from api.warehouse.models import StockImport, Supplier, Stockentry
 from api.warehouse.serializers import (
@@ -12,7 +20,47 @@ from api.warehouse.serializers import (
     StockentryWriteSerializer,
     SupplierSerializer,
 )
-from authentication.permissions import IsAdminOrManagerOrCashier
+from api.warehouse.reorder import REVIEW_DAYS, SAFETY_DAYS, reorder_suggestions
+from api.warehouse.valuation import (
+    VALUATION_GROUPS,
+    VALUATION_METHODS,
+    inventory_valuation,
+    iter_valuation_csv,
+    parse_as_of,
+)
+from authentication.permissions import IsAdminOrManager, IsAdminOrManagerOrCashier
+from jobs.models import Job
+from jobs.serializers import JobSerializer
+from jobs.views import is_async
+
+# The stock import form sends its lines as "products[<index>].<field>" keys.
+PRODUCT_LINE_KEY = re.compile(r"^products\[(\d+)\]\.(\w+)$")
+
+
+def nest_product_lines(data):
+    """
+    Return stock import form data with its line keys nested into a "products" list.
+
+    Args:
+        data (QueryDict): The parsed form data and files of the request.
+
+    Returns:
+        dict: The other fields unchanged and "products" as a list of dictionaries,
+            ordered by index; data that is not form input is returned as is.
+    """
+    if not hasattr(data, "getlist"):
+        return data
+    nested = {}
+    lines = {}
+    for key, value in data.items():
+        match = PRODUCT_LINE_KEY.match(key)
+        if match:
+            lines.setdefault(int(match[1]), {})[match[2]] = value
+        else:
+            nested[key] = value
+    if lines:
+        nested["products"] = [lines[index] for index in sorted(lines)]
+    return nested
 
 
 class SupplierViewSet(viewsets.ModelViewSet):
@@ -47,14 +95,16 @@ class StockentryViewSet(viewsets.ModelViewSet):
     Different serializers are used for read and write operations.
 
     Attributes:
-        queryset (QuerySet): All Stockentry objects.
+        queryset (QuerySet): All Stockentry objects, with their product and supplier joined.
         pagination_class (Pagination): Custom pagination class.
+        keyset_ordering (tuple): Fields used by the keyset pagination mode.
         filterset_class (FilterSet): Custom filter class for Stockentry model.
         swagger_tags (list): Tags for Swagger documentation.
         permission_classes (list): Permission classes for access control.
     """
-    queryset = Stockentry.objects.all()
+    queryset = Stockentry.objects.select_related("product", "supplier")
     pagination_class = CustomPageNumberPagination
+    keyset_ordering = ("date_created", "id")
     filterset_class = StockentryFilter
     swagger_tags = ["Stockentry"]
     permission_classes = [IsAdminOrManagerOrCashier]
@@ -83,6 +133,7 @@ class StockImportViewSet(viewsets.ModelViewSet):
         queryset (QuerySet): All StockImport objects, ordered by id.
         serializer_class (Serializer): The serializer class for StockImport model.
         pagination_class (Pagination): Custom pagination class.
+        keyset_ordering (tuple): Fields used by the keyset pagination mode.
         swagger_tags (list): Tags for Swagger documentation.
         permission_classes (list): Permission classes for access control.
         parser_classes (list): Parser classes for handling multipart form data.
@@ -90,6 +141,7 @@ class StockImportViewSet(viewsets.ModelViewSet):
     queryset = StockImport.objects.order_by("-date_created")
     serializer_class = StockImportCreateSerializer
     pagination_class = CustomPageNumberPagination
+    keyset_ordering = ("date_created", "id")
     swagger_tags = ["StockImport"]
     permission_classes = [IsAdminOrManagerOrCashier]
     parser_classes = [MultiPartParser, FormParser]
@@ -97,8 +149,109 @@ class StockImportViewSet(viewsets.ModelViewSet):
     filterset_class = StockImportFilter
     ordering_fields = ['date_created']
 
+    def create(self, request, *args, **kwargs):
+        """
+        Create a StockImport from the multipart form of the frontend.
+
+        The lines of the form are nested with nest_product_lines() before validation.
+
+        Returns:
+            Response: The created StockImport, or the validation errors with status 400.
+        """
+        serializer = self.get_serializer(data=nest_product_lines(request.data))
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
     # Commented out code:
     # def get_serializer_class(self):
     #     if self.action == "create":
     #         return StockImportCreateSerializer
     #     return StockImportCreateSerializer
+
+
+class InventoryValuationView(APIView):
+    """
+    API view returning the value of the stock per category, supplier, tax rate or product.
+
+    The stock is valued with the weighted average or FIFO method, currently or at the
+    end of a past date. The report is returned as JSON, or streamed as CSV with
+    ?output=csv. With ?async=true the CSV file is written by a background job instead,
+    and the queued job is returned with status 202.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrManager]
+    swagger_tags = ["Stockentry"]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("method", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(VALUATION_METHODS),
+                          description="The valuation method, average by default"),
+        openapi.Parameter("group_by", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(VALUATION_GROUPS),
+                          description="The grouping of the report, category by default"),
+        openapi.Parameter("as_of", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="Value the stock at the end of this date (YYYY-MM-DD)"),
+        openapi.Parameter("output", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=["csv"],
+                          description="Stream the report as a CSV file"),
+    ])
+    def get(self, request):
+        method = request.query_params.get("method", "average")
+        group_by = request.query_params.get("group_by", "category")
+        if method not in VALUATION_METHODS:
+            return Response({"error": f"Invalid method. Use one of: {', '.join(VALUATION_METHODS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if group_by not in VALUATION_GROUPS:
+            return Response({"error": f"Invalid group_by. Use one of: {', '.join(VALUATION_GROUPS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            as_of = parse_as_of(request.query_params.get("as_of"))
+        except ValueError:
+            return Response({"error": "Invalid as_of format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if is_async(request):
+            job = Job.objects.enqueue(
+                "inventory_valuation",
+                {"method": method, "group_by": group_by, "as_of": request.query_params.get("as_of")},
+                user=request.user,
+            )
+            return Response(JobSerializer(job, context={"request": request}).data, status=status.HTTP_202_ACCEPTED)
+
+        report = inventory_valuation(method, group_by, as_of)
+        if request.query_params.get("output") == "csv":
+            response = streaming_response(request, iter_valuation_csv(report), content_type="text/csv")
+            response["Content-Disposition"] = 'attachment; filename="inventory-valuation.csv"'
+            return response
+        return Response(report)
+
+
+class ReorderSuggestionView(APIView):
+    """
+    API view returning the products due for reordering, grouped by supplier.
+
+    The suggestions combine the stock of each product with its rolling sales
+    velocity, which is kept in a precomputed table, so the list is answered without
+    scanning the sales history.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrManager]
+    swagger_tags = ["Supplier"]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("supplier", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description="Only return the products of this supplier"),
+        openapi.Parameter("safety_days", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description=f"Extra days of demand kept in stock, {SAFETY_DAYS} by default"),
+        openapi.Parameter("review_days", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description=f"Days until the next order, {REVIEW_DAYS} by default"),
+    ])
+    def get(self, request):
+        try:
+            supplier_id = int(request.query_params["supplier"]) if request.query_params.get("supplier") else None
+            safety_days = int(request.query_params.get("safety_days", SAFETY_DAYS))
+            review_days = int(request.query_params.get("review_days", REVIEW_DAYS))
+        except ValueError:
+            return Response({"error": "supplier, safety_days and review_days must be integers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if safety_days < 0 or review_days < 0:
+            return Response({"error": "safety_days and review_days must not be negative."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(reorder_suggestions(supplier_id, safety_days, review_days))
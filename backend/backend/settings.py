@@ -14,9 +14,10 @@ import sys
 from datetime import timedelta
 from pathlib import Path
 from decouple import config
-import dj_database_url
 import os
 
+from helpers.database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,12 +42,14 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     'django_extensions',
     "drf_yasg",
     "rest_framework",
     "django_filters",
     "corsheaders",
     "authentication",
+    "api.common",
     "api.product_catalog",
     "api.warehouse",
     "api.invoices",
@@ -54,6 +57,7 @@ INSTALLED_APPS = [
     "settings",
     "stats",
     "api.daily_closure",
+    "jobs",
 ]
 
 MIDDLEWARE = [
@@ -92,18 +96,55 @@ WSGI_APPLICATION = "backend.wsgi.application"
 
 SECRET_KEY = config("SECRET_KEY")
 DEBUG = config("DEBUG", default=False, cast=bool)
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
+# DATABASE_URL replaces the DB_* variables when set. DB_CONNECTION_MODE is "persistent"
+# (sync and job workers), "pool" (ASGI workers, psycopg 3 pool) or "pgbouncer"; see
+# helpers.database.database_config.
+DATABASE_URL = config("DATABASE_URL", default="")
+if DATABASE_URL:
+    DATABASE_FIELDS = {}
+else:
+    DATABASE_FIELDS = {
         "NAME": config("DB_NAME"),
         "USER": config("DB_USER"),
         "PASSWORD": config("DB_PASSWORD"),
         "HOST": config("DB_HOST"),
         "PORT": config("DB_PORT"),
     }
+DATABASES = {
+    "default": database_config(
+        url=DATABASE_URL,
+        mode=config("DB_CONNECTION_MODE", default="persistent"),
+        conn_max_age=config("DB_CONN_MAX_AGE", default=60, cast=int),
+        health_checks=config("DB_CONN_HEALTH_CHECKS", default=True, cast=bool),
+        pool_min_size=config("DB_POOL_MIN_SIZE", default=2, cast=int),
+        pool_max_size=config("DB_POOL_MAX_SIZE", default=10, cast=int),
+        pool_timeout=config("DB_POOL_TIMEOUT", default=10, cast=float),
+        **DATABASE_FIELDS,
+    )
 }
 
-# DATABASES = {"default": dj_database_url.parse(config("DATABASE_URL"))}
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# CACHE_BACKEND selects one of the backends below. CACHE_LOCATION is the locmem
+# name, the directory of the file cache or the URL of a Redis (compatible) server.
+# locmem is local to each process: use file or redis as soon as job workers run
+# next to the web processes, otherwise runworker fails the jobs.E001 check.
+
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "pokladni-system"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", os.path.join(BASE_DIR, "cache")),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://127.0.0.1:6379/1"),
+    "dummy": ("django.core.cache.backends.dummy.DummyCache", ""),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[config("CACHE_BACKEND", default="locmem")]
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": config("CACHE_LOCATION", default=CACHE_DEFAULT_LOCATION),
+        "TIMEOUT": config("CACHE_TIMEOUT", default=300, cast=int),
+        "KEY_PREFIX": config("CACHE_KEY_PREFIX", default="pokladni"),
+    }
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -127,7 +168,7 @@ AUTH_USER_MODEL = "authentication.CustomUser"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authentication.authentication.AsyncJWTAuthentication",
     ),
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
 }
@@ -161,3 +202,7 @@ SIMPLE_JWT = {
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# Stock imports post every line of a delivery note as four multipart fields
+# (products[i].product_id, ...), so the default of 1000 fields caps them at ~250 lines.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = config("DATA_UPLOAD_MAX_NUMBER_FIELDS", default=10000, cast=int)
@@ -55,6 +55,22 @@ stats_schema_view = get_schema_view(
     ],
 )
 
+jobs_info = openapi.Info(
+    title="Jobs API",
+    default_version="v1",
+    description="Jobs API documentation",
+    contact=openapi.Contact(email="tomasnguyen43@gmail.com"),
+)
+
+jobs_schema_view = get_schema_view(
+    jobs_info,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+    patterns=[
+        path("jobs/", include("jobs.urls")),
+    ],
+)
+
 auth_info = openapi.Info(
     title="Authentication API",
     default_version="v1",
@@ -74,6 +90,7 @@ urlpatterns = [
     path("api/", include("api.urls")),
     path("settings/", include("settings.urls")),
     path("stats/", include("stats.urls")),
+    path("jobs/", include("jobs.urls")),
     path("auth/", include("authentication.urls")),
     path(
         "api/docs/",
@@ -115,4 +132,14 @@ urlpatterns = [
         stats_schema_view.with_ui("redoc", cache_timeout=0),
         name="stats-schema-redoc",
     ),
+    path(
+        "jobs/docs/",
+        jobs_schema_view.with_ui("swagger", cache_timeout=0),
+        name="jobs-schema-swagger-ui",
+    ),
+    path(
+        "jobs/redoc/",
+        jobs_schema_view.with_ui("redoc", cache_timeout=0),
+        name="jobs-schema-redoc",
+    ),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,67 @@
+import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
+
+POSTGRESQL_ENGINE = "django.db.backends.postgresql"
+CONNECTION_MODES = ("persistent", "pool", "pgbouncer")
+
+
+def database_config(url=None, mode="persistent", conn_max_age=60, health_checks=True,
+                    pool_min_size=2, pool_max_size=10, pool_timeout=10, **fields):
+    """
+    Build the settings of the default database for a connection mode.
+
+    Opening a PostgreSQL connection costs a few milliseconds of handshakes and
+    authentication, a measurable share of a till request. The modes avoid paying
+    it per request in the way that suits the worker type:
+
+    - "persistent" keeps the connection of every thread open for conn_max_age
+      seconds and checks it before reuse. Suits sync WSGI workers and job workers,
+      whose threads live as long as the process.
+    - "pool" shares a psycopg 3 connection pool per process. Suits ASGI workers,
+      whose sync code runs in short-lived threads that could not reuse a
+      persistent connection. Connections go back to the pool after each request.
+    - "pgbouncer" connects to an external pooler in transaction mode, which may
+      hand consecutive transactions to different server connections, so
+      server-side cursors are disabled. The connections to the pooler are
+      persistent too.
+
+    Args:
+        url (str): A database URL; if empty, the fields are used.
+        mode (str): One of CONNECTION_MODES.
+        conn_max_age (int): Seconds to keep a persistent connection, 0 to close it after each request.
+        health_checks (bool): Whether to check a persistent connection before reusing it.
+        pool_min_size (int): The number of connections the pool keeps open.
+        pool_max_size (int): The maximum number of connections of the pool.
+        pool_timeout (float): Seconds to wait for a free connection of a full pool.
+        **fields: The NAME, USER, PASSWORD, HOST and PORT of the database when no URL is given.
+
+    Returns:
+        dict: The settings of the database.
+
+    Raises:
+        ImproperlyConfigured: If the mode is unknown, or the pool mode is used with another database than PostgreSQL.
+    """
+    if mode not in CONNECTION_MODES:
+        raise ImproperlyConfigured(
+            f"Unknown database connection mode '{mode}', use one of: {', '.join(CONNECTION_MODES)}."
+        )
+
+    database = dict(dj_database_url.parse(url)) if url else {"ENGINE": POSTGRESQL_ENGINE, **fields}
+
+    if mode == "pool":
+        if database["ENGINE"] != POSTGRESQL_ENGINE:
+            raise ImproperlyConfigured("The pool connection mode needs PostgreSQL.")
+        # Django rejects persistent connections on top of a pool.
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": pool_min_size,
+            "max_size": pool_max_size,
+            "timeout": pool_timeout,
+        }
+        return database
+
+    database["CONN_MAX_AGE"] = conn_max_age
+    database["CONN_HEALTH_CHECKS"] = health_checks
+    if mode == "pgbouncer":
+        database["DISABLE_SERVER_SIDE_CURSORS"] = True
+    return database
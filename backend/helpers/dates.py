@@ -0,0 +1,21 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+
+
+def localize(value):
+    """
+    Return an aware datetime in the current time zone, treating naive values as local time.
+    """
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localtime(value)
+
+
+def day_start(value):
+    """
+    Return the start of the local day containing the given date or datetime.
+    """
+    if isinstance(value, datetime):
+        value = localize(value).date()
+    return timezone.make_aware(datetime.combine(value, time.min))
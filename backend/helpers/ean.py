@@ -0,0 +1,18 @@
+def normalize_ean(value):
+    """
+    Normalize an EAN code for storage and lookup.
+
+    Surrounding and inner whitespace and dashes are removed and letters are
+    upper-cased, so codes typed by hand match the codes sent by barcode scanners
+    with an exact (indexed) comparison.
+
+    Args:
+        value (str): The EAN code, or None.
+
+    Returns:
+        str or None: The normalized EAN code, or None if it is empty.
+    """
+    if value is None:
+        return None
+    value = "".join(str(value).split()).replace("-", "").upper()
+    return value or None
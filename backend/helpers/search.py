@@ -0,0 +1,60 @@
+import re
+import unicodedata
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_search_text(value):
+    """
+    Normalize text for diacritic- and case-insensitive searching.
+
+    The text is lower-cased, decomposed, and stripped of combining marks, so
+    "Čokoláda" and "cokolada" compare equal. Runs of non-word characters
+    become single spaces.
+
+    Args:
+        value (str): The text, or None.
+
+    Returns:
+        str: The normalized text, empty if the value is None.
+    """
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(value).casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_WORD_RE.findall(stripped))
+
+
+def search_words(value):
+    """
+    Split text into normalized search words.
+
+    Args:
+        value (str): The text, or None.
+
+    Returns:
+        list: The words of the normalized text.
+    """
+    return normalize_search_text(value).split()
+
+
+def trigrams(word):
+    """
+    Return the set of trigrams of a word, padded like PostgreSQL's pg_trgm.
+
+    Args:
+        word (str): A normalized word.
+
+    Returns:
+        set: The trigrams.
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(a, b):
+    """
+    Return the trigram similarity of two words, from 0 (nothing shared) to 1 (equal).
+    """
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
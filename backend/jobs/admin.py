@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "worker", "run_at", "date_created", "date_finished")
+    list_filter = ("status", "name")
+    search_fields = ("name", "worker")
+    readonly_fields = ("attempts", "worker", "heartbeat_at", "date_created", "date_started", "date_finished")
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "jobs"
+
+    def ready(self):
+        from jobs import checks  # noqa: F401 Registers the system checks.
+
+        # Job types are registered by the tasks modules of the apps.
+        autodiscover_modules("tasks")
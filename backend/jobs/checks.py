@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache",)
+
+
+@register("jobs", deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Check that the default cache is shared between the web and job worker processes.
+
+    The jobs invalidate cached values when they change data, e.g. the catalog
+    import, and a per-process cache would keep serving the old values in the web
+    processes until they expire.
+
+    Args:
+        app_configs (list): The app configs to check, unused.
+        **kwargs: Additional keyword arguments.
+
+    Returns:
+        list: The found errors.
+    """
+    if settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Error(
+            "The default cache is local to each process, so the job workers cannot invalidate "
+            "the values cached by the web processes.",
+            hint="Set CACHE_BACKEND to file (with a CACHE_LOCATION shared by all containers) or redis.",
+            id="jobs.E001",
+        )
+    ]
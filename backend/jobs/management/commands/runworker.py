@@ -0,0 +1,97 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.worker import HEARTBEAT_INTERVAL, POLL_INTERVAL, Worker
+
+
+def run_worker_process(stop_event, poll_interval, heartbeat_interval):
+    """
+    Entry point of a worker process of the pool.
+    """
+    # The parent stops the children through the event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    Worker(poll_interval=poll_interval, heartbeat_interval=heartbeat_interval, stop_event=stop_event).run()
+
+
+class Command(BaseCommand):
+    """
+    Management command to run the background job workers.
+
+    Every worker process polls the job table, claims the next due job and runs it,
+    so no message broker is needed. SIGINT and SIGTERM stop the workers after
+    their current job. A worker that dies while running a job is detected by its
+    missing heartbeat and the job is queued again. The worker pool refuses to
+    start with a per-process cache, whose values the jobs could not invalidate
+    for the web processes.
+    """
+
+    help = "Run worker processes executing the queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Run the due jobs in this process and exit when none is left.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=POLL_INTERVAL,
+            help="Seconds to wait before polling again when no job is due.",
+        )
+        parser.add_argument(
+            "--heartbeat-interval",
+            type=float,
+            default=HEARTBEAT_INTERVAL,
+            help="Seconds between two progress writes of a running job.",
+        )
+
+    def handle(self, *args, **options):
+        if options["processes"] < 1:
+            raise CommandError("--processes must be at least 1.")
+
+        if options["burst"]:
+            count = Worker(heartbeat_interval=options["heartbeat_interval"]).run(burst=True)
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs."))
+            return
+
+        self.check(tags=["jobs"], include_deployment_checks=True)
+
+        # Forked children inherit the configured Django instead of setting it up again.
+        context = multiprocessing.get_context("fork")
+        stop_event = context.Event()
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping the workers after their current jobs...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        # The children must open their own database connections.
+        connections.close_all()
+        processes = [
+            context.Process(
+                target=run_worker_process,
+                args=(stop_event, options["poll_interval"], options["heartbeat_interval"]),
+                name=f"job-worker-{number}",
+            )
+            for number in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {len(processes)} job workers."))
+
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS("Job workers stopped."))
@@ -0,0 +1,214 @@
+import os
+import socket
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from jobs.registry import get_job_type
+
+STALE_AFTER = timedelta(minutes=5)
+CLAIM_CANDIDATES = 5
+
+
+class JobStatus(models.TextChoices):
+    """
+    Enumeration of job states.
+    """
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    SUCCEEDED = "succeeded", "Succeeded"
+    FAILED = "failed", "Failed"
+
+
+def worker_name():
+    """
+    Return the name of the current worker process, unique across hosts.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobManager(models.Manager):
+    """
+    Manager of the job queue.
+
+    Jobs are claimed with a conditional UPDATE on their status, so any number of
+    worker processes can poll the same table without a broker and without ever
+    running a job twice at the same time.
+    """
+
+    def enqueue(self, name, payload=None, user=None, input_file=None, run_at=None):
+        """
+        Queue a job.
+
+        Args:
+            name (str): The name of a registered job type.
+            payload (dict): The JSON-serializable arguments of the job.
+            user (CustomUser): The user who requested the job.
+            input_file (File): The uploaded file the job reads, if its type needs one.
+            run_at (datetime): The earliest time to run the job, defaults to now.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            ValidationError: If the job type is unknown or its input file is missing.
+        """
+        try:
+            job_type = get_job_type(name)
+        except KeyError:
+            raise ValidationError(f"Unknown job type '{name}'.")
+        if job_type.needs_file and input_file is None:
+            raise ValidationError(f"Jobs of type '{name}' need an input file.")
+
+        job = self.model(
+            name=name,
+            payload=payload or {},
+            created_by=user,
+            max_attempts=job_type.max_attempts,
+            run_at=run_at or timezone.now(),
+        )
+        if input_file is not None:
+            job.input_file.save(os.path.basename(input_file.name) or "input", input_file, save=False)
+        job.save()
+        return job
+
+    def claim(self, worker=None):
+        """
+        Mark the next due job as running and return it.
+
+        Args:
+            worker (str): The name of the claiming worker, defaults to the current process.
+
+        Returns:
+            Job: The claimed job, or None if no job is due.
+        """
+        worker = worker or worker_name()
+        now = timezone.now()
+        candidates = (
+            self.filter(status=JobStatus.QUEUED, run_at__lte=now)
+            .order_by("run_at", "id")
+            .values_list("id", flat=True)[:CLAIM_CANDIDATES]
+        )
+        for job_id in candidates:
+            claimed = self.filter(pk=job_id, status=JobStatus.QUEUED).update(
+                status=JobStatus.RUNNING,
+                worker=worker,
+                attempts=F("attempts") + 1,
+                date_started=now,
+                heartbeat_at=now,
+            )
+            if claimed:
+                return self.get(pk=job_id)
+        return None
+
+    def recover_stale(self, stale_after=STALE_AFTER):
+        """
+        Requeue running jobs whose worker stopped sending heartbeats.
+
+        A job whose attempts are used up is failed instead.
+
+        Args:
+            stale_after (timedelta): How long a running job may go without a heartbeat.
+
+        Returns:
+            int: The number of requeued or failed jobs.
+        """
+        now = timezone.now()
+        stale = self.filter(status=JobStatus.RUNNING, heartbeat_at__lt=now - stale_after)
+        failed = stale.filter(attempts__gte=F("max_attempts")).update(
+            status=JobStatus.FAILED,
+            error="The worker running the job stopped responding.",
+            date_finished=now,
+        )
+        requeued = stale.filter(attempts__lt=F("max_attempts")).update(
+            status=JobStatus.QUEUED,
+            worker="",
+            run_at=now,
+        )
+        return failed + requeued
+
+
+class Job(models.Model):
+    """
+    Model representing a unit of background work run by `manage.py runworker`.
+
+    Attributes:
+        name (CharField): The name of the registered job type.
+        status (CharField): The state of the job.
+        payload (JSONField): The arguments of the job.
+        result (JSONField): What the job returned, or the report of a permanent failure.
+        error (TextField): The error of the last failed attempt.
+        attempts (PositiveIntegerField): How often the job was started.
+        max_attempts (PositiveIntegerField): How often the job may be started.
+        progress (PositiveIntegerField): The number of processed items.
+        progress_total (PositiveIntegerField): The number of items to process, if known.
+        run_at (DateTimeField): The earliest time to start the next attempt.
+        worker (CharField): The worker running or last running the job.
+        heartbeat_at (DateTimeField): When the running worker last reported the job alive.
+        input_file (FileField): The uploaded file the job reads.
+        result_file (FileField): The file the job produced.
+        created_by (ForeignKey): The user who requested the job.
+        date_created (DateTimeField): When the job was queued.
+        date_started (DateTimeField): When the last attempt started.
+        date_finished (DateTimeField): When the job succeeded or finally failed.
+    """
+
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    progress = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(null=True, blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=255, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    input_file = models.FileField(upload_to="jobs/input/", blank=True)
+    result_file = models.FileField(upload_to="jobs/results/", blank=True)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    objects = JobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at", "id"], name="job_status_run_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    @property
+    def percent(self):
+        """
+        The progress in percent, or None while the total is unknown.
+        """
+        if self.status == JobStatus.SUCCEEDED:
+            return 100
+        if not self.progress_total:
+            return None
+        return min(100, int(self.progress * 100 / self.progress_total))
+
+    def report_progress(self, progress, total=None):
+        """
+        Record the progress of the running job.
+
+        Only the instance is changed; the worker writes the progress to the
+        database with its periodic heartbeat, from a separate connection, so it
+        is visible even while the job holds a long transaction open.
+
+        Args:
+            progress (int): The number of processed items.
+            total (int): The number of items to process, if known.
+        """
+        self.progress = progress
+        if total is not None:
+            self.progress_total = total
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class PermanentJobError(Exception):
+    """
+    Raised by a job function to fail its job without retrying it.
+
+    Attributes:
+        result (dict): Data to store as the result of the failed job, such as a validation report.
+    """
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+@dataclass(frozen=True)
+class JobType:
+    """
+    A registered kind of job.
+
+    Attributes:
+        name (str): The name jobs are queued under.
+        func (callable): Called with the Job; returns a JSON-serializable result.
+        max_attempts (int): How often a failing job is tried before it is marked as failed.
+        needs_file (bool): Whether jobs of this type read an uploaded input file.
+    """
+
+    name: str
+    func: callable
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    needs_file: bool = False
+
+
+_job_types = {}
+
+
+def job(name, max_attempts=DEFAULT_MAX_ATTEMPTS, needs_file=False):
+    """
+    Register the decorated function as the job type with the given name.
+
+    The function is called in a worker process with the Job instance and should
+    report its progress with job.report_progress().
+
+    Args:
+        name (str): The name of the job type.
+        max_attempts (int): How often a failing job is tried.
+        needs_file (bool): Whether jobs of this type read an uploaded input file.
+
+    Returns:
+        callable: The decorator.
+    """
+    def register(func):
+        _job_types[name] = JobType(name, func, max_attempts, needs_file)
+        return func
+
+    return register
+
+
+def get_job_type(name):
+    """
+    Return the registered job type with the given name.
+
+    Raises:
+        KeyError: If no job type has that name.
+    """
+    return _job_types[name]
+
+
+def job_type_names():
+    """
+    Return the names of all registered job types, sorted.
+    """
+    return sorted(_job_types)
@@ -0,0 +1,71 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.urls import reverse
+from rest_framework import serializers
+
+from .models import Job
+from .registry import job_type_names
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the Job model.
+
+    Attributes:
+        percent (IntegerField): The progress in percent, null while the total is unknown.
+        result_url (SerializerMethodField): The download URL of the result file, if the job produced one.
+    """
+
+    percent = serializers.IntegerField(read_only=True)
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id", "name", "status", "payload", "result", "error", "attempts", "max_attempts",
+            "progress", "progress_total", "percent", "run_at", "created_by", "date_created",
+            "date_started", "date_finished", "result_url",
+        ]
+        read_only_fields = fields
+
+    def get_result_url(self, obj):
+        """
+        Get the download URL of the result file of the job.
+
+        Args:
+            obj (Job): The Job instance.
+
+        Returns:
+            str: The absolute URL, or None if the job has no result file.
+        """
+        if not obj.result_file:
+            return None
+        request = self.context.get("request")
+        url = reverse("job-result", args=[obj.pk])
+        return request.build_absolute_uri(url) if request else url
+
+
+class JobCreateSerializer(serializers.Serializer):
+    """
+    Serializer for queueing a job that does not need an input file.
+
+    Attributes:
+        name (ChoiceField): The name of a registered job type.
+        payload (JSONField): The arguments of the job.
+    """
+
+    name = serializers.ChoiceField(choices=[])
+    payload = serializers.DictField(required=False, default=dict)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["name"].choices = job_type_names()
+
+    def create(self, validated_data):
+        try:
+            return Job.objects.enqueue(
+                validated_data["name"],
+                payload=validated_data["payload"],
+                user=self.context["request"].user,
+            )
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({"name": e.messages})
@@ -0,0 +1,367 @@
+import gzip
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from api.product_catalog.models import Category, Product
+from authentication.models import CustomUser
+from jobs.checks import check_shared_cache
+from jobs.models import Job, JobStatus
+from jobs.registry import PermanentJobError, job
+from jobs.worker import Heartbeat, Worker, run_job
+
+calls = []
+
+
+@job("test_echo")
+def echo_job(job):
+    job.report_progress(1, 2)
+    calls.append(job.pk)
+    return {"echo": job.payload.get("value")}
+
+
+@job("test_flaky", max_attempts=2)
+def flaky_job(job):
+    raise RuntimeError("Temporary failure")
+
+
+@job("test_invalid")
+def invalid_job(job):
+    raise PermanentJobError("Invalid input", result={"errors": ["row 1"]})
+
+
+@job("test_slow")
+def slow_job(job):
+    job.report_progress(5, 10)
+    deadline = time.monotonic() + 5
+    while Job.objects.get(pk=job.pk).progress != 5 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return {"seen_progress": Job.objects.get(pk=job.pk).progress}
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_unknown_job_type(self):
+        with self.assertRaises(ValidationError):
+            Job.objects.enqueue("does_not_exist")
+
+    def test_enqueue_without_required_file(self):
+        with self.assertRaises(ValidationError):
+            Job.objects.enqueue("catalog_import")
+
+    def test_claim_runs_each_job_once(self):
+        queued = Job.objects.enqueue("test_echo")
+
+        claimed = Job.objects.claim("worker-1")
+
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertEqual(claimed.status, JobStatus.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertEqual(claimed.worker, "worker-1")
+        self.assertIsNone(Job.objects.claim("worker-2"))
+
+    def test_claim_skips_jobs_not_yet_due(self):
+        Job.objects.enqueue("test_echo", run_at=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(Job.objects.claim())
+
+    def test_claim_takes_oldest_due_job_first(self):
+        first = Job.objects.enqueue("test_echo")
+        Job.objects.enqueue("test_echo")
+        self.assertEqual(Job.objects.claim().pk, first.pk)
+
+    def test_successful_job(self):
+        queued = Job.objects.enqueue("test_echo", {"value": 42})
+
+        ran = Worker().run_once()
+
+        self.assertEqual(ran.pk, queued.pk)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.SUCCEEDED)
+        self.assertEqual(queued.result, {"echo": 42})
+        self.assertEqual(queued.progress, 2)
+        self.assertEqual(queued.percent, 100)
+        self.assertIsNotNone(queued.date_finished)
+        self.assertEqual(calls, [queued.pk])
+        self.assertIsNone(Worker().run_once())
+
+    def test_failing_job_is_retried_with_backoff_then_failed(self):
+        queued = Job.objects.enqueue("test_flaky")
+
+        with self.assertLogs("jobs.worker", "ERROR"):
+            Worker().run_once()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("Temporary failure", queued.error)
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIsNone(Worker().run_once())
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        with self.assertLogs("jobs.worker", "ERROR"):
+            Worker().run_once()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.FAILED)
+        self.assertEqual(queued.attempts, 2)
+        self.assertIsNotNone(queued.date_finished)
+
+    def test_permanent_error_is_not_retried(self):
+        queued = Job.objects.enqueue("test_invalid")
+
+        Worker().run_once()
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.FAILED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual(queued.error, "Invalid input")
+        self.assertEqual(queued.result, {"errors": ["row 1"]})
+
+    def test_unknown_job_type_fails(self):
+        queued = Job.objects.enqueue("test_echo")
+        Job.objects.filter(pk=queued.pk).update(name="removed")
+
+        run_job(Job.objects.claim())
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.FAILED)
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        retryable = Job.objects.enqueue("test_flaky")
+        exhausted = Job.objects.enqueue("test_echo")
+        Job.objects.claim()
+        Job.objects.claim()
+        Job.objects.filter(pk=exhausted.pk).update(max_attempts=1)
+        Job.objects.update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(Job.objects.recover_stale(), 2)
+
+        retryable.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retryable.status, JobStatus.QUEUED)
+        self.assertEqual(exhausted.status, JobStatus.FAILED)
+
+    def test_requeued_job_finishing_on_its_old_worker_keeps_its_new_state(self):
+        queued = Job.objects.enqueue("test_echo", {"value": 1})
+        claimed = Job.objects.claim("worker-1")
+        Job.objects.filter(pk=queued.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1), max_attempts=2)
+        Job.objects.recover_stale()
+        Job.objects.claim("worker-2")
+
+        with self.assertLogs("jobs.worker", "WARNING"):
+            finished = run_job(claimed)
+
+        self.assertEqual(finished.status, JobStatus.RUNNING)
+        self.assertEqual(finished.worker, "worker-2")
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.RUNNING)
+        self.assertEqual(queued.attempts, 2)
+        self.assertIsNone(queued.result)
+
+    def test_running_jobs_with_recent_heartbeat_are_kept(self):
+        Job.objects.enqueue("test_echo")
+        Job.objects.claim()
+        self.assertEqual(Job.objects.recover_stale(), 0)
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+FILE_CACHES = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp"}}
+
+
+class SharedCacheCheckTests(TestCase):
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_worker_pool_refuses_a_process_local_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ["jobs.E001"])
+        with self.assertRaises(SystemCheckError):
+            call_command("runworker", "--processes", "1", stdout=StringIO())
+
+    @override_settings(CACHES=FILE_CACHES)
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+
+class HeartbeatTests(TransactionTestCase):
+    def test_progress_is_written_while_the_job_runs(self):
+        queued = Job.objects.enqueue("test_slow")
+
+        Worker(heartbeat_interval=0.05).run_once()
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, JobStatus.SUCCEEDED)
+        self.assertEqual(queued.result, {"seen_progress": 5})
+        self.assertEqual(queued.progress, 10)
+
+    def test_heartbeat_stops(self):
+        queued = Job.objects.enqueue("test_echo")
+        heartbeat = Heartbeat(queued, interval=0.01)
+        heartbeat.start()
+        heartbeat.stop()
+        self.assertFalse(heartbeat.is_alive())
+
+
+class JobViewSetTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        )
+        self.cashier_user = CustomUser.objects.create_user(
+            username="cashier", password="cashierpassword", role="CA", email="cashier@example.com"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_create_job(self):
+        response = self.client.post(reverse("job-list"), {"name": "test_echo", "payload": {"value": 1}},
+                                    format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], JobStatus.QUEUED)
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(job.created_by, self.admin_user)
+        self.assertEqual(job.payload, {"value": 1})
+
+    def test_create_job_with_unknown_name(self):
+        response = self.client.post(reverse("job-list"), {"name": "does_not_exist"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_job_needing_a_file(self):
+        response = self.client.post(reverse("job-list"), {"name": "catalog_import"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cashier_cannot_use_jobs(self):
+        self.client.force_authenticate(user=self.cashier_user)
+        response = self.client.get(reverse("job-list"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_progress(self):
+        job = Job.objects.enqueue("test_echo")
+        Job.objects.filter(pk=job.pk).update(status=JobStatus.RUNNING, progress=25, progress_total=100)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("job-progress", args=[job.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            "id": job.pk, "status": JobStatus.RUNNING, "attempts": 0, "progress": 25, "progress_total": 100,
+            "percent": 25,
+        })
+
+    def test_progress_of_missing_job(self):
+        response = self.client.get(reverse("job-progress", args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_filtered_by_status(self):
+        Job.objects.enqueue("test_echo")
+        failed = Job.objects.enqueue("test_echo")
+        Job.objects.filter(pk=failed.pk).update(status=JobStatus.FAILED)
+
+        response = self.client.get(reverse("job-list"), {"status": "failed"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in response.data["results"]], [failed.pk])
+
+    def test_retry_failed_job(self):
+        job = Job.objects.enqueue("test_echo")
+        Job.objects.filter(pk=job.pk).update(status=JobStatus.FAILED, attempts=3, error="boom")
+
+        response = self.client.post(reverse("job-retry", args=[job.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(job.error, "")
+
+    def test_retry_queued_job(self):
+        job = Job.objects.enqueue("test_echo")
+        response = self.client.post(reverse("job-retry", args=[job.pk]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogJobTests(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.category = Category.objects.create(name="Drinks")
+        Product.objects.create(
+            name="Water", category=self.category, price_with_vat=11.2, price_without_vat=10,
+            tax_rate=0.12, measurement_of_quantity=1, ean_code="1111111111111",
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def run_worker(self):
+        output = StringIO()
+        call_command("runworker", "--burst", stdout=output)
+        return output.getvalue()
+
+    def test_async_export(self):
+        response = self.client.get(reverse("catalog-export_catalog"), {"async": "true", "compress": "gzip"})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(response.data["result_url"])
+
+        self.assertIn("Ran 1 jobs.", self.run_worker())
+
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, JobStatus.SUCCEEDED)
+        self.assertEqual(job.result, {"rows": 2})
+        response = self.client.get(reverse("job-result", args=[job.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = gzip.decompress(b"".join(response.streaming_content)).decode("utf-8")
+        self.assertIn("product,Water,Drinks", content)
+
+    def test_async_import(self):
+        content = "category,Snacks,\nproduct,Chips,Snacks,30.0,25.0,10,1,Pcs,2222222222222,BLUE,Salted,0.21\n"
+        file = SimpleUploadedFile("catalog.csv", content.encode("utf-8"), content_type="text/csv")
+
+        response = self.client.post(
+            reverse("catalog-import_catalog") + "?async=true",
+            {"file": file},
+            format="multipart",
+            HTTP_CONTENT_DISPOSITION="attachment; filename=catalog.csv",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Product.objects.filter(name="Chips").exists())
+
+        self.run_worker()
+
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, JobStatus.SUCCEEDED)
+        self.assertEqual(job.result["created"]["product"], 1)
+        self.assertTrue(Product.objects.filter(name="Chips", category__name="Snacks").exists())
+
+    def test_async_import_with_invalid_rows_fails_without_retry(self):
+        file = SimpleUploadedFile("catalog.csv", b"product,Chips\n", content_type="text/csv")
+
+        response = self.client.post(
+            reverse("catalog-import_catalog") + "?async=true",
+            {"file": file},
+            format="multipart",
+            HTTP_CONTENT_DISPOSITION="attachment; filename=catalog.csv",
+        )
+        self.run_worker()
+
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.result["error_count"], 1)
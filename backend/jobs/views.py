@@ -0,0 +1,124 @@
+from django.http import FileResponse
+from django.utils import timezone
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from api.common.pagination import CustomPageNumberPagination
+from authentication.permissions import IsAdminOrManager
+from .models import Job, JobStatus
+from .serializers import JobCreateSerializer, JobSerializer
+
+PROGRESS_FIELDS = ("id", "status", "attempts", "progress", "progress_total")
+
+
+def is_async(request):
+    """
+    Return True if the request asks for its work to be queued as a job with ?async=true.
+    """
+    return request.query_params.get("async", "").lower() in ("1", "true")
+
+
+class JobViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin,
+                 viewsets.GenericViewSet):
+    """
+    ViewSet for queueing background jobs and following their status.
+
+    Jobs are run by `manage.py runworker`, so creating one returns 202 Accepted
+    at once; clients then poll the progress endpoint, which reads a single row.
+
+    Attributes:
+        queryset (QuerySet): The queryset of Job instances, newest first.
+        serializer_class (Serializer): The serializer class for the viewset.
+        permission_classes (list): The list of permission classes for the viewset.
+        pagination_class (Pagination): Custom pagination class.
+        keyset_ordering (tuple): Fields used by the keyset pagination mode.
+        lookup_value_regex (str): Job ids are numeric, which leaves jobs/docs/ to the API docs.
+    """
+
+    queryset = Job.objects.order_by("-date_created", "-id")
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrManager]
+    pagination_class = CustomPageNumberPagination
+    keyset_ordering = ("date_created", "id")
+    lookup_value_regex = r"\d+"
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for field in ("status", "name"):
+            if self.request.query_params.get(field):
+                queryset = queryset.filter(**{field: self.request.query_params[field]})
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        """
+        Queue a job that does not need an input file.
+
+        Args:
+            request (Request): The request with the job "name" and its "payload".
+
+        Returns:
+            Response: The queued job with status 202.
+        """
+        serializer = JobCreateSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save()
+        return Response(JobSerializer(job, context={"request": request}).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=["get"])
+    def progress(self, request, pk=None):
+        """
+        Return the status and progress of a job.
+
+        Args:
+            request (Request): The request instance.
+            pk (int): The job id.
+
+        Returns:
+            Response: The status, attempts, progress, total and percent of the job.
+        """
+        job = get_object_or_404(Job.objects.only(*PROGRESS_FIELDS), pk=pk)
+        return Response({**{field: getattr(job, field) for field in PROGRESS_FIELDS}, "percent": job.percent})
+
+    @action(detail=True, methods=["get"])
+    def result(self, request, pk=None):
+        """
+        Download the file a job produced.
+
+        Args:
+            request (Request): The request instance.
+            pk (int): The job id.
+
+        Returns:
+            FileResponse: The result file as an attachment.
+        """
+        job = self.get_object()
+        if job.status != JobStatus.SUCCEEDED or not job.result_file:
+            raise NotFound("The job has no result file.")
+        return FileResponse(job.result_file.open("rb"), as_attachment=True,
+                            filename=job.result_file.name.rsplit("/", 1)[-1])
+
+    @action(detail=True, methods=["post"])
+    def retry(self, request, pk=None):
+        """
+        Queue a failed job again with a fresh set of attempts.
+
+        Args:
+            request (Request): The request instance.
+            pk (int): The job id.
+
+        Returns:
+            Response: The queued job, or an error if the job did not fail.
+        """
+        job = self.get_object()
+        requeued = Job.objects.filter(pk=job.pk, status=JobStatus.FAILED).update(
+            status=JobStatus.QUEUED, attempts=0, error="", result=None, progress=0, run_at=timezone.now(),
+            date_finished=None,
+        )
+        if not requeued:
+            return Response({"error": "Only failed jobs can be retried."}, status=status.HTTP_400_BAD_REQUEST)
+        job.refresh_from_db()
+        return Response(JobSerializer(job, context={"request": request}).data, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,185 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.db import DatabaseError, close_old_connections, connection
+from django.utils import timezone
+
+from jobs.models import Job, JobStatus, worker_name
+from jobs.registry import PermanentJobError, get_job_type
+
+HEARTBEAT_INTERVAL = 10
+POLL_INTERVAL = 2
+RETRY_DELAY = timedelta(seconds=30)
+OUTCOME_FIELDS = [
+    "status", "result", "error", "run_at", "progress", "progress_total",
+    "heartbeat_at", "date_finished", "result_file",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Heartbeat(threading.Thread):
+    """
+    Thread writing the heartbeat and progress of a running job every few seconds.
+
+    Django connections are per thread, so the writes use their own connection and
+    are committed even while the job function holds a transaction open.
+
+    Attributes:
+        job (Job): The running job, whose progress fields are written.
+        interval (float): The number of seconds between two writes.
+    """
+
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(pk=self.job.pk, status=JobStatus.RUNNING).update(
+                        heartbeat_at=timezone.now(),
+                        progress=self.job.progress,
+                        progress_total=self.job.progress_total,
+                    )
+                except DatabaseError:
+                    # SQLite cannot write while the job holds its write lock; the
+                    # next heartbeat or the end of the job catches up.
+                    logger.warning("Could not write the heartbeat of job %s", self.job.pk, exc_info=True)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def retry_delay(attempts):
+    """
+    Return how long to wait before the next attempt, doubling with every failed one.
+    """
+    return RETRY_DELAY * 2 ** max(attempts - 1, 0)
+
+
+def run_job(job, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """
+    Run a claimed job and record its outcome.
+
+    A job that raises is queued again after a growing delay until its attempts
+    are used up, then it is failed. A job that raises PermanentJobError, or whose
+    type is no longer registered, is failed at once.
+
+    The outcome is only written while the job is still running under this claim;
+    a job requeued by recover_stale() in the meantime belongs to its next attempt.
+
+    Args:
+        job (Job): A job claimed with Job.objects.claim().
+        heartbeat_interval (float): The number of seconds between two heartbeats.
+
+    Returns:
+        Job: The job with its new status, reloaded if the claim was lost.
+    """
+    try:
+        func = get_job_type(job.name).func
+    except KeyError:
+        func = None
+
+    heartbeat = Heartbeat(job, heartbeat_interval)
+    heartbeat.start()
+    try:
+        if func is None:
+            raise PermanentJobError(f"Unknown job type '{job.name}'.")
+        result = func(job)
+    except PermanentJobError as e:
+        job.status = JobStatus.FAILED
+        job.error = str(e)
+        job.result = e.result
+    except Exception:
+        logger.exception("Job %s failed", job.pk)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = JobStatus.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = JobStatus.FAILED
+    else:
+        job.status = JobStatus.SUCCEEDED
+        job.result = result
+        job.error = ""
+        if job.progress_total is not None:
+            job.progress = job.progress_total
+    finally:
+        heartbeat.stop()
+
+    now = timezone.now()
+    job.heartbeat_at = now
+    if job.status != JobStatus.QUEUED:
+        job.date_finished = now
+    updated = Job.objects.filter(
+        pk=job.pk, status=JobStatus.RUNNING, worker=job.worker, attempts=job.attempts
+    ).update(**{field: getattr(job, field) for field in OUTCOME_FIELDS})
+    if not updated:
+        logger.warning("Job %s was taken over while it ran, its outcome is discarded", job.pk)
+        job.refresh_from_db()
+    return job
+
+
+class Worker:
+    """
+    Loop claiming and running due jobs, one at a time.
+
+    Attributes:
+        name (str): The name recorded on the claimed jobs.
+        poll_interval (float): The number of seconds to wait when no job is due.
+        heartbeat_interval (float): The number of seconds between two heartbeats of a running job.
+        stop_event (Event): Set to stop the loop after the current job.
+    """
+
+    def __init__(self, name=None, poll_interval=POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 stop_event=None):
+        self.name = name or worker_name()
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stop_event = stop_event or threading.Event()
+
+    def run_once(self):
+        """
+        Run the next due job, if any.
+
+        Returns:
+            Job: The job that was run, or None if no job was due.
+        """
+        job = Job.objects.claim(self.name)
+        if job is None:
+            return None
+        logger.info("Running job %s", job)
+        return run_job(job, self.heartbeat_interval)
+
+    def run(self, burst=False):
+        """
+        Run jobs until stopped.
+
+        Args:
+            burst (bool): Return as soon as no job is due instead of waiting for more.
+
+        Returns:
+            int: The number of jobs run.
+        """
+        count = 0
+        while not self.stop_event.is_set():
+            close_old_connections()
+            Job.objects.recover_stale()
+            job = self.run_once()
+            close_old_connections()
+            if job is not None:
+                count += 1
+            elif burst:
+                break
+            else:
+                self.stop_event.wait(self.poll_interval)
+        return count
@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.core.exceptions import ValidationError
 
+from api.common.cache import acached_value, cached_value, invalidate_model_cache
+
 from api.product_catalog.choices import ColorChoices, TaxRateChoices
 
 
@@ -24,6 +27,8 @@ class BusinessSettings(models.Model):
             Validates the instance before saving.
         get_settings():
             Retrieves the first (and only) instance of `BusinessSettings`.
+        aget_settings():
+            Async version of `get_settings`, for async views.
     """
 
     business_name = models.CharField(max_length=200)
@@ -64,7 +69,23 @@ class BusinessSettings(models.Model):
         """
         Retrieve the first instance of `BusinessSettings`.
 
+        The instance is cached until the settings are saved or deleted.
+
         Returns:
             BusinessSettings: The first (and only) instance of `BusinessSettings`.
         """
-        return cls.objects.first()
+        return cached_value("business-settings", cls.objects.first, models=[cls])
+
+    @classmethod
+    async def aget_settings(cls):
+        """
+        Async version of `get_settings`, sharing its cache entry.
+
+        Returns:
+            BusinessSettings: The first (and only) instance of `BusinessSettings`.
+        """
+        return await acached_value("business-settings", cls.objects.afirst, models=[cls])
+
+
+post_save.connect(invalidate_model_cache, sender=BusinessSettings)
+post_delete.connect(invalidate_model_cache, sender=BusinessSettings)
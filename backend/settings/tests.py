@@ -1,7 +1,13 @@
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 from authentication.models import CustomUser
+from api.common.cache import acached_value, cached_value, get_cache_stats, reset_cache_stats
 from settings.models import BusinessSettings
 from api.product_catalog.choices import ColorChoices, TaxRateChoices
 
@@ -100,6 +106,15 @@ class BusinessSettingsViewSetTests(APITestCase):
         response = self.client.get(reverse('business-settings-list'), format="json")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    async def test_list_business_settings_through_asgi_with_a_jwt(self):
+        await BusinessSettings.objects.acreate(**self.settings_data)
+        token = RefreshToken.for_user(self.admin_user).access_token
+        response = await self.async_client.get(
+            reverse('business-settings-list'), headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['business_name'], self.settings_data['business_name'])
+
     def test_create_business_settings_with_invalid_data(self):
         invalid_data = self.settings_data.copy()
         invalid_data['euro_rate'] = 'invalid'
@@ -111,3 +126,79 @@ class BusinessSettingsViewSetTests(APITestCase):
         invalid_data = {"euro_rate": 'invalid'}
         response = self.update_settings(self.admin_user, settings.id, invalid_data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CachedValueTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.settings_data = {
+            "business_name": "Test Business",
+            "ico": "12345678",
+            "dic": "CZ12345678",
+            "contact_email": "test@business.com",
+            "contact_phone": "+420123456789",
+            "address": "Test Street 123, Test City",
+            "euro_rate": 25.5,
+        }
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_settings_are_cached_until_saved(self):
+        settings = BusinessSettings.objects.create(**self.settings_data)
+        self.assertEqual(BusinessSettings.get_settings().business_name, "Test Business")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(BusinessSettings.get_settings().pk, settings.pk)
+
+        settings.business_name = "Renamed Business"
+        settings.save()
+        self.assertEqual(BusinessSettings.get_settings().business_name, "Renamed Business")
+
+        settings.delete()
+        self.assertIsNone(BusinessSettings.get_settings())
+
+    def test_values_are_not_cached_inside_a_transaction(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return "value"
+
+        with transaction.atomic():
+            cached_value("test-value", compute)
+        cached_value("test-value", compute)
+        cached_value("test-value", compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_async_and_sync_reads_share_the_cache_entry(self):
+        settings = BusinessSettings.objects.create(**self.settings_data)
+        self.assertEqual(async_to_sync(BusinessSettings.aget_settings)().pk, settings.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(BusinessSettings.get_settings().pk, settings.pk)
+        self.assertEqual(get_cache_stats()["values"]["business-settings"], {"hits": 1, "misses": 1})
+
+    def test_async_values_are_not_cached_inside_a_transaction(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return "value"
+
+        with transaction.atomic():
+            async_to_sync(acached_value)("test-value", compute)
+        async_to_sync(acached_value)("test-value", compute)
+        async_to_sync(acached_value)("test-value", compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_hits_and_misses_are_counted_per_name(self):
+        cached_value("test-value", lambda: None)
+        cached_value("test-value", lambda: None)
+        cached_value("other-value", lambda: 1, key_parts=["x" * 300])
+
+        stats = get_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(stats["values"]["test-value"], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["values"]["other-value"], {"hits": 0, "misses": 1})
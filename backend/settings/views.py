@@ -2,18 +2,19 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from api.common.async_views import AsyncAPIViewMixin
 from authentication.permissions import IsAdminOrManager
 from .models import BusinessSettings
 from .serializers import BusinessSettingsSerializer
 
 
-class BusinessSettingsViewSet(viewsets.ModelViewSet):
+class BusinessSettingsViewSet(AsyncAPIViewMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing business settings.
 
     This viewset provides the standard actions for creating, retrieving, updating, and listing
     `BusinessSettings` instances. It also includes custom actions to retrieve the Euro rate and
-    check if settings exist.
+    check if settings exist. Listing is async, as every page of the frontend reads the settings.
 
     Attributes:
         queryset (QuerySet): The queryset of `BusinessSettings` instances.
@@ -22,7 +23,7 @@ class BusinessSettingsViewSet(viewsets.ModelViewSet):
 
     Methods:
         list(request, **kwargs):
-            Retrieve the business settings.
+            Retrieve the business settings asynchronously.
         create(request, **kwargs):
             Create a new set of business settings if none exist.
         update(request, *args, **kwargs):
@@ -39,7 +40,7 @@ class BusinessSettingsViewSet(viewsets.ModelViewSet):
     serializer_class = BusinessSettingsSerializer
     permission_classes = [IsAuthenticated, IsAdminOrManager]
 
-    def list(self, request, **kwargs):
+    async def list(self, request, **kwargs):
         """
         Retrieve the business settings.
 
@@ -50,7 +51,7 @@ class BusinessSettingsViewSet(viewsets.ModelViewSet):
         Returns:
             Response: The response containing the business settings data or an empty dictionary if no settings exist.
         """
-        settings = BusinessSettings.get_settings()
+        settings = await BusinessSettings.aget_settings()
         if settings:
             serializer = self.get_serializer(settings)
             return Response(serializer.data)
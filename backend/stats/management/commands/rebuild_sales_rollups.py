@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from api.common.cache import bump_model_versions
+from api.sales.models import Sale
+from helpers.dates import day_start
+from stats.models import DirtySalesBucket, ProductSalesRollup, SalesRollup, TaxRateSalesRollup
+from stats.rollups import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    """
+    Management command to rebuild the hourly and daily sales rollups from the sales.
+
+    The rollups are normally kept up to date by marking the hours of changed sales as
+    dirty and refreshing them before the statistics are read. This command recomputes
+    them from scratch, one day per transaction. It is needed once after the rollups are
+    introduced and whenever sales were changed outside of the ORM.
+    """
+
+    help = "Rebuild the sales rollups used by the statistics endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only rebuild the days starting at this date (YYYY-MM-DD). Defaults to the first sale.",
+        )
+
+    def handle(self, *args, **options):
+        bounds = Sale.objects.aggregate(first=Min("date_created"), last=Max("date_created"))
+        if options["since"]:
+            try:
+                start = day_start(datetime.strptime(options["since"], "%Y-%m-%d").date())
+            except ValueError:
+                raise CommandError("Invalid --since format. Use YYYY-MM-DD.")
+        else:
+            start = day_start(bounds["first"] or timezone.now())
+            for model in (SalesRollup, ProductSalesRollup, TaxRateSalesRollup):
+                model.objects.all().delete()
+        end = day_start(max(bounds["last"] or start, start)) + timedelta(days=1)
+
+        DirtySalesBucket.objects.filter(bucket_start__gte=start).delete()
+        days = 0
+        day = start
+        while day < end:
+            next_day = day_start(day.date() + timedelta(days=1))
+            rebuild_sales_rollups(day, next_day)
+            day = next_day
+            days += 1
+        bump_model_versions(Sale)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups of {days} days."))
@@ -1,3 +1,157 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 
-# Create your models here.
+from api.sales.models import Sale, SaleItem
+
+
+class RollupGranularity(models.TextChoices):
+    """
+    Enumeration of the time bucket sizes of the sales rollups.
+    """
+    HOUR = "hour", "Hour"
+    DAY = "day", "Day"
+
+
+class SalesRollup(models.Model):
+    """
+    Model representing the sale-level totals of one time bucket.
+
+    Attributes:
+        granularity (CharField): The size of the bucket (hour or day).
+        bucket_start (DateTimeField): The start of the bucket in the local time zone.
+        transaction_count (IntegerField): The number of sales in the bucket.
+        total_amount (DecimalField): The sum of the total amounts of the sales in the bucket.
+    """
+    granularity = models.CharField(max_length=10, choices=RollupGranularity.choices)
+    bucket_start = models.DateTimeField()
+    transaction_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("granularity", "bucket_start")
+        verbose_name = "Sales Rollup"
+        verbose_name_plural = "Sales Rollups"
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start}"
+
+
+class ProductSalesRollup(models.Model):
+    """
+    Model representing the sales of one product in one time bucket.
+
+    Attributes:
+        granularity (CharField): The size of the bucket (hour or day).
+        bucket_start (DateTimeField): The start of the bucket in the local time zone.
+        product (ForeignKey): The product that was sold.
+        category (ForeignKey): The category of the product when the bucket was built.
+        tax_rate (DecimalField): The tax rate of the product when the bucket was built.
+        total_sales (DecimalField): The sum of the sale item prices.
+        total_quantity (IntegerField): The sold quantity.
+        vat_amount (DecimalField): The VAT contained in the sold items.
+        item_count (IntegerField): The number of sale items.
+    """
+    granularity = models.CharField(max_length=10, choices=RollupGranularity.choices)
+    bucket_start = models.DateTimeField()
+    product = models.ForeignKey("product_catalog.Product", on_delete=models.CASCADE)
+    category = models.ForeignKey("product_catalog.Category", on_delete=models.SET_NULL, null=True, blank=True)
+    tax_rate = models.DecimalField(max_digits=6, decimal_places=2)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_quantity = models.IntegerField(default=0)
+    vat_amount = models.DecimalField(max_digits=18, decimal_places=6, default=0)
+    item_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("granularity", "bucket_start", "product")
+        verbose_name = "Product Sales Rollup"
+        verbose_name_plural = "Product Sales Rollups"
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start} - {self.product_id}"
+
+
+class TaxRateSalesRollup(models.Model):
+    """
+    Model representing the sales of one tax rate in one time bucket.
+
+    Attributes:
+        granularity (CharField): The size of the bucket (hour or day).
+        bucket_start (DateTimeField): The start of the bucket in the local time zone.
+        tax_rate (DecimalField): The tax rate of the sold products.
+        total_sales (DecimalField): The sum of the sale item prices.
+        total_quantity (IntegerField): The sold quantity.
+        vat_amount (DecimalField): The VAT contained in the sold items.
+        item_count (IntegerField): The number of sale items.
+        transaction_count (IntegerField): The number of distinct sales containing the tax rate.
+    """
+    granularity = models.CharField(max_length=10, choices=RollupGranularity.choices)
+    bucket_start = models.DateTimeField()
+    tax_rate = models.DecimalField(max_digits=6, decimal_places=2)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_quantity = models.IntegerField(default=0)
+    vat_amount = models.DecimalField(max_digits=18, decimal_places=6, default=0)
+    item_count = models.IntegerField(default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("granularity", "bucket_start", "tax_rate")
+        verbose_name = "Tax Rate Sales Rollup"
+        verbose_name_plural = "Tax Rate Sales Rollups"
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start} - {self.tax_rate}"
+
+
+class DirtySalesBucket(models.Model):
+    """
+    Model representing an hour whose sales changed since its rollups were built.
+
+    The marks are only ever inserted, one per change, so concurrent sales of the
+    same hour never wait on each other's mark. A refresh deduplicates them and
+    removes the marks it has read.
+
+    Attributes:
+        bucket_start (DateTimeField): The start of the hour in the local time zone.
+    """
+    bucket_start = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return str(self.bucket_start)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(pre_delete, sender=Sale)
+def mark_sale_bucket_dirty(sender, instance, **kwargs):
+    """
+    Signal receiver to mark the hour of a created, updated or deleted Sale as dirty.
+
+    Args:
+        sender: The model class.
+        instance: The actual instance being saved or deleted.
+        **kwargs: Additional keyword arguments.
+    """
+    from stats.rollups import mark_dirty  # Lazy import
+
+    mark_dirty(instance.date_created)
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def mark_sale_item_bucket_dirty(sender, instance, **kwargs):
+    """
+    Signal receiver to mark the hour of the sale of a saved or deleted SaleItem as dirty.
+
+    Args:
+        sender: The model class.
+        instance: The actual instance being saved or deleted.
+        **kwargs: Additional keyword arguments.
+    """
+    from stats.rollups import mark_dirty  # Lazy import
+
+    if SaleItem.sale.is_cached(instance):
+        date_created = instance.sale.date_created
+    else:
+        date_created = Sale.objects.filter(pk=instance.sale_id).values_list("date_created", flat=True).first()
+    if date_created is not None:
+        mark_dirty(date_created)
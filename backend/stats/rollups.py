@@ -0,0 +1,224 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+from api.common.cache import bump_model_versions_on_commit
+from api.sales.models import Sale, SaleItem
+from helpers.dates import day_start, localize
+from stats.models import (
+    DirtySalesBucket,
+    ProductSalesRollup,
+    RollupGranularity,
+    SalesRollup,
+    TaxRateSalesRollup,
+)
+
+VAT_EXPRESSION = ExpressionWrapper(
+    F('price') * F('quantity') * F('product__tax_rate') / (1 + F('product__tax_rate')),
+    output_field=DecimalField()
+)
+
+
+def hour_start(value):
+    """
+    Return the start of the local hour containing the given datetime.
+    """
+    return localize(value).replace(minute=0, second=0, microsecond=0)
+
+
+def is_day_aligned(value):
+    """
+    Return True if the datetime is a local midnight.
+    """
+    value = localize(value)
+    return value == day_start(value)
+
+
+def mark_dirty(value):
+    """
+    Mark the hour containing the given datetime as needing its rollups rebuilt.
+
+    The mark is a new row rather than an update of the hour's existing mark, so
+    checkouts running in the same hour do not serialize on one row lock, and a
+    refresh that ran before this sale committed leaves the mark for the next one.
+    The cached sales statistics are invalidated as well.
+
+    Args:
+        value (datetime): A moment whose sales changed.
+    """
+    DirtySalesBucket.objects.create(bucket_start=hour_start(value))
+    bump_model_versions_on_commit(Sale)
+
+
+def refresh_sales_rollups():
+    """
+    Rebuild the rollups of all hours marked as dirty.
+
+    Consecutive dirty hours are rebuilt as one range. Marks claimed by a
+    concurrent refresh are skipped, and only the marks read are deleted, so an
+    hour marked again meanwhile stays dirty.
+
+    Returns:
+        int: The number of refreshed hours.
+    """
+    with transaction.atomic():
+        marks = list(
+            DirtySalesBucket.objects.select_for_update(skip_locked=True).values_list("pk", "bucket_start")
+        )
+        if not marks:
+            return 0
+        DirtySalesBucket.objects.filter(pk__in=[pk for pk, _ in marks]).delete()
+
+        ranges = []
+        hours = sorted({localize(bucket_start) for _, bucket_start in marks})
+        for bucket_start in hours:
+            if ranges and ranges[-1][1] == bucket_start:
+                ranges[-1][1] = bucket_start + timedelta(hours=1)
+            else:
+                ranges.append([bucket_start, bucket_start + timedelta(hours=1)])
+        for start, end in ranges:
+            rebuild_sales_rollups(start, end)
+    return len(hours)
+
+
+ROLLUP_DIMENSIONS = {
+    SalesRollup: ((), ('transaction_count', 'total_amount')),
+    ProductSalesRollup: (
+        ('product_id', 'category_id', 'tax_rate'),
+        ('total_sales', 'total_quantity', 'vat_amount', 'item_count'),
+    ),
+    TaxRateSalesRollup: (
+        ('tax_rate',),
+        ('total_sales', 'total_quantity', 'vat_amount', 'item_count', 'transaction_count'),
+    ),
+}
+
+ROLLUP_UNIQUE_FIELDS = {
+    SalesRollup: ('granularity', 'bucket_start'),
+    ProductSalesRollup: ('granularity', 'bucket_start', 'product'),
+    TaxRateSalesRollup: ('granularity', 'bucket_start', 'tax_rate'),
+}
+
+
+def _replace_rollups(model, granularity, start, end, rows):
+    """
+    Replace the rollup rows of a model in [start, end) with freshly computed ones.
+
+    The rows are upserted, so a concurrent rebuild of an overlapping range cannot
+    fail on the unique constraints.
+
+    Args:
+        model (Model): One of the rollup models.
+        granularity (str): The granularity of the replaced rows.
+        start (datetime): The start of the range.
+        end (datetime): The end of the range (exclusive).
+        rows (iterable): Dictionaries with the bucket start, dimensions and measures.
+    """
+    model.objects.filter(granularity=granularity, bucket_start__gte=start, bucket_start__lt=end).delete()
+    dimensions, fields = ROLLUP_DIMENSIONS[model]
+    model.objects.bulk_create(
+        [model(granularity=granularity, **row) for row in rows],
+        update_conflicts=True,
+        unique_fields=ROLLUP_UNIQUE_FIELDS[model],
+        update_fields=[dimension.removesuffix('_id') for dimension in dimensions
+                       if dimension.removesuffix('_id') not in ROLLUP_UNIQUE_FIELDS[model]] + list(fields),
+    )
+
+
+def rebuild_sales_rollups(start, end):
+    """
+    Rebuild the hourly rollups of [start, end) from the sales, then the daily rollups of the touched days.
+
+    Args:
+        start (datetime): The start of the range, rounded down to the hour.
+        end (datetime): The end of the range (exclusive), rounded down to the hour.
+    """
+    start, end = hour_start(start), hour_start(end)
+    if end <= start:
+        return
+
+    sales = Sale.objects.filter(date_created__gte=start, date_created__lt=end)
+    items = SaleItem.objects.filter(sale__date_created__gte=start, sale__date_created__lt=end) \
+        .annotate(bucket_start=TruncHour('sale__date_created'))
+    item_measures = {
+        'total_sales': Sum('price'),
+        'total_quantity': Sum('quantity'),
+        'vat_amount': Sum(VAT_EXPRESSION),
+        'item_count': Count('id'),
+    }
+
+    with transaction.atomic():
+        _replace_rollups(
+            SalesRollup, RollupGranularity.HOUR, start, end,
+            sales.annotate(bucket_start=TruncHour('date_created'))
+            .values('bucket_start')
+            .annotate(transaction_count=Count('id'), total_amount=Sum('total_amount'))
+            .order_by()
+        )
+        _replace_rollups(
+            ProductSalesRollup, RollupGranularity.HOUR, start, end,
+            items.values('bucket_start', 'product_id',
+                         category_id=F('product__category_id'), tax_rate=F('product__tax_rate'))
+            .annotate(**item_measures)
+            .order_by()
+        )
+        _replace_rollups(
+            TaxRateSalesRollup, RollupGranularity.HOUR, start, end,
+            items.values('bucket_start', tax_rate=F('product__tax_rate'))
+            .annotate(**item_measures, transaction_count=Count('sale', distinct=True))
+            .order_by()
+        )
+
+        day_range = (day_start(start), day_start(end - timedelta(microseconds=1)) + timedelta(days=1))
+        for model, (dimensions, fields) in ROLLUP_DIMENSIONS.items():
+            hourly = model.objects.filter(
+                granularity=RollupGranularity.HOUR, bucket_start__gte=day_range[0], bucket_start__lt=day_range[1]
+            ).annotate(day=TruncDay('bucket_start')) \
+                .values('day', *dimensions) \
+                .annotate(**{f'{field}_sum': Sum(field) for field in fields}) \
+                .order_by()
+            _replace_rollups(model, RollupGranularity.DAY, *day_range, (
+                {
+                    'bucket_start': row['day'],
+                    **{dimension: row[dimension] for dimension in dimensions},
+                    **{field: row[f'{field}_sum'] for field in fields},
+                }
+                for row in hourly
+            ))
+
+
+def rollups_between(model, start, end, granularity=None):
+    """
+    Return the rollup rows of a model covering the sales between start and end.
+
+    Unless a granularity is given, day buckets are used when the range starts at a
+    local midnight and ends at or just before one, hour buckets otherwise. An end
+    on a bucket boundary is treated as exclusive.
+
+    Args:
+        model (Model): One of the rollup models.
+        start (datetime): The start of the range.
+        end (datetime): The end of the range.
+        granularity (str): The bucket size to read, or None to pick the coarsest one that fits.
+
+    Returns:
+        QuerySet: The matching rollup rows.
+    """
+    start, end = localize(start), localize(end)
+    if granularity is None:
+        day_aligned = is_day_aligned(start) and (
+            is_day_aligned(end) or is_day_aligned(end + timedelta(microseconds=1))
+        )
+        granularity = RollupGranularity.DAY if day_aligned else RollupGranularity.HOUR
+
+    if granularity == RollupGranularity.DAY:
+        aligned = is_day_aligned(end)
+    else:
+        aligned = end == hour_start(end)
+
+    queryset = model.objects.filter(granularity=granularity, bucket_start__gte=start)
+    if aligned:
+        return queryset.filter(bucket_start__lt=end)
+    return queryset.filter(bucket_start__lte=end)
@@ -0,0 +1,33 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from jobs.registry import job
+from stats.rollups import refresh_sales_rollups
+
+
+@job("refresh_sales_rollups")
+def refresh_rollups(job):
+    """
+    Rebuild the rollups of the hours whose sales changed, ahead of the next statistics request.
+
+    Returns:
+        dict: The number of refreshed hours.
+    """
+    return {"hours": refresh_sales_rollups()}
+
+
+@job("rebuild_sales_rollups", max_attempts=1)
+def rebuild_rollups(job):
+    """
+    Rebuild the sales rollups with the rebuild_sales_rollups command.
+
+    Payload:
+        since (str): Only rebuild the days starting at this date (YYYY-MM-DD).
+
+    Returns:
+        dict: The output of the command.
+    """
+    output = StringIO()
+    call_command("rebuild_sales_rollups", since=job.payload.get("since"), stdout=output)
+    return {"output": output.getvalue().strip()}
@@ -1,13 +1,31 @@
 from decimal import Decimal
+from io import StringIO
 
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from unittest import skipUnless
 from api.sales.models import Sale, SaleItem
 from authentication.models import CustomUser
 from api.product_catalog.models import Product, Category
+from stats.models import (
+    DirtySalesBucket,
+    ProductSalesRollup,
+    RollupGranularity,
+    SalesRollup,
+    TaxRateSalesRollup,
+)
+from api.common.cache import reset_cache_stats
+from api.common.query_plans import SUPPORTED_VENDORS, captured_sequential_scans
+from stats.rollups import mark_dirty, refresh_sales_rollups
 
 
 class SaleStatisticsViewTests(APITestCase):
@@ -30,6 +48,8 @@ class SaleStatisticsViewTests(APITestCase):
             category=self.category,
         )
         self.create_sales()
+        self.admin_headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.admin_user).access_token}"}
+        self.ca_headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.ca_user).access_token}"}
 
     def create_sales(self):
         now = timezone.now()
@@ -112,6 +132,20 @@ class SaleStatisticsViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('error', response.data)
 
+    async def test_get_statistics_through_asgi_with_a_jwt(self):
+        now = timezone.now()
+        params = {
+            'start_date': (now - timedelta(days=3)).strftime('%Y-%m-%d'),
+            'end_date': (now + timedelta(days=2)).strftime('%Y-%m-%d'),
+        }
+        response = await self.async_client.get(reverse('custom_sale_statistics'), params, headers=self.admin_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(str(response.json()['total_sales'])), Decimal('67.2'))
+        self.assertEqual(response.json()['transaction_count'], 2)
+
+        response = await self.async_client.get(reverse('custom_sale_statistics'), params, headers=self.ca_headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_get_statistics_with_unauthenticated_user(self):
         response = self.client.get(reverse('sale_statistics', args=['daily']), format="json")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -375,3 +409,188 @@ class SaleStatisticsViewTests(APITestCase):
                 # Check that there are no more than 2 decimal places
                 self.assertEqual(tax_rate_data['total_sales'], round(tax_rate_data['total_sales'], 2))
                 self.assertEqual(tax_rate_data['vat_amount'], round(tax_rate_data['vat_amount'], 2))
+
+
+class SalesRollupTests(APITestCase):
+    def setUp(self):
+        self.ca_user = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        self.category = Category.objects.create(name="Test Category")
+        self.product = Product.objects.create(
+            name="Test Product",
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=10,
+            measurement_of_quantity=2,
+            category=self.category,
+        )
+        self.other_product = Product.objects.create(
+            name="Other Product",
+            price_with_vat=110.0,
+            price_without_vat=100.0,
+            tax_rate=0.10,
+            inventory_count=10,
+            measurement_of_quantity=2,
+            category=None,
+        )
+
+    def create_sale(self, items):
+        sale = Sale.objects.create(cashier=self.ca_user, total_amount=sum(price for _, _, price in items))
+        for product, quantity, price in items:
+            SaleItem.objects.create(sale=sale, product=product, quantity=quantity, price=price)
+        return sale
+
+    def test_refresh_builds_hourly_and_daily_rollups(self):
+        self.create_sale([(self.product, 2, Decimal('11.2')), (self.other_product, 1, Decimal('110.0'))])
+        self.create_sale([(self.product, 1, Decimal('11.2'))])
+        self.assertTrue(DirtySalesBucket.objects.exists())
+
+        refresh_sales_rollups()
+
+        self.assertFalse(DirtySalesBucket.objects.exists())
+        for granularity in (RollupGranularity.HOUR, RollupGranularity.DAY):
+            sales = SalesRollup.objects.get(granularity=granularity)
+            self.assertEqual(sales.transaction_count, 2)
+            self.assertEqual(sales.total_amount, Decimal('132.40'))
+
+            product = ProductSalesRollup.objects.get(granularity=granularity, product=self.product)
+            self.assertEqual(product.category, self.category)
+            self.assertEqual(product.total_quantity, 3)
+            self.assertEqual(product.item_count, 2)
+
+            tax_rate = TaxRateSalesRollup.objects.get(granularity=granularity, tax_rate=Decimal('0.12'))
+            self.assertEqual(tax_rate.total_sales, Decimal('22.40'))
+            self.assertEqual(tax_rate.transaction_count, 2)
+            self.assertAlmostEqual(tax_rate.vat_amount, Decimal('3.6'), places=6)
+
+    def test_marks_are_appended_and_deduplicated_by_the_refresh(self):
+        moment = timezone.now()
+        mark_dirty(moment)
+        mark_dirty(moment)
+        mark_dirty(moment - timedelta(hours=2))
+
+        self.assertEqual(DirtySalesBucket.objects.count(), 3)
+        self.assertEqual(refresh_sales_rollups(), 2)
+        self.assertFalse(DirtySalesBucket.objects.exists())
+
+    def test_deleted_sale_is_removed_from_rollups(self):
+        sale = self.create_sale([(self.product, 2, Decimal('11.2'))])
+        self.create_sale([(self.other_product, 1, Decimal('110.0'))])
+        refresh_sales_rollups()
+
+        sale.delete()
+        refresh_sales_rollups()
+
+        self.assertEqual(SalesRollup.objects.get(granularity=RollupGranularity.DAY).transaction_count, 1)
+        self.assertEqual(
+            list(TaxRateSalesRollup.objects.filter(granularity=RollupGranularity.DAY).values_list('tax_rate', flat=True)),
+            [Decimal('0.10')],
+        )
+
+    def test_statistics_are_read_from_rollups(self):
+        admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        )
+        self.client.force_authenticate(user=admin_user)
+        self.create_sale([(self.product, 2, Decimal('11.2'))])
+        self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+
+        # Rows written behind the ORM's back are only visible after a rebuild.
+        SaleItem.objects.update(quantity=5)
+        response = self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+        self.assertEqual(response.data['top_selling_products'][0]['total_quantity'], 2)
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        response = self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transaction_count'], 1)
+        self.assertEqual(response.data['total_sales'], Decimal('11.20'))
+        self.assertEqual(response.data['top_selling_products'], [{'product__name': 'Test Product', 'total_quantity': 5}])
+        self.assertEqual(
+            response.data['sales_by_category'],
+            [{'product__category__name': 'Test Category', 'total_sales': Decimal('11.20')}],
+        )
+
+
+class CachedStatisticsTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.client = APIClient()
+        self.admin_user = CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.product = Product.objects.create(
+            name="Test Product",
+            price_with_vat=11.2,
+            price_without_vat=10.0,
+            tax_rate=0.12,
+            inventory_count=10,
+            measurement_of_quantity=2,
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_sale(self):
+        sale = Sale.objects.create(cashier=self.admin_user, total_amount=11.2)
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=1, price=11.2)
+
+    def test_statistics_are_cached_until_a_sale_changes(self):
+        self.create_sale()
+        response = self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+        self.assertEqual(response.data['transaction_count'], 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+        self.assertEqual(response.data['transaction_count'], 1)
+
+        self.create_sale()
+        response = self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+        self.assertEqual(response.data['transaction_count'], 2)
+
+    def test_cache_statistics(self):
+        self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+        self.client.get(reverse('sale_statistics', args=['yearly']), format="json")
+
+        response = self.client.get(reverse('cache_statistics'), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['values']['sales-statistics'], {'hits': 1, 'misses': 1})
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "Query plans are not supported on this database.")
+class RollupQueryPlanTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=CustomUser.objects.create_superuser(
+            username="admin", password="adminpassword", role="AD", email="admin@example.com"
+        ))
+        cashier = CustomUser.objects.create_user(
+            username="ca_user", password="capassword", role="CA", email="ca_user@example.com"
+        )
+        product = Product.objects.create(
+            name="Test Product", price_with_vat=11.2, price_without_vat=10.0, tax_rate=0.12,
+            inventory_count=10, measurement_of_quantity=2,
+        )
+        sale = Sale.objects.create(cashier=cashier, total_amount=Decimal('11.2'))
+        SaleItem.objects.create(sale=sale, product=product, quantity=1, price=Decimal('11.2'))
+        refresh_sales_rollups()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_statistics_read_rollups_with_indexes(self):
+        for period in ('daily', 'yearly'):
+            with self.subTest(period=period), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('sale_statistics', args=[period]), format="json")
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    captured_sequential_scans(
+                        queries.captured_queries, [SalesRollup, ProductSalesRollup, TaxRateSalesRollup]
+                    ),
+                    [],
+                )
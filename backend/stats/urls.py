@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import SaleStatisticsView
+from .views import CacheStatisticsView, SaleStatisticsView
 
 urlpatterns = [
+    path('cache/', CacheStatisticsView.as_view(), name='cache_statistics'),
     path('sales/', SaleStatisticsView.as_view(), name='custom_sale_statistics'),
     path('sales/<str:period>/', SaleStatisticsView.as_view(), name='sale_statistics'),
 ]
@@ -1,21 +1,32 @@
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
-from django.db.models import Sum, Count, F, ExpressionWrapper, DecimalField
+from django.db.models import Sum, F
 from django.db.models.functions import TruncHour, TruncDay, TruncWeek, TruncMonth
 from datetime import datetime, timedelta
 from collections import defaultdict
 
-from api.sales.models import Sale, SaleItem
+from api.common.async_views import AsyncAPIViewMixin
+from api.common.cache import acached_value, get_cache_stats
+from api.product_catalog.models import Category, Product
+from api.sales.models import Sale
 from authentication.permissions import IsAdminOrManager
+from stats.models import ProductSalesRollup, RollupGranularity, SalesRollup, TaxRateSalesRollup
+from stats.rollups import refresh_sales_rollups, rollups_between
 
 
-class SaleStatisticsView(APIView):
+class SaleStatisticsView(AsyncAPIViewMixin, APIView):
+    """
+    Async API view returning the sales statistics of a period or a custom date range.
+
+    The statistics are read from the sales rollups with the async ORM and cached.
+    """
     permission_classes = [IsAuthenticated, IsAdminOrManager]
 
     @staticmethod
-    def get_interval_data(period, start_date, end_date):
+    async def aget_interval_data(period, start_date, end_date):
         if period == 'daily':
             trunc_func = TruncHour
             interval_format = '%Y-%m-%d %H:00'
@@ -35,24 +46,24 @@ class SaleStatisticsView(APIView):
         else:
             raise ValueError("Invalid period specified")
 
-        all_data = SaleItem.objects.filter(
-            sale__date_created__gte=start_date,
-            sale__date_created__lte=end_date
-        ).annotate(
-            interval=trunc_func('sale__date_created')
-        ).values('interval', 'product__tax_rate').annotate(
-            total_sales=Sum('price'),
-            total_quantity=Sum('quantity'),
-            transaction_count=Count('sale', distinct=True),
-            vat_amount=Sum(ExpressionWrapper(
-                F('price') * F('quantity') * F('product__tax_rate') / (1 + F('product__tax_rate')),
-                output_field=DecimalField()
-            ))
-        ).order_by('interval', 'product__tax_rate')
+        if period in ('daily', 'weekly'):
+            interval = F('bucket_start')
+        else:
+            interval = trunc_func('bucket_start')
+        granularity = RollupGranularity.HOUR if period == 'daily' else RollupGranularity.DAY
+
+        all_data = rollups_between(TaxRateSalesRollup, start_date, end_date, granularity).annotate(
+            interval=interval
+        ).values('interval', 'tax_rate').annotate(
+            total_sales=Sum('total_sales'),
+            total_quantity=Sum('total_quantity'),
+            transaction_count=Sum('transaction_count'),
+            vat_amount=Sum('vat_amount')
+        ).order_by('interval', 'tax_rate')
 
         grouped_data = defaultdict(list)
-        for item in all_data:
-            interval_start = item['interval']
+        async for item in all_data:
+            interval_start = timezone.localtime(item['interval'])
             if period == 'yearly':
                 interval_end = (interval_start + delta).replace(day=1) - timedelta(days=1)
             else:
@@ -61,7 +72,7 @@ class SaleStatisticsView(APIView):
             interval_range = f"{interval_start.strftime(interval_format)} - {interval_end.strftime(interval_format)}"
 
             grouped_data[interval_range].append({
-                'product__tax_rate': item['product__tax_rate'],
+                'product__tax_rate': item['tax_rate'],
                 'total_sales': item['total_sales'],
                 'total_quantity': item['total_quantity'],
                 'transaction_count': item['transaction_count'],
@@ -81,8 +92,28 @@ class SaleStatisticsView(APIView):
         return table_interval_data
 
     @staticmethod
-    def get(request, period=None):
-        now = timezone.now()
+    async def aget_totals(start_date, end_date):
+        """
+        Return the total sales, the number of transactions and the VAT amount between two dates.
+
+        Args:
+            start_date (datetime): The start of the range.
+            end_date (datetime): The end of the range.
+
+        Returns:
+            tuple: The total sales, the transaction count and the total VAT amount.
+        """
+        sales = await rollups_between(SalesRollup, start_date, end_date).aaggregate(
+            total=Sum('total_amount'), count=Sum('transaction_count')
+        )
+        vat = await rollups_between(TaxRateSalesRollup, start_date, end_date).aaggregate(
+            total_vat=Sum('vat_amount')
+        )
+        return sales['total'] or 0, sales['count'] or 0, vat['total_vat'] or 0
+
+    @staticmethod
+    async def get(request, period=None):
+        now = timezone.localtime()
         end_date = now
 
         if period:
@@ -100,9 +131,9 @@ class SaleStatisticsView(APIView):
             elif period == 'monthly':
                 start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
                 next_month = start_date + timedelta(days=32)
-                end_date = next_month.replace(day=1) - timedelta(seconds=1)
+                end_date = next_month.replace(day=1) - timedelta(microseconds=1)
                 prev_start_date = (start_date - timedelta(days=1)).replace(day=1)
-                prev_end_date = start_date - timedelta(seconds=1)
+                prev_end_date = start_date - timedelta(microseconds=1)
             elif period == 'yearly':
                 start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
                 end_date = start_date.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
@@ -130,55 +161,82 @@ class SaleStatisticsView(APIView):
             prev_start_date = start_date - (end_date - start_date)
             prev_end_date = start_date
 
-        sales = Sale.objects.filter(date_created__gte=start_date, date_created__lte=end_date)
-        prev_sales = Sale.objects.filter(date_created__gte=prev_start_date, date_created__lte=prev_end_date)
+        data = await acached_value(
+            'sales-statistics',
+            lambda: SaleStatisticsView.aget_statistics(period, start_date, end_date, prev_start_date, prev_end_date),
+            models=[Sale, Product, Category],
+            key_parts=[period, start_date.isoformat(), end_date.isoformat(),
+                       prev_start_date.isoformat(), prev_end_date.isoformat()],
+        )
+        return Response(data)
+
+    @staticmethod
+    async def aget_statistics(period, start_date, end_date, prev_start_date, prev_end_date):
+        """
+        Compute the statistics of a range and its comparison range.
 
-        total_sales = sales.aggregate(total=Sum('total_amount'))['total'] or 0
-        prev_total_sales = prev_sales.aggregate(total=Sum('total_amount'))['total'] or 0
+        Args:
+            period (str): The period, or None for a custom range.
+            start_date (datetime): The start of the range.
+            end_date (datetime): The end of the range.
+            prev_start_date (datetime): The start of the comparison range.
+            prev_end_date (datetime): The end of the comparison range.
 
-        transaction_count = sales.count()
-        prev_transaction_count = prev_sales.count()
+        Returns:
+            dict: The statistics.
+        """
+        await sync_to_async(refresh_sales_rollups)()
 
-        vat_expression = ExpressionWrapper(
-            F('price') * F('quantity') * F('product__tax_rate') / (1 + F('product__tax_rate')),
-            output_field=DecimalField()
+        total_sales, transaction_count, total_vat_amount = await SaleStatisticsView.aget_totals(start_date, end_date)
+        prev_total_sales, prev_transaction_count, prev_total_vat_amount = await SaleStatisticsView.aget_totals(
+            prev_start_date, prev_end_date
         )
-
-        total_vat_amount = SaleItem.objects.filter(sale__in=sales).aggregate(total_vat=Sum(vat_expression))[
-                               'total_vat'] or 0
         total_sales_without_vat = total_sales - total_vat_amount
-        prev_total_vat_amount = SaleItem.objects.filter(sale__in=prev_sales).aggregate(total_vat=Sum(vat_expression))[
-                                    'total_vat'] or 0
         prev_total_sales_without_vat = prev_total_sales - prev_total_vat_amount
 
         average_transaction_value = total_sales / transaction_count if transaction_count > 0 else 0
         prev_average_transaction_value = prev_total_sales / prev_transaction_count if prev_transaction_count > 0 else 0
 
-        top_selling_products = SaleItem.objects.filter(sale__in=sales) \
-                                   .values('product__name') \
-                                   .annotate(total_quantity=Sum('quantity')) \
-                                   .order_by('-total_quantity')[:5]
+        product_rollups = rollups_between(ProductSalesRollup, start_date, end_date)
 
-        sales_by_category = SaleItem.objects.filter(sale__in=sales) \
-            .values('product__category__name') \
-            .annotate(total_sales=Sum('price')) \
+        top_selling_products = [
+            row async for row in product_rollups
+            .values('product__name')
+            .annotate(total_quantity=Sum('total_quantity'))
+            .order_by('-total_quantity')[:5]
+        ]
+
+        sales_by_category = [
+            {'product__category__name': row['category__name'], 'total_sales': row['total_sales']}
+            async for row in product_rollups
+            .values('category__name')
+            .annotate(total_sales=Sum('total_sales'))
             .order_by('-total_sales')
+        ]
 
-        sales_by_tax_rate = SaleItem.objects.filter(sale__in=sales) \
-            .values('product__tax_rate') \
+        sales_by_tax_rate = [
+            {
+                'product__tax_rate': row['tax_rate'],
+                'total_sales': row['total_sales'],
+                'total_quantity': row['total_quantity'],
+                'transaction_count': row['transaction_count'],
+            }
+            async for row in rollups_between(TaxRateSalesRollup, start_date, end_date)
+            .values('tax_rate')
             .annotate(
-            total_sales=Sum('price'),
-            total_quantity=Sum('quantity'),
-            transaction_count=Count('sale'),
-        ).order_by('product__tax_rate')
+                total_sales=Sum('total_sales'),
+                total_quantity=Sum('total_quantity'),
+                transaction_count=Sum('item_count'),
+            ).order_by('tax_rate')
+        ]
 
         if period:
-            interval_data = SaleStatisticsView.get_interval_data(period, start_date, end_date)
+            interval_data = await SaleStatisticsView.aget_interval_data(period, start_date, end_date)
         else:
             # For custom date ranges, use daily intervals
-            interval_data = SaleStatisticsView.get_interval_data('daily', start_date, end_date)
+            interval_data = await SaleStatisticsView.aget_interval_data('daily', start_date, end_date)
 
-        return Response({
+        return {
             "period": period or "custom",
             "start_date": start_date.strftime('%Y-%m-%d'),
             "end_date": end_date.strftime('%Y-%m-%d'),
@@ -192,8 +250,22 @@ class SaleStatisticsView(APIView):
             "prev_total_sales_without_vat": prev_total_sales_without_vat,
             "prev_transaction_count": prev_transaction_count,
             "prev_average_transaction_value": prev_average_transaction_value,
-            "top_selling_products": list(top_selling_products),
-            "sales_by_category": list(sales_by_category),
-            "sales_by_tax_rate": list(sales_by_tax_rate),
+            "top_selling_products": top_selling_products,
+            "sales_by_category": sales_by_category,
+            "sales_by_tax_rate": sales_by_tax_rate,
             "interval_data": interval_data,
-        })
+        }
+
+
+class CacheStatisticsView(APIView):
+    """
+    API view returning the hit and miss counters of the cache-aside helpers.
+
+    The counters are kept per worker process, so they describe the process that
+    answered the request.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrManager]
+
+    @staticmethod
+    def get(request):
+        return Response(get_cache_stats())
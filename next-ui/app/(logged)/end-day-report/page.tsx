@@ -17,7 +17,10 @@ import {
 } from "antd";
 import { useSession } from "next-auth/react";
 import { ApiTypes, CustomSession } from "@/app/types/api";
-import { fetchDailySummaries } from "@/app/api/daily-summary/fetchDailySummaries";
+import {
+  fetchDailySummaries,
+  nextCursor,
+} from "@/app/api/daily-summary/fetchDailySummaries";
 import { fetchEuroRate } from "@/app/api/settings/fetchEuroRate";
 import { calculateDailySummary } from "@/app/api/daily-summary/calculateDailySummary";
 import { createWithdrawal } from "@/app/api/withdrawal/createWithdrawal";
@@ -35,6 +38,7 @@ const DailySummary = () => {
   const [withdrawalForm] = Form.useForm();
   const [summaries, setSummaries] = useState<ApiTypes.DailySummary[]>([]);
   const [loading, setLoading] = useState(false);
+  const [cursor, setCursor] = useState<string | null>(null);
   const [euroRate, setEuroRate] = useState<number>(25);
   const [showEuro, setShowEuro] = useState(false);
   const [isWithdrawalModalVisible, setIsWithdrawalModalVisible] =
@@ -45,7 +49,8 @@ const DailySummary = () => {
     setLoading(true);
     try {
       const data = await fetchDailySummaries(session.access);
-      setSummaries(data);
+      setSummaries(data.results);
+      setCursor(nextCursor(data.next));
     } catch (error) {
       console.error("Nepodařilo se načíst denní souhrny", error);
       message.error("Nepodařilo se načíst denní souhrny");
@@ -54,6 +59,21 @@ const DailySummary = () => {
     }
   }, [session?.access]);
 
+  const fetchMoreSummaries = async () => {
+    if (!session?.access || !cursor) return;
+    setLoading(true);
+    try {
+      const data = await fetchDailySummaries(session.access, cursor);
+      setSummaries((previous) => [...previous, ...data.results]);
+      setCursor(nextCursor(data.next));
+    } catch (error) {
+      console.error("Nepodařilo se načíst další denní souhrny", error);
+      message.error("Nepodařilo se načíst další denní souhrny");
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const fetchRate = useCallback(async () => {
     if (!session?.access) return;
     try {
@@ -201,8 +221,17 @@ const DailySummary = () => {
             columns={columns}
             dataSource={summaries}
             loading={loading}
-            rowKey="date"
+            rowKey="id"
           />
+          {cursor && (
+            <Button
+              style={{ marginTop: "16px" }}
+              onClick={fetchMoreSummaries}
+              loading={loading}
+            >
+              Načíst další
+            </Button>
+          )}
         </>
       )}
 
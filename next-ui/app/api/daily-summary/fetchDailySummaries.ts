@@ -2,15 +2,32 @@ import api from "@/api";
 import { ApiTypes } from "@/app/types/api";
 import DailySummary = ApiTypes.DailySummary;
 
+export interface FetchDailySummariesResponse {
+  next: string | null;
+  previous: string | null;
+  results: DailySummary[];
+}
+
+export const nextCursor = (next: string | null): string | null => {
+  if (!next) return null;
+  return new URL(next, "http://localhost").searchParams.get("cursor");
+};
+
 export const fetchDailySummaries = async (
   access: string,
-): Promise<DailySummary[]> => {
-  const response = await api.get<DailySummary[]>(
+  cursor: string | null = null,
+  pageSize: number = 100,
+): Promise<FetchDailySummariesResponse> => {
+  const response = await api.get<FetchDailySummariesResponse>(
     "/api/daily_closure/summaries/",
     {
       headers: {
         Authorization: `Bearer ${access}`,
       },
+      params: {
+        page_size: pageSize,
+        ...(cursor ? { cursor } : {}),
+      },
     },
   );
   return response.data;
@@ -239,6 +239,7 @@ export namespace ApiTypes {
   };
 
   export interface DailySummary {
+    id: number;
     date: string;
     total_sales: number;
     total_cash: number;